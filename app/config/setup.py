@@ -1,7 +1,9 @@
 import os
+import tempfile
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base
 from dotenv import load_dotenv
+from app.db.pool import POOL_PROFILES, enable_foreign_keys, get_engine_options
 
 load_dotenv()  # Loads environment variables from .env
 
@@ -11,15 +13,131 @@ JWT_SECRET = os.getenv("JWT_SECRET")
 # Fetches the JWT_SECRET from the env variable
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
 ALGORITHM = os.getenv("ALGORITHM")
+# How long an authenticated user is served from memory before it is reloaded
+PRINCIPAL_CACHE_TTL_SECONDS = int(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+PRINCIPAL_CACHE_MAX_SIZE = int(os.getenv("PRINCIPAL_CACHE_MAX_SIZE", "10000"))
+# Decoded tokens are kept until their exp claim, bounded by this many entries
+TOKEN_CACHE_MAX_SIZE = int(os.getenv("TOKEN_CACHE_MAX_SIZE", "10000"))
+# bcrypt threads (one core less than the machine by default, leaving one for the
+# event loop); past max pending, logins are turned away with a 503
+PASSWORD_HASH_WORKERS = int(
+    os.getenv("PASSWORD_HASH_WORKERS", max((os.cpu_count() or 2) - 1, 1))
+)
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+# Public read responses are cached in memory, or in a Redis-compatible server when
+# set to redis://host:port/db; RESPONSE_CACHE_TTLS overrides per route (name=seconds,...)
+RESPONSE_CACHE_URL = os.getenv("RESPONSE_CACHE_URL", "memory://")
+RESPONSE_CACHE_MAX_SIZE = int(os.getenv("RESPONSE_CACHE_MAX_SIZE", "10000"))
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "30"))
+RESPONSE_CACHE_TTLS = os.getenv("RESPONSE_CACHE_TTLS", "")
+# Makes relationship lazy loads raise instead of quietly issuing SQL (dev and tests)
+ORM_RAISE_ON_LAZY_LOAD = os.getenv("ORM_RAISE_ON_LAZY_LOAD", "").lower() in ("1", "true")
+# Statements slower than this are logged with their parameter types, -1 turns it off
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "200"))
+
+# Read replicas for safe GET routes, comma separated; reads fall back to the primary
+# when none is healthy, and a client's reads stay on the primary for a few seconds
+# after it writes
+DATABASE_REPLICA_URLS = [
+    url.strip()
+    for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",")
+    if url.strip()
+]
+REPLICA_HEALTH_CHECK_SECONDS = float(os.getenv("REPLICA_HEALTH_CHECK_SECONDS", "5"))
+REPLICA_HEALTH_CHECK_TIMEOUT_SECONDS = float(
+    os.getenv("REPLICA_HEALTH_CHECK_TIMEOUT_SECONDS", "1")
+)
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+
+# Health probes read a database status refreshed this often in the background,
+# each check giving up after the timeout. /readyz fails while migrations are not
+# at this build's head (when checked) or the pool is at least this busy.
+HEALTH_CHECK_INTERVAL_SECONDS = float(os.getenv("HEALTH_CHECK_INTERVAL_SECONDS", "5"))
+HEALTH_CHECK_TIMEOUT_SECONDS = float(os.getenv("HEALTH_CHECK_TIMEOUT_SECONDS", "2"))
+READINESS_CHECK_MIGRATIONS = os.getenv("READINESS_CHECK_MIGRATIONS", "1").lower() in (
+    "1",
+    "true",
+)
+READINESS_MAX_POOL_UTILIZATION = float(
+    os.getenv("READINESS_MAX_POOL_UTILIZATION", "1")
+)
+
+# Per client token buckets (user id when authenticated, else IP): the default
+# budget as tokens per second and burst, RATE_LIMITS sets route budgets as
+# name=rate/burst pairs (login, playlist-musics); a rate of 0 turns a limit off
+RATE_LIMIT_PER_SECOND = float(os.getenv("RATE_LIMIT_PER_SECOND", "20"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "40"))
+RATE_LIMITS = os.getenv("RATE_LIMITS", "login=0.2/5,playlist-musics=5/20")
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "100000"))
+
+# Background jobs (202 responses, GET /jobs/{id}): worker tasks per process (0 leaves
+# the queue to other processes), attempts before a job fails, the first retry
+# delay (doubled on each attempt), how long a worker owns a job between progress
+# reports, and how often idle workers look for jobs queued elsewhere. Request
+# bodies wait in JOB_SPOOL_DIR, which every process running jobs must share.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_DELAY_SECONDS = float(os.getenv("JOB_RETRY_DELAY_SECONDS", "5"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+JOB_SPOOL_DIR = os.getenv(
+    "JOB_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "music-api-jobs")
+)
 
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL is not set. Check your .env file.")
 
+# Connection pool profile (default, api or migration), each setting can be overridden
+DB_POOL_PROFILE = os.getenv("DB_POOL_PROFILE", "default")
+if DB_POOL_PROFILE not in POOL_PROFILES:
+    raise ValueError(f"Unknown DB_POOL_PROFILE {DB_POOL_PROFILE!r}")
+_profile = POOL_PROFILES[DB_POOL_PROFILE]
+DB_POOL_SETTINGS = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", _profile["pool_size"])),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", _profile["max_overflow"])),
+    "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", _profile["pool_timeout"])),
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", _profile["pool_recycle"])),
+    "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", str(_profile["pool_pre_ping"]))
+    .lower()
+    in ("1", "true"),
+    # asyncpg prepared statement caches, set to 0 behind pgbouncer in transaction mode
+    "statement_cache_size": (
+        int(os.getenv("DB_STATEMENT_CACHE_SIZE"))
+        if os.getenv("DB_STATEMENT_CACHE_SIZE")
+        else None
+    ),
+}
+
+# Requests running at once (default: every pooled connection, overflow included)
+# and how many more may wait, and for how long, before getting a 503; 0 turns
+# admission control off
+ADMISSION_MAX_CONCURRENT = int(
+    os.getenv(
+        "ADMISSION_MAX_CONCURRENT",
+        DB_POOL_SETTINGS["pool_size"] + DB_POOL_SETTINGS["max_overflow"],
+    )
+)
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", ADMISSION_MAX_CONCURRENT))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(
+    os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "1")
+)
+
 
 # Creates the connection to PostgreSQL.
-engine = create_async_engine(DATABASE_URL)
+engine = enable_foreign_keys(
+    create_async_engine(
+        DATABASE_URL, **get_engine_options(DATABASE_URL, DB_POOL_SETTINGS)
+    )
+)
 AsyncSessionLocal = async_sessionmaker(
     bind=engine, class_=AsyncSession, expire_on_commit=False
 )
+# Same pool settings as the primary, each replica gets its own pool
+replica_engines = [
+    enable_foreign_keys(
+        create_async_engine(url, **get_engine_options(url, DB_POOL_SETTINGS))
+    )
+    for url in DATABASE_REPLICA_URLS
+]
 
 Base = declarative_base()  # The base class for defining models.
@@ -1,9 +1,81 @@
-from app.config.setup import AsyncSessionLocal
+from fastapi import Request
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+from app.config.setup import (
+    READ_YOUR_WRITES_SECONDS,
+    REPLICA_HEALTH_CHECK_SECONDS,
+    REPLICA_HEALTH_CHECK_TIMEOUT_SECONDS,
+    AsyncSessionLocal,
+    engine,
+    replica_engines,
+)
+from app.db.replicas import ReplicaSet
 
+replica_set = ReplicaSet(
+    primary=engine,
+    replicas=replica_engines,
+    check_interval=REPLICA_HEALTH_CHECK_SECONDS,
+    check_timeout=REPLICA_HEALTH_CHECK_TIMEOUT_SECONDS,
+    sticky_seconds=READ_YOUR_WRITES_SECONDS,
+)
 
-async def get_async_db():
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+async def get_async_db(request: Request):
     db = AsyncSessionLocal()
     try:
         yield db
     finally:
         await db.close()
+        # Anything but a safe method on the primary session is treated as a write
+        if request.method not in SAFE_METHODS:
+            replica_set.wrote(request.headers.get("authorization"))
+
+
+# * True while the client's reads stay on the primary after a write, shared
+# * caches filled from replicas must not answer them either
+def reads_own_writes(request: Request) -> bool:
+    return replica_set.is_sticky(request.headers.get("authorization"))
+
+
+# * Session for safe reads that tolerate replica lag, see ReplicaSet. Only for GET
+# * routes whose response may be a few seconds behind the primary.
+async def get_async_read_db(request: Request):
+    bind = replica_set.engine_for(request.headers.get("authorization"))
+    # Responses read from a replica may predate the last write, see cache_response
+    request.state.read_from_replica = bind is not replica_set.primary
+    db = AsyncSessionLocal(bind=bind)
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
+# * The model columns behind a response schema's fields, selected as plain rows
+# * these serialize straight to JSON without building ORM objects or models
+def schema_columns(model, schema) -> list:
+    return [getattr(model, name) for name in schema.model_fields]
+
+
+# * Dialect specific insert(), needed for ON CONFLICT clauses
+def get_dialect_insert(db: AsyncSession):
+    if db.bind.dialect.name == "postgresql":
+        return postgresql.insert
+    return sqlite.insert
+
+
+# * Rows inserted with explicit ids leave Postgres SERIAL sequences behind, and the
+# * next insert through the API would collide; moves each past its table's max id
+async def sync_id_sequences(connection: AsyncConnection, *models):
+    if connection.dialect.name != "postgresql":
+        return
+    for model in models:
+        table = model.__table__.name
+        await connection.execute(
+            text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"(SELECT coalesce(max(id), 0) + 1 FROM {table}), false)"
+            )
+        )
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import time
+from pathlib import Path
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = Path(__file__).resolve().parents[2] / "migrations"
+
+
+# * Alembic head revisions of the migrations shipped with this build
+def get_migration_heads(directory: Path = MIGRATIONS_DIR) -> set[str] | None:
+    if not directory.is_dir():
+        return None
+    from alembic.script import ScriptDirectory
+
+    return set(ScriptDirectory(str(directory)).get_heads())
+
+
+class DatabaseHealth:
+    """Database status for the health probes, refreshed in the background.
+
+    Probes read the last result instead of querying. run() refreshes it every
+    `interval` seconds; without it (tests, scripts) a probe that finds it older
+    than twice the interval refreshes it once, shared by concurrent probes.
+    Every check gives up after `timeout` seconds.
+    """
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        interval: float = 5,
+        timeout: float = 2,
+        migration_heads: set[str] | None = None,
+    ):
+        self.engine = engine
+        self.interval = interval
+        self.timeout = timeout
+        self.migration_heads = migration_heads
+        self.status: dict | None = None
+        self.checked_at = 0.0
+        self._refresh: asyncio.Task | None = None
+
+    async def _query(self) -> list[str] | None:
+        async with self.engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+            if self.migration_heads is None:
+                return None
+            try:
+                result = await connection.execute(
+                    text("SELECT version_num FROM alembic_version")
+                )
+                return sorted(result.scalars().all())
+            except SQLAlchemyError:
+                return []  # never migrated, e.g. created with create_all
+
+    async def check(self) -> dict:
+        start = time.perf_counter()
+        status = {"ok": False, "latency_ms": None, "error": None}
+        try:
+            revisions = await asyncio.wait_for(self._query(), self.timeout)
+            status["ok"] = True
+            status["latency_ms"] = round((time.perf_counter() - start) * 1000, 3)
+            if self.migration_heads is not None:
+                status["migrations"] = {
+                    "current": revisions,
+                    "head": sorted(self.migration_heads),
+                    "up_to_date": set(revisions) == self.migration_heads,
+                }
+        except asyncio.TimeoutError:
+            status["error"] = f"timed out after {self.timeout:g}s"
+        except Exception as error:
+            status["error"] = str(error).splitlines()[0]
+        if not status["ok"] and (self.status is None or self.status["ok"]):
+            logger.warning("Database health check failed: %s", status["error"])
+
+        self.status = status
+        self.checked_at = time.monotonic()
+        return status
+
+    async def current(self) -> dict:
+        if self.status is not None and self.age() < 2 * self.interval:
+            return self.status
+        if self._refresh is None or self._refresh.done():
+            self._refresh = asyncio.create_task(self.check())
+        return await asyncio.shield(self._refresh)
+
+    def age(self) -> float:
+        return time.monotonic() - self.checked_at
+
+    async def run(self):
+        while True:
+            await self.check()
+            await asyncio.sleep(self.interval)
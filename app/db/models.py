@@ -1,14 +1,30 @@
+from datetime import datetime, timezone
 from sqlalchemy import (
+    DDL,
+    BigInteger,
+    JSON,
     Column,
+    DateTime,
     Integer,
     String,
     ForeignKey,
     Boolean,
+    Index,
     Table,
     UniqueConstraint,
+    event,
+    func,
+    literal_column,
+    text,
 )
+from sqlalchemy.dialects import postgresql  # noqa: F401 registers to_tsvector types
 from sqlalchemy.orm import relationship
-from app.config.setup import Base
+from app.config.setup import Base, ORM_RAISE_ON_LAZY_LOAD
+
+# Relationships are loaded explicitly (selectinload, joins) by the services. With
+# ORM_RAISE_ON_LAZY_LOAD an accidental attribute access raises instead of
+# silently fanning out into one query per row.
+LAZY = "raise_on_sql" if ORM_RAISE_ON_LAZY_LOAD else "select"
 
 # Many-to-Many Relationship Table between Playlist and Music
 playlist_music_association = Table(
@@ -26,59 +42,225 @@ playlist_music_association = Table(
         ForeignKey("musics.id", ondelete="CASCADE"),
         primary_key=True,
     ),
+    # Sort key within the playlist. Tracks are spread POSITION_GAP apart, so a track
+    # is inserted or moved by taking the midpoint of its new neighbours; the
+    # playlist is renumbered only once a gap runs out. Rows added through the ORM
+    # relationship land at 0, the services always set it.
+    Column("position", BigInteger, nullable=False, server_default="0"),
+    Index("ix_playlist_music_position", "playlist_id", "position", unique=True),
+    # The reverse of the primary key: playlists holding a track, and the
+    # ON DELETE CASCADE from musics
+    Index("ix_playlist_music_music_id", "music_id", "playlist_id"),
 )
 
+POSITION_GAP = 1 << 16
+
+
+# * Naive UTC, what the DateTime columns hold whatever the server's time zone
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+# * to_tsvector over title and artist, constants inlined so the index can match
+def music_search_document(title, artist):
+    empty = literal_column("''")
+    return func.to_tsvector(
+        literal_column("'simple'"),
+        func.coalesce(title, empty)
+        .op("||")(literal_column("' '"))
+        .op("||")(func.coalesce(artist, empty)),
+    )
+
 
 class User(Base):
     __tablename__ = "users"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     username = Column(String, unique=True, index=True)
     email = Column(String, unique=True, index=True)
     password = Column(String)
+    # Bumped on every change, used to build ETags for conditional GETs
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    # Kept in step by the services in the same transaction as the change,
+    # app/scripts/rebuild_counters.py recomputes them
+    added_musics_count = Column(Integer, nullable=False, default=0, server_default="0")
+    playlists_count = Column(Integer, nullable=False, default=0, server_default="0")
 
-    # Songs added by the user
+    # Songs added by the user. Deleting the user leaves them (and their playlist
+    # rows) to ON DELETE CASCADE instead of loading them into the session.
     added_musics = relationship(
-        "Music", back_populates="added_by_user", cascade="all, delete"
+        "Music",
+        back_populates="added_by_user",
+        cascade="all, delete",
+        passive_deletes=True,
+        lazy=LAZY,
     )
 
-    # Playlists the user owns
-    playlists = relationship("Playlist", back_populates="owner", cascade="all, delete")
+    # Playlists the user owns, removed by the database the same way
+    playlists = relationship(
+        "Playlist",
+        back_populates="owner",
+        cascade="all, delete",
+        passive_deletes=True,
+        lazy=LAZY,
+    )
 
 
 class Music(Base):
     __tablename__ = "musics"
 
-    id = Column(Integer, primary_key=True, index=True)
-    title = Column(String, index=True)
+    id = Column(Integer, primary_key=True)
+    title = Column(String)  # _title_artist_uc leads with it
     artist = Column(String, index=True)
     link = Column(String)
     added_by = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
+    # Bumped on every change, used to build ETags for conditional GETs
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
-    __table_args__ = (UniqueConstraint("title", "artist", name="_title_artist_uc"),)
+    __table_args__ = (
+        UniqueConstraint("title", "artist", name="_title_artist_uc"),
+        # A user's uploads, in id order (/music/from-user)
+        Index("ix_musics_added_by", "added_by", "id"),
+        # Postgres search indexes: tsvector for words and prefixes, trigrams for typos
+        Index(
+            "ix_musics_search_vector",
+            music_search_document(title, artist),
+            postgresql_using="gin",
+        ).ddl_if(dialect="postgresql"),
+        Index(
+            "ix_musics_title_trgm",
+            title,
+            postgresql_using="gin",
+            postgresql_ops={"title": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+        Index(
+            "ix_musics_artist_trgm",
+            artist,
+            postgresql_using="gin",
+            postgresql_ops={"artist": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+    )
 
     # User who added the song
-    added_by_user = relationship("User", back_populates="added_musics")
+    added_by_user = relationship("User", back_populates="added_musics", lazy=LAZY)
 
     # Playlists this song belongs to
     # secondary means it's a many to many relation that is using another table for relation
     playlists = relationship(
-        "Playlist", secondary=playlist_music_association, back_populates="musics"
+        "Playlist",
+        secondary=playlist_music_association,
+        back_populates="musics",
+        passive_deletes=True,
+        lazy=LAZY,
     )
 
 
+# Full-text document for a track on Postgres. Queries must use this exact
+# expression for the planner to pick the GIN index built on it.
+music_search_vector = music_search_document(Music.title, Music.artist)
+
+event.listen(
+    Base.metadata,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+
+# SQLite (local and test runs) searches through an FTS5 shadow table that
+# triggers keep in sync with musics
+MUSIC_FTS_SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS musics_fts USING fts5(
+        title, artist, content='musics', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS musics_fts_ai AFTER INSERT ON musics BEGIN
+        INSERT INTO musics_fts(rowid, title, artist)
+        VALUES (new.id, new.title, new.artist);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS musics_fts_ad AFTER DELETE ON musics BEGIN
+        INSERT INTO musics_fts(musics_fts, rowid, title, artist)
+        VALUES ('delete', old.id, old.title, old.artist);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS musics_fts_au AFTER UPDATE ON musics BEGIN
+        INSERT INTO musics_fts(musics_fts, rowid, title, artist)
+        VALUES ('delete', old.id, old.title, old.artist);
+        INSERT INTO musics_fts(rowid, title, artist)
+        VALUES (new.id, new.title, new.artist);
+    END""",
+]
+for statement in MUSIC_FTS_SQLITE_DDL:
+    event.listen(
+        Music.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite")
+    )
+event.listen(
+    Music.__table__,
+    "before_drop",
+    DDL("DROP TABLE IF EXISTS musics_fts").execute_if(dialect="sqlite"),
+)
+
+
 class Playlist(Base):
     __tablename__ = "playlists"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     name = Column(String, index=True)
     private = Column(Boolean)
     owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
+    # Bumped when the playlist or any of its tracks change, used to build ETags
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    # Rows in playlist_music, moved together with version by the services
+    track_count = Column(Integer, nullable=False, default=0, server_default="0")
+
+    __table_args__ = (
+        # A user's playlists, all of them for the owner or only the public ones
+        Index("ix_playlists_owner_id_private", "owner_id", "private"),
+        # Everyone else only ever lists public playlists, Postgres keeps just those
+        Index(
+            "ix_playlists_public_owner_id",
+            "owner_id",
+            "id",
+            postgresql_where=text("private = false"),
+        ).ddl_if(dialect="postgresql"),
+    )
 
     # The user who owns the playlist
-    owner = relationship("User", back_populates="playlists")
+    owner = relationship("User", back_populates="playlists", lazy=LAZY)
 
     # Songs that are in this playlist
     musics = relationship(
-        "Music", secondary=playlist_music_association, back_populates="playlists"
+        "Music",
+        secondary=playlist_music_association,
+        back_populates="playlists",
+        passive_deletes=True,
+        lazy=LAZY,
+    )
+
+
+class Job(Base):
+    """Background work queued by a request, see app/services/jobs.py."""
+
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    # queued, running, succeeded or failed
+    status = Column(String, nullable=False, default="queued", server_default="queued")
+    requested_by = Column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False
+    )
+    payload = Column(JSON, nullable=False)
+    result = Column(JSON)
+    error = Column(String)
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    # Units of work done so far and in total (lines, rows), total when known
+    progress = Column(Integer, nullable=False, default=0, server_default="0")
+    total = Column(Integer)
+    created_at = Column(DateTime, nullable=False, default=utcnow)
+    # Queued jobs wait for it (retry backoff), running ones own the job until then
+    run_after = Column(DateTime, nullable=False, default=utcnow)
+    finished_at = Column(DateTime)
+
+    __table_args__ = (
+        # Workers claim the oldest job that is due
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+        Index("ix_jobs_requested_by", "requested_by"),
     )
@@ -0,0 +1,138 @@
+import time
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# Named pool settings, picked with DB_POOL_PROFILE. "api" is sized for app pods
+# serving concurrent requests, "migration" for one-off jobs and CLI scripts.
+POOL_PROFILES = {
+    "default": {
+        "pool_size": 5,
+        "max_overflow": 10,
+        "pool_timeout": 30,
+        "pool_recycle": -1,
+        "pool_pre_ping": False,
+    },
+    "api": {
+        "pool_size": 20,
+        "max_overflow": 10,
+        "pool_timeout": 5,
+        "pool_recycle": 1800,
+        "pool_pre_ping": True,
+    },
+    "migration": {
+        "pool_size": 1,
+        "max_overflow": 0,
+        "pool_timeout": 60,
+        "pool_recycle": -1,
+        "pool_pre_ping": True,
+    },
+}
+
+
+class PoolMetrics:
+    """Counters for how long requests waited to check out a connection."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def observe_wait(self, seconds: float):
+        self.checkouts += 1
+        self.wait_seconds_total += seconds
+        self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+    def snapshot(self) -> dict:
+        return {
+            "checkouts": self.checkouts,
+            "checkout_timeouts": self.timeouts,
+            "checkout_wait_ms_total": round(self.wait_seconds_total * 1000, 3),
+            "checkout_wait_ms_max": round(self.wait_seconds_max * 1000, 3),
+        }
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that times every checkout, including timeouts."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.timeouts += 1
+            raise
+        finally:
+            self.metrics.observe_wait(time.perf_counter() - start)
+
+
+# * Builds create_async_engine kwargs for a URL from the pool settings
+def get_engine_options(database_url: str, settings: dict) -> dict:
+    url = make_url(database_url)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        # In-memory SQLite lives inside one connection, so it keeps its static pool
+        return {}
+
+    options = {
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": settings["pool_size"],
+        "max_overflow": settings["max_overflow"],
+        "pool_timeout": settings["pool_timeout"],
+        "pool_recycle": settings["pool_recycle"],
+        "pool_pre_ping": settings["pool_pre_ping"],
+    }
+    cache_size = settings.get("statement_cache_size")
+    if url.get_driver_name() == "asyncpg" and cache_size is not None:
+        options["connect_args"] = {
+            "statement_cache_size": cache_size,
+            "prepared_statement_cache_size": cache_size,
+        }
+    return options
+
+
+# * SQLite leaves foreign keys off per connection, so ON DELETE CASCADE only
+# * happens once every new connection turns them on
+def enable_foreign_keys(engine: AsyncEngine) -> AsyncEngine:
+    if engine.dialect.name != "sqlite":
+        return engine
+
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+    event.listen(engine.sync_engine, "connect", on_connect)
+    return engine
+
+
+# * Live view of an engine's pool, for sizing pods against max_connections
+def get_pool_status(engine: AsyncEngine) -> dict:
+    pool = engine.pool
+    status = {"pool_class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update(
+            {
+                "pool_size": pool.size(),
+                "max_overflow": pool._max_overflow,
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": max(pool.overflow(), 0),
+            }
+        )
+    if isinstance(pool, InstrumentedQueuePool):
+        status.update(pool.metrics.snapshot())
+    return status
+
+
+# * Share of the pool's connections in use, None for pools without a fixed size
+def get_pool_utilization(status: dict) -> float | None:
+    capacity = status.get("pool_size", 0) + max(status.get("max_overflow", 0), 0)
+    if "checked_out" not in status or capacity <= 0:
+        return None
+    return round(status["checked_out"] / capacity, 3)
@@ -0,0 +1,104 @@
+import asyncio
+import itertools
+import logging
+import time
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from app.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class ReplicaSet:
+    """Picks the engine a safe read runs on: a healthy replica, else the primary.
+
+    Replicas are pinged every `check_interval` seconds in the background and
+    taken out of rotation as soon as a check fails or a connection drops.
+    Clients that just wrote read from the primary for `sticky_seconds`, so
+    they see their own changes before the replicas catch up.
+    """
+
+    def __init__(
+        self,
+        primary: AsyncEngine,
+        replicas: list[AsyncEngine],
+        check_interval: float = 5,
+        check_timeout: float = 1,
+        sticky_seconds: float = 5,
+        max_sticky_clients: int = 10000,
+    ):
+        self.primary = primary
+        self.replicas = replicas
+        self.check_interval = check_interval
+        self.check_timeout = check_timeout
+        self.healthy = list(replicas)  # trusted until a check says otherwise
+        self.recent_writers = TTLCache(max_sticky_clients, sticky_seconds)
+        self.primary_fallbacks = 0
+        self.last_check = time.monotonic()
+        self._rotation = itertools.count()
+        self._check_task: asyncio.Task | None = None
+        for replica in replicas:
+            event.listen(replica.sync_engine, "handle_error", self._on_error)
+
+    async def _select_one(self, replica: AsyncEngine):
+        async with replica.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+
+    async def _ping(self, replica: AsyncEngine) -> bool:
+        try:
+            await asyncio.wait_for(self._select_one(replica), self.check_timeout)
+            return True
+        except Exception as error:
+            logger.warning("Replica %s failed its health check: %s", replica.url, error)
+            return False
+
+    async def check(self):
+        results = await asyncio.gather(
+            *(self._ping(replica) for replica in self.replicas)
+        )
+        healthy = [replica for replica, ok in zip(self.replicas, results) if ok]
+        for replica in set(healthy) - set(self.healthy):
+            logger.info("Replica %s is back in rotation", replica.url)
+        self.healthy = healthy
+        self.last_check = time.monotonic()
+
+    def _check_in_background(self):
+        running = self._check_task is not None and not self._check_task.done()
+        if running or time.monotonic() - self.last_check < self.check_interval:
+            return
+        self._check_task = asyncio.get_running_loop().create_task(self.check())
+
+    def _on_error(self, context):
+        if not context.is_disconnect or context.engine is None:
+            return
+        for replica in self.healthy:
+            if replica.sync_engine is context.engine:
+                logger.warning("Replica %s dropped out of rotation", replica.url)
+                self.healthy = [other for other in self.healthy if other is not replica]
+
+    # * Reads by this client stay on the primary for a while after a write
+    def wrote(self, client_key: str | None):
+        if client_key is not None and self.replicas:
+            self.recent_writers.set(client_key, True)
+
+    def is_sticky(self, client_key: str | None) -> bool:
+        return client_key is not None and bool(self.recent_writers.get(client_key))
+
+    def engine_for(self, client_key: str | None = None) -> AsyncEngine:
+        if not self.replicas:
+            return self.primary
+        self._check_in_background()
+        if self.is_sticky(client_key):
+            return self.primary
+        if not self.healthy:
+            self.primary_fallbacks += 1
+            return self.primary
+        return self.healthy[next(self._rotation) % len(self.healthy)]
+
+    def stats(self) -> dict:
+        return {
+            "replicas": len(self.replicas),
+            "healthy_replicas": len(self.healthy),
+            "primary_fallbacks": self.primary_fallbacks,
+            "sticky_clients": self.recent_writers.stats()["size"],
+        }
@@ -1,32 +1,266 @@
+import asyncio
+import contextlib
 import logging
-from sqlalchemy import text
 from fastapi import FastAPI, HTTPException
-from app.config.setup import AsyncSessionLocal
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app.config.setup import (
+    ADMISSION_MAX_CONCURRENT,
+    ADMISSION_MAX_QUEUE,
+    ADMISSION_QUEUE_TIMEOUT_SECONDS,
+    DB_POOL_PROFILE,
+    HEALTH_CHECK_INTERVAL_SECONDS,
+    HEALTH_CHECK_TIMEOUT_SECONDS,
+    READINESS_CHECK_MIGRATIONS,
+    READINESS_MAX_POOL_UTILIZATION,
+    RATE_LIMIT_BURST,
+    RATE_LIMIT_MAX_CLIENTS,
+    RATE_LIMIT_PER_SECOND,
+    RATE_LIMITS,
+    SLOW_QUERY_THRESHOLD_MS,
+    engine,
+)
+from app.db.core import replica_set
+from app.db.health import DatabaseHealth, get_migration_heads
+from app.db.pool import get_pool_status, get_pool_utilization
+from app.services import auth as auth_services
+from app.services.cache import response_cache
+from app.services.jobs import job_runner
+from app.utils import metrics
+from app.utils.admission import (
+    AdmissionController,
+    AdmissionMiddleware,
+    RateLimiter,
+    parse_rate_limits,
+)
 from .routers.user import router as users_router
 from .routers.music import router as musics_router
 from .routers.playlist import router as playlists_router
+from .routers.job import router as jobs_router
 
 # Set up logging
 logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+# Probes read this instead of querying, the lifespan keeps it fresh
+database_health = DatabaseHealth(
+    engine,
+    interval=HEALTH_CHECK_INTERVAL_SECONDS,
+    timeout=HEALTH_CHECK_TIMEOUT_SECONDS,
+    migration_heads=get_migration_heads() if READINESS_CHECK_MIGRATIONS else None,
+)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    refresher = asyncio.create_task(database_health.run())
+    job_runner.start()
+    yield
+    await job_runner.stop()
+    refresher.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await refresher
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Expensive routes get their own per client budgets, see RATE_LIMITS
+RATE_LIMITED_ROUTES = {
+    "login": ("POST", r"/users/login"),
+    "playlist-musics": ("GET", r"/playlist/[^/]+/musics"),
+}
+rate_limiters = {
+    name: RateLimiter(rate, burst, max_clients=RATE_LIMIT_MAX_CLIENTS)
+    for name, (rate, burst) in {
+        "default": (RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST),
+        **parse_rate_limits(RATE_LIMITS),
+    }.items()
+    if rate > 0
+}
+admission_controller = (
+    AdmissionController(
+        max_concurrent=ADMISSION_MAX_CONCURRENT,
+        max_queue=ADMISSION_MAX_QUEUE,
+        queue_timeout=ADMISSION_QUEUE_TIMEOUT_SECONDS,
+    )
+    if ADMISSION_MAX_CONCURRENT > 0
+    else None
+)
+# Added before the metrics middleware so rejected requests are still counted
+app.add_middleware(
+    AdmissionMiddleware,
+    controller=admission_controller,
+    limiters=rate_limiters,
+    routes=RATE_LIMITED_ROUTES,
+    client_key=auth_services.get_rate_limit_key,
+    exempt_paths=("/", "/livez", "/readyz", "/db/pool", "/metrics"),
+)
+
+# Counts and times the SQL behind every request, see /metrics and Server-Timing
+sql_instrumentation = metrics.SqlInstrumentation(
+    slow_query_seconds=(
+        SLOW_QUERY_THRESHOLD_MS / 1000 if SLOW_QUERY_THRESHOLD_MS >= 0 else None
+    )
+)
+sql_instrumentation.install()
+app.add_middleware(metrics.MetricsMiddleware)
 
 app.include_router(users_router)
 app.include_router(musics_router)
 app.include_router(playlists_router)
+app.include_router(jobs_router)
 
 
+# * Kept for existing monitors, answered from the background database check
 @app.get("/")
 async def health_check():
-    try:
-        # Using a context manager to automatically close the session
-        async with AsyncSessionLocal() as db:
-            await db.execute(text("SELECT 1"))  # Running a raw SQL query with text()
-        return {"status": "Database connected!"}
-    except Exception as e:
-        # Log the exception details
-        logger.error(f"Error connecting to the database: {str(e)}")
+    status = await database_health.current()
+    if not status["ok"]:
+        logger.error(f"Error connecting to the database: {status['error']}")
         raise HTTPException(
-            status_code=500, detail=f"Database connection failed: {str(e)}"
+            status_code=500, detail=f"Database connection failed: {status['error']}"
+        )
+    return {"status": "Database connected!"}
+
+
+# * Liveness: the process answers, never touches the database
+@app.get("/livez", include_in_schema=False)
+async def liveness():
+    return {"status": "ok"}
+
+
+# * Readiness: database reachable, migrations at this build's head and pool not
+# * saturated, all from state the background check already gathered
+@app.get("/readyz", include_in_schema=False)
+async def readiness():
+    database = await database_health.current()
+    pool = get_pool_status(engine)
+    utilization = get_pool_utilization(pool)
+    migrations = database.get("migrations")
+
+    failures = []
+    if not database["ok"]:
+        failures.append("database")
+    if migrations is not None and not migrations["up_to_date"]:
+        failures.append("migrations")
+    if utilization is not None and utilization >= READINESS_MAX_POOL_UTILIZATION:
+        failures.append("pool")
+
+    body = {
+        "status": "not_ready" if failures else "ready",
+        "failing": failures,
+        "database": {
+            **database,
+            "checked_seconds_ago": round(database_health.age(), 3),
+        },
+        "pool": {**pool, "utilization": utilization},
+        "replicas": replica_set.stats(),
+    }
+    return JSONResponse(body, status_code=503 if failures else 200)
+
+
+# * Connection pool usage, to size pods against the database max_connections
+@app.get("/db/pool")
+async def pool_status():
+    return {
+        "profile": DB_POOL_PROFILE,
+        **get_pool_status(engine),
+        "replicas": [
+            {
+                "url": replica.url.render_as_string(hide_password=True),
+                "healthy": replica in replica_set.healthy,
+                **get_pool_status(replica),
+            }
+            for replica in replica_set.replicas
+        ],
+    }
+
+
+# * Prometheus text format: per route latency, DB time and query counts, plus
+# * the pool, cache and password hashing gauges
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    lines = []
+    for metric in (*metrics.REQUEST_METRICS, metrics.SLOW_QUERIES):
+        lines.extend(metric.render())
+
+    pool = get_pool_status(engine)
+    lines.extend(
+        metrics.render_gauges(
+            "db_pool",
+            "Connection pool state and checkout counters.",
+            {
+                (("stat",), (name,)): value
+                for name, value in pool.items()
+                if isinstance(value, (int, float))
+            },
+        )
+    )
+    lines.extend(
+        metrics.render_gauges(
+            "db_replicas",
+            "Read replicas in rotation and reads sent to the primary for lack of one.",
+            {
+                (("stat",), (name,)): value
+                for name, value in replica_set.stats().items()
+            },
+        )
+    )
+    lines.extend(
+        metrics.render_gauges(
+            "admission",
+            "Requests running, waiting for a slot and turned away with a 503.",
+            {
+                (("stat",), (name,)): value
+                for name, value in (
+                    admission_controller.stats() if admission_controller else {}
+                ).items()
+            },
+        )
+    )
+    lines.extend(
+        metrics.render_gauges(
+            "rate_limit",
+            "Clients tracked and requests refused with a 429, per budget.",
+            {
+                (("budget", "stat"), (budget, name)): value
+                for budget, limiter in rate_limiters.items()
+                for name, value in limiter.stats().items()
+            },
+        )
+    )
+    lines.extend(
+        metrics.render_gauges(
+            "jobs",
+            "Background job workers, jobs running and jobs finished in this process.",
+            {(("stat",), (name,)): value for name, value in job_runner.stats().items()},
+        )
+    )
+    caches = {
+        "response": response_cache.stats(),
+        "principal": auth_services.principal_cache.stats(),
+        "token": auth_services.token_cache.stats(),
+    }
+    lines.extend(
+        metrics.render_gauges(
+            "app_cache",
+            "In-process and response cache sizes, hits and misses.",
+            {
+                (("cache", "stat"), (cache, name)): value
+                for cache, stats in caches.items()
+                for name, value in stats.items()
+            },
+        )
+    )
+    lines.extend(
+        metrics.render_gauges(
+            "password_hash_pool",
+            "bcrypt worker pool state.",
+            {
+                (("stat",), (name,)): value
+                for name, value in auth_services.password_hasher.stats().items()
+            },
         )
+    )
+    return PlainTextResponse(
+        "\n".join(lines) + "\n", media_type="text/plain; version=0.0.4"
+    )
@@ -0,0 +1,26 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..services import auth as auth_services
+from ..services import jobs as job_services
+from ..schemas import job as job_schema
+from ..schemas import user as user_schema
+from ..db.core import get_async_db
+
+router = APIRouter(
+    prefix="/jobs",
+    tags=["Jobs"],
+)
+
+
+# * Status of a job queued with Prefer: respond-async, poll it until it has
+# * succeeded (result holds what the route would have returned) or failed
+# * Always read from the primary, a replica may not have seen the job yet
+@router.get("/{job_id}", response_model=job_schema.JobOut)
+async def get_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: user_schema.UserOut = Depends(auth_services.get_current_user),
+):
+    return await job_services.get_job(
+        db=db, requester_id=current_user.id, job_id=job_id
+    )
@@ -1,11 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from typing import Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 from ..services import music as music_services
 from ..services import user as user_services
 from ..services import auth as auth_services
+from ..services import jobs as job_services
+from ..services.cache import cache_response, get_cached_response
+from ..schemas import job as job_schema
 from ..schemas import music as music_schema
 from ..schemas import user as user_schema
-from ..db.core import get_async_db
+from ..db.core import get_async_db, get_async_read_db
+from ..utils.functions import (
+    check_etag,
+    decode_cursor,
+    encode_cursor,
+    get_cursor_id,
+    dump_rows,
+    iter_lines,
+    json_response,
+    make_etag,
+    prefers_async,
+    set_next_cursor,
+)
 
 router = APIRouter(
     prefix="/music",
@@ -30,31 +46,159 @@ async def add_music(
     return await music_services.add_music(db=db, music=music, user_id=current_user.id)
 
 
+# * Bulk import musics from an NDJSON or CSV (with a title,artist,link header) body
+# * The body is read as a stream, so files of any size can be sent
+# * With Prefer: respond-async it is saved and imported by a job, see /jobs
+@router.post(
+    "/import",
+    response_model=music_schema.MusicImportOut,
+    responses={202: {"model": job_schema.JobOut}},
+)
+async def import_musics(
+    request: Request,
+    file_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: user_schema.UserOut = Depends(auth_services.get_current_user),
+):
+    if prefers_async(request):
+        path = await job_services.spool_body(request.stream())
+        job = await job_services.job_runner.enqueue(
+            db=db,
+            kind="music-import",
+            requested_by=current_user.id,
+            payload={"path": path, "format": file_format},
+        )
+        return job_services.job_accepted(job)
+
+    return await music_services.import_musics(
+        db=db,
+        lines=iter_lines(request.stream()),
+        user_id=current_user.id,
+        file_format=file_format,
+    )
+
+
 # * Get all musics
+# * Pass the X-Next-Cursor response header back as ?cursor= to get the next page
 @router.get("/all", response_model=list[music_schema.MusicOut])
 async def get_musics(
-    skip: int = 0, limit: int = 10, db: AsyncSession = Depends(get_async_db)
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    cache_key = f"all?{request.url.query}"
+    cached = await get_cached_response(request, "musics", cache_key)
+    if cached:
+        return cached
+
+    musics = await music_services.get_musics(
+        db=db, skip=skip, limit=limit, after_id=get_cursor_id(cursor)
+    )
+    set_next_cursor(response, musics, limit)
+    return await cache_response(
+        request,
+        "musics",
+        cache_key,
+        "music-all",
+        json_response(dump_rows(musics), response),
+    )
+
+
+# * Search musics by title and artist, best matches first
+@router.get("/search", response_model=list[music_schema.MusicOut])
+async def search_musics(
+    response: Response,
+    q: str = Query(min_length=1, max_length=200),
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db),
 ):
-    return await music_services.get_musics(db=db, skip=skip, limit=limit)
+    after = None
+    if cursor is not None:
+        after = decode_cursor(cursor, "score", "id")
+        if not isinstance(after[0], (int, float)) or not isinstance(after[1], int):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+            )
+
+    rows = await music_services.search_musics(db=db, query=q, limit=limit, after=after)
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(
+            {"score": rows[-1].score, "id": rows[-1].Music.id}
+        )
+    return [row.Music for row in rows]
 
 
 # * Get specific user added musics
 @router.get("/from-user/{user_id}", response_model=list[music_schema.MusicOut])
 async def get_user_added_musics(
     user_id: int,
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 10,
-    db: AsyncSession = Depends(get_async_db),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db),
 ):
+    cache_key = f"from-user/{user_id}?{request.url.query}"
+    cached = await get_cached_response(request, "musics", cache_key)
+    if cached:
+        return cached
+
     db_user = await user_services.get_user(db=db, user_id=user_id)
     if db_user is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
         )
+
+    after_id = get_cursor_id(cursor)
+    versions = await music_services.get_user_added_musics_versions(
+        db=db, user_id=user_id, skip=skip, limit=limit, after_id=after_id
+    )
+    not_modified = check_etag(
+        request, response, make_etag("user-musics", user_id, versions)
+    )
+    if not_modified:
+        return not_modified
+
     musics = await music_services.get_user_added_musics(
-        db=db, user_id=user_id, skip=skip, limit=limit
+        db=db,
+        user_id=user_id,
+        skip=skip,
+        limit=limit,
+        after_id=after_id,
     )
-    return musics
+    set_next_cursor(response, musics, limit)
+    return await cache_response(
+        request,
+        "musics",
+        cache_key,
+        "user-musics",
+        json_response(dump_rows(musics), response),
+    )
+
+
+# * Get a music by ID
+@router.get("/{music_id}", response_model=music_schema.MusicOut)
+async def get_music(
+    music_id: int,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_read_db),
+):
+    version = await music_services.get_music_version(db=db, music_id=music_id)
+    if version is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Music not found"
+        )
+    not_modified = check_etag(request, response, make_etag("music", music_id, version))
+    if not_modified:
+        return not_modified
+
+    return await music_services.get_music_by_id(db=db, music_id=music_id)
 
 
 # * Updated music added by user
@@ -65,18 +209,8 @@ async def update_music(
     db: AsyncSession = Depends(get_async_db),
     current_user: user_schema.UserOut = Depends(auth_services.get_current_user),
 ):
-    music = await music_services.get_music_by_id(db=db, music_id=music_id)
-    if music is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Music not found"
-        )
-    if music.added_by != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You can only update the music you added",
-        )
     return await music_services.update_music(
-        db=db, music_id=music_id, music=updated_music
+        db=db, requester_id=current_user.id, music_id=music_id, music=updated_music
     )
 
 
@@ -87,14 +221,6 @@ async def remove_music(
     db: AsyncSession = Depends(get_async_db),
     current_user: user_schema.UserOut = Depends(auth_services.get_current_user),
 ):
-    music = await music_services.get_music_by_id(db=db, music_id=music_id)
-    if music is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="Music not found"
-        )
-    if music.added_by != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You can only delete the music you added",
-        )
-    return await music_services.remove_music(db=db, music_id=music_id)
+    return await music_services.remove_music(
+        db=db, requester_id=current_user.id, music_id=music_id
+    )
@@ -1,14 +1,28 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 from typing import Optional
 from fastapi.security import OAuth2PasswordBearer
+import orjson
 from sqlalchemy.ext.asyncio import AsyncSession
 from ..services import playlist as playlist_services
 from ..services import music as music_services
 from ..services import auth as auth_services
+from ..services import jobs as job_services
+from ..services.cache import cache_response, get_cached_response
+from ..schemas import job as job_schema
 from ..schemas import playlist as playstlist_schema
 from ..schemas import music as music_schema
 from ..schemas import user as user_schema
-from ..db.core import get_async_db
+from ..db.core import get_async_db, get_async_read_db
+from ..utils.functions import (
+    check_etag,
+    decode_cursor,
+    dump_rows,
+    encode_cursor,
+    json_response,
+    make_etag,
+    prefers_async,
+)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 router = APIRouter(
@@ -35,6 +49,7 @@ async def create_playlist(
 
 
 # * Add music to a user playlist
+# * ?before= inserts it right before that track instead of at the end
 @router.post(
     "/{playlist_id}/add-music/{music_id}",
     status_code=status.HTTP_201_CREATED,
@@ -43,6 +58,7 @@ async def create_playlist(
 async def add_music_to_playlist(
     playlist_id: int,
     music_id: int,
+    before: Optional[int] = None,
     db: AsyncSession = Depends(get_async_db),
     current_user: user_schema.UserOut = Depends(auth_services.get_current_user),
 ):
@@ -50,43 +66,254 @@ async def add_music_to_playlist(
         requester_id=current_user.id,
         playlist_id=playlist_id,
         music_id=music_id,
+        before_id=before,
+        db=db,
+    )
+
+
+# * Move a track right before the ?before= track, or to the end without it
+@router.put(
+    "/{playlist_id}/move-music/{music_id}",
+    response_model=playstlist_schema.PlaylistMusicOutcome,
+)
+async def move_music_in_playlist(
+    playlist_id: int,
+    music_id: int,
+    before: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: user_schema.UserOut = Depends(auth_services.get_current_user),
+):
+    return await playlist_services.move_music_in_playlist(
+        requester_id=current_user.id,
+        playlist_id=playlist_id,
+        music_id=music_id,
+        before_id=before,
+        db=db,
+    )
+
+
+# * Add many musics to a user playlist in one statement
+@router.post(
+    "/{playlist_id}/add-musics",
+    response_model=list[playstlist_schema.PlaylistMusicOutcome],
+)
+async def add_musics_to_playlist(
+    playlist_id: int,
+    body: playstlist_schema.PlaylistMusicIds,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: user_schema.UserOut = Depends(auth_services.get_current_user),
+):
+    return await playlist_services.add_musics_to_playlist(
+        requester_id=current_user.id,
+        playlist_id=playlist_id,
+        music_ids=body.music_ids,
+        db=db,
+    )
+
+
+# * Copy a readable playlist, tracks and order included, into a new playlist
+# * With Prefer: respond-async a job makes the copy, see /jobs
+@router.post(
+    "/{playlist_id}/copy",
+    response_model=playstlist_schema.PlaylistOut,
+    status_code=status.HTTP_201_CREATED,
+    responses={202: {"model": job_schema.JobOut}},
+)
+async def copy_playlist(
+    playlist_id: int,
+    request: Request,
+    body: Optional[playstlist_schema.PlaylistCopy] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: user_schema.UserOut = Depends(auth_services.get_current_user),
+):
+    body = body or playstlist_schema.PlaylistCopy()
+    if prefers_async(request):
+        job = await job_services.job_runner.enqueue(
+            db=db,
+            kind="playlist-copy",
+            requested_by=current_user.id,
+            payload={"playlist_id": playlist_id, "playlist": body.model_dump()},
+        )
+        return job_services.job_accepted(job)
+
+    return await playlist_services.copy_playlist(
+        requester_id=current_user.id,
+        playlist_id=playlist_id,
+        playlist=body,
+        db=db,
+    )
+
+
+# * Append the tracks of a readable playlist missing from a user playlist
+@router.post(
+    "/{playlist_id}/merge/{source_id}",
+    response_model=playstlist_schema.PlaylistOut,
+)
+async def merge_playlist(
+    playlist_id: int,
+    source_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: user_schema.UserOut = Depends(auth_services.get_current_user),
+):
+    return await playlist_services.merge_playlist(
+        requester_id=current_user.id,
+        playlist_id=playlist_id,
+        source_id=source_id,
         db=db,
     )
 
 
+# * Union, intersection or difference of readable playlists, as a new playlist
+# * With Prefer: respond-async a job builds it, see /jobs
+@router.post(
+    "/combine",
+    response_model=playstlist_schema.PlaylistOut,
+    status_code=status.HTTP_201_CREATED,
+    responses={202: {"model": job_schema.JobOut}},
+)
+async def combine_playlists(
+    body: playstlist_schema.PlaylistCombine,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: user_schema.UserOut = Depends(auth_services.get_current_user),
+):
+    if prefers_async(request):
+        job = await job_services.job_runner.enqueue(
+            db=db,
+            kind="playlist-combine",
+            requested_by=current_user.id,
+            payload={"playlist": body.model_dump()},
+        )
+        return job_services.job_accepted(job)
+
+    return await playlist_services.combine_playlists(
+        requester_id=current_user.id, playlist=body, db=db
+    )
+
+
 # * Get all user playlists
+# * Anonymous callers only ever see public playlists, so their responses are cached
 @router.get("/from-user/{user_id}", response_model=list[playstlist_schema.PlaylistOut])
 async def get_user_playlists(
     user_id: int,
-    db: AsyncSession = Depends(get_async_db),
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_read_db),
     current_user: Optional[user_schema.UserOut] = Depends(
         auth_services.get_optional_current_user
     ),
 ):
-    return await playlist_services.get_user_playlists(
-        requester_id=current_user.id if current_user else None,
+    cache_key = f"from-user/{user_id}"
+    if current_user is None:
+        cached = await get_cached_response(request, "playlists", cache_key)
+        if cached:
+            return cached
+
+    requester_id = current_user.id if current_user else None
+    versions = await playlist_services.get_user_playlists_versions(
+        requester_id=requester_id, user_id=user_id, db=db
+    )
+    etag = make_etag("user-playlists", user_id, requester_id == user_id, versions)
+    not_modified = check_etag(request, response, etag)
+    if not_modified:
+        return not_modified
+
+    playlists = await playlist_services.get_user_playlists(
+        requester_id=requester_id,
         user_id=user_id,
         db=db,
     )
+    playlists_response = json_response(dump_rows(playlists), response)
+    if current_user is None:
+        return await cache_response(
+            request, "playlists", cache_key, "user-playlists", playlists_response
+        )
+    return playlists_response
 
 
 # * Get musics by playlist
 @router.get(
     "/{playlist_id}/musics", response_model=playstlist_schema.PlaylistOutWithMusics
 )
+# * ?limit= returns one page of tracks, follow X-Next-Cursor with ?cursor= for more
+# * ?format=ndjson streams every track as one JSON object per line instead
 async def get_playlist_musics(
     playlist_id: int,
-    db: AsyncSession = Depends(get_async_db),
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    file_format: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+    db: AsyncSession = Depends(get_async_read_db),
     current_user: Optional[user_schema.UserOut] = Depends(
         auth_services.get_optional_current_user
     ),
 ):
-    return await playlist_services.get_playlist_musics(
-        requester_id=current_user.id if current_user else None,
-        playlist_id=playlist_id,
+    # * Only anonymous reads are cached: they can only succeed on public playlists
+    # * and streamed NDJSON is never cached
+    cacheable = current_user is None and file_format == "json"
+    cache_key = f"{playlist_id}/musics?{request.url.query}"
+    if cacheable:
+        cached = await get_cached_response(request, "playlists", cache_key)
+        if cached:
+            return cached
+
+    requester_id = current_user.id if current_user else None
+    # * Loading the playlist also applies the visibility rules (404 / 401)
+    db_playlist = await playlist_services.get_readable_playlist(
+        db=db, playlist_id=playlist_id, requester_id=requester_id
+    )
+    etag = make_etag("playlist", playlist_id, db_playlist.version, request.url.query)
+    not_modified = check_etag(request, response, etag)
+    if not_modified:
+        return not_modified
+
+    if file_format == "ndjson":
+        musics = playlist_services.stream_playlist_musics(
+            bind=db.bind, playlist_id=playlist_id
+        )
+        return StreamingResponse(
+            (orjson.dumps(music._asdict()) + b"\n" async for music in musics),
+            media_type="application/x-ndjson",
+            headers={"ETag": etag},
+        )
+
+    paged = limit is not None or cursor is not None
+    after_position = None
+    if paged:
+        limit = limit or 100
+    if cursor is not None:
+        (after_position,) = decode_cursor(cursor, "position")
+        if not isinstance(after_position, int):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+            )
+    musics = await playlist_services.get_playlist_musics(
         db=db,
+        playlist_id=playlist_id,
+        limit=limit,
+        after_position=after_position,
+    )
+    if paged and len(musics) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(
+            {"position": musics[-1].position}
+        )
+    # * Rows end with their position, zip stops before it: it is a cursor detail
+    track_fields = music_schema.MusicOut.model_fields
+    body = orjson.dumps(
+        {
+            **playstlist_schema.PlaylistOut.model_validate(db_playlist).model_dump(),
+            "musics": [dict(zip(track_fields, music)) for music in musics],
+        }
     )
 
+    playlist_response = json_response(body, response)
+    if cacheable:
+        return await cache_response(
+            request, "playlists", cache_key, "playlist-musics", playlist_response
+        )
+    return playlist_response
+
 
 # * Remove music from playlist
 @router.put(
@@ -107,6 +334,25 @@ async def remove_music_from_playlist(
     )
 
 
+# * Remove many musics from playlist in one statement
+@router.put(
+    "/{playlist_id}/remove-musics",
+    response_model=list[playstlist_schema.PlaylistMusicOutcome],
+)
+async def remove_musics_from_playlist(
+    playlist_id: int,
+    body: playstlist_schema.PlaylistMusicIds,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: user_schema.UserOut = Depends(auth_services.get_current_user),
+):
+    return await playlist_services.remove_musics_from_playlist(
+        requester_id=current_user.id,
+        playlist_id=playlist_id,
+        music_ids=body.music_ids,
+        db=db,
+    )
+
+
 @router.put("/{playlist_id}", response_model=playstlist_schema.PlaylistOut)
 async def update_playlist(
     playlist_id: int,
@@ -114,16 +360,11 @@ async def update_playlist(
     db: AsyncSession = Depends(get_async_db),
     current_user: user_schema.UserOut = Depends(auth_services.get_current_user),
 ):
-    playlist = await playlist_services.get_playlist_by_id(
-        db=db, playlist_id=playlist_id
-    )
-    if playlist.owner_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You can only update your own playlists",
-        )
     return await playlist_services.update_playlist(
-        db=db, playlist_id=playlist_id, playlist=updated_playlist
+        db=db,
+        requester_id=current_user.id,
+        playlist_id=playlist_id,
+        playlist=updated_playlist,
     )
 
 
@@ -134,12 +375,6 @@ async def delete_playlist(
     db: AsyncSession = Depends(get_async_db),
     current_user: user_schema.UserOut = Depends(auth_services.get_current_user),
 ):
-    playlist = await playlist_services.get_playlist_by_id(
-        db=db, playlist_id=playlist_id
+    return await playlist_services.delete_playlist(
+        db=db, requester_id=current_user.id, playlist_id=playlist_id
     )
-    if playlist.owner_id != current_user.id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You can only delete your own playlists",
-        )
-    return await playlist_services.delete_playlist(db=db, playlist_id=playlist_id)
@@ -1,6 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from typing import Optional
 from app.config.setup import ACCESS_TOKEN_EXPIRE_MINUTES
-from app.utils.functions import checkUserAuthenticity
+from app.utils.functions import (
+    checkUserAuthenticity,
+    check_etag,
+    dump_rows,
+    get_cursor_id,
+    json_response,
+    make_etag,
+    set_next_cursor,
+)
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.services import user as user_services
 from app.services import auth as auth_services
@@ -54,7 +63,21 @@ async def create_user(
 
 # * Get a user by ID
 @router.get("/{user_id}", response_model=user_schema.UserOut)
-async def get_user(user_id: int, db: AsyncSession = Depends(get_async_db)):
+async def get_user(
+    user_id: int,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+):
+    version = await user_services.get_user_version(db=db, user_id=user_id)
+    if version is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+        )
+    not_modified = check_etag(request, response, make_etag("user", user_id, version))
+    if not_modified:
+        return not_modified
+
     db_user = await user_services.get_user(db=db, user_id=user_id)
     if db_user is None:
         raise HTTPException(
@@ -64,12 +87,20 @@ async def get_user(user_id: int, db: AsyncSession = Depends(get_async_db)):
 
 
 # * Get all users
+# * Pass the X-Next-Cursor response header back as ?cursor= to get the next page
 @router.get("", response_model=list[user_schema.UserOut])
 async def get_users(
-    skip: int = 0, limit: int = 10, db: AsyncSession = Depends(get_async_db)
+    response: Response,
+    skip: int = 0,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
 ):
-    users = await user_services.get_users(db=db, skip=skip, limit=limit)
-    return users
+    users = await user_services.get_users(
+        db=db, skip=skip, limit=limit, after_id=get_cursor_id(cursor)
+    )
+    set_next_cursor(response, users, limit)
+    return json_response(dump_rows(users), response)
 
 
 # * Update user by ID
@@ -0,0 +1,20 @@
+from datetime import datetime
+from pydantic import BaseModel
+from typing import Optional
+
+
+class JobOut(BaseModel):
+    id: int
+    kind: str  # * music-import, playlist-copy or playlist-combine
+    status: str  # * queued, running, succeeded or failed
+    requested_by: int
+    progress: int  # * Units done so far (lines for imports)
+    total: Optional[int] = None  # * Units in all, when known up front
+    attempts: int
+    result: Optional[dict] = None  # * What the route would have returned
+    error: Optional[str] = None  # * Why the last attempt failed
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
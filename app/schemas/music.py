@@ -20,3 +20,15 @@ class MusicOut(MusicBase):
 
     class Config:
         from_attributes = True
+
+
+class MusicImportError(BaseModel):
+    line: int
+    error: str
+
+
+class MusicImportOut(BaseModel):
+    inserted: int  # * New rows written to musics
+    skipped: int  # * Rows already in the catalog (same title and artist)
+    failed: int  # * Rows that could not be parsed, validated or written
+    errors: list[MusicImportError]  # * Details for the first failures only
@@ -1,5 +1,5 @@
-from pydantic import BaseModel  # Import BaseModel, the foundation for Pydantic models
-from typing import Optional  # Import Optional for fields that may be None
+from pydantic import BaseModel, Field  # Import BaseModel, the foundation for Pydantic models
+from typing import Literal, Optional  # Import Optional for fields that may be None
 from .music import MusicOut
 
 
@@ -35,6 +35,28 @@ class PlaylistOut(PlaylistBase):
     id: int  # * User ID is required in the response
     owner_id: int
     private: bool
+    track_count: int
 
     class Config:
         from_attributes = True  # This allows Pydantic to read data from ORM models
+
+
+class PlaylistMusicIds(BaseModel):
+    music_ids: list[int] = Field(min_length=1, max_length=1000)
+
+
+class PlaylistMusicOutcome(BaseModel):
+    music_id: int
+    # * added, already_in_playlist, removed, not_in_playlist, not_found or moved
+    status: str
+
+
+class PlaylistCopy(BaseModel):
+    name: Optional[str] = None  # * Defaults to the source name plus " (copy)"
+    private: Optional[bool] = None  # * Defaults to the source's
+
+
+class PlaylistCombine(PlaylistBase):
+    # * difference keeps the first playlist's tracks that none of the others have
+    operation: Literal["union", "intersection", "difference"]
+    playlist_ids: list[int] = Field(min_length=2, max_length=100)
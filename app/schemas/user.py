@@ -28,6 +28,8 @@ class UserLogin(BaseModel):
 # Schema used for output when returning user data
 class UserOut(UserBase):
     id: int  # User ID is required in the response
+    added_musics_count: int  # Musics this user added to the catalog
+    playlists_count: int  # Playlists this user owns
 
     class Config:
         from_attributes = True  # This allows Pydantic to read data from ORM models
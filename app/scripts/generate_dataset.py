@@ -0,0 +1,209 @@
+"""Fills users, musics, playlists and playlist_music with a large, skewed dataset.
+
+Who added a track, who owns a playlist, how long a playlist is and which tracks
+it holds all follow Zipf distributions, so a few users, playlists and tracks
+are huge or hot while most are small, like real catalogs. The same --seed
+always produces the same rows. Rows are appended after the current max ids.
+
+Usage:
+    python -m app.scripts.generate_dataset --users 100000 --musics 2000000 \\
+        --playlists 500000 --max-playlist-size 5000 --seed 42
+"""
+
+import os
+
+# One-off jobs use the small pool profile unless told otherwise
+os.environ.setdefault("DB_POOL_PROFILE", "migration")
+
+import argparse  # noqa: E402
+import asyncio  # noqa: E402
+import random  # noqa: E402
+import time  # noqa: E402
+from itertools import accumulate  # noqa: E402
+from sqlalchemy import func, insert, select, text  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncEngine  # noqa: E402
+from app.db.core import sync_id_sequences  # noqa: E402
+from app.db.models import Music as music_model  # noqa: E402
+from app.db.models import Playlist as playlist_model  # noqa: E402
+from app.db.models import User as user_model  # noqa: E402
+from app.db.models import POSITION_GAP, playlist_music_association  # noqa: E402
+from app.scripts.rebuild_counters import rebuild_counters  # noqa: E402
+
+DEFAULT_PASSWORD = "password123"
+
+
+class ZipfSampler:
+    """Draws from `values`, the k-th one with probability proportional to 1 / k**s."""
+
+    def __init__(self, values: list, s: float, rng: random.Random):
+        self.values = values
+        self.cum_weights = list(accumulate(1 / k**s for k in range(1, len(values) + 1)))
+        self.rng = rng
+
+    def draw(self, count: int = 1) -> list:
+        return self.rng.choices(self.values, cum_weights=self.cum_weights, k=count)
+
+
+async def _max_id(engine: AsyncEngine, column) -> int:
+    async with engine.connect() as connection:
+        return await connection.scalar(select(func.coalesce(func.max(column), 0)))
+
+
+async def _insert_batches(engine: AsyncEngine, table, rows, batch_size: int) -> int:
+    written = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            async with engine.begin() as connection:
+                await connection.execute(insert(table), batch)
+            written += len(batch)
+            batch = []
+    if batch:
+        async with engine.begin() as connection:
+            await connection.execute(insert(table), batch)
+        written += len(batch)
+    return written
+
+
+async def generate_dataset(
+    engine: AsyncEngine,
+    users: int,
+    musics: int,
+    playlists: int,
+    max_playlist_size: int = 1000,
+    skew: float = 1.1,
+    private_share: float = 0.2,
+    seed: int = 0,
+    batch_size: int = 10_000,
+    password_hash: str = None,
+) -> dict:
+    rng = random.Random(seed)
+    if password_hash is None:
+        from app.services.auth import pwd_context
+
+        password_hash = pwd_context.hash(DEFAULT_PASSWORD)
+
+    first_user = await _max_id(engine, user_model.id) + 1
+    first_music = await _max_id(engine, music_model.id) + 1
+    first_playlist = await _max_id(engine, playlist_model.id) + 1
+    user_ids = list(range(first_user, first_user + users))
+    music_ids = list(range(first_music, first_music + musics))
+
+    # Which users are prolific and which tracks are popular is random, not id order
+    active_users = ZipfSampler(rng.sample(user_ids, len(user_ids)), skew, rng)
+    popular_tracks = ZipfSampler(rng.sample(music_ids, len(music_ids)), skew, rng)
+    playlist_sizes = ZipfSampler(list(range(1, max_playlist_size + 1)), skew, rng)
+
+    await _insert_batches(
+        engine,
+        user_model,
+        (
+            {
+                "id": user_id,
+                "username": f"user_{user_id}",
+                "email": f"user_{user_id}@example.com",
+                "password": password_hash,
+            }
+            for user_id in user_ids
+        ),
+        batch_size,
+    )
+    await _insert_batches(
+        engine,
+        music_model,
+        (
+            {
+                "id": music_id,
+                "title": f"Track {music_id}",
+                "artist": f"Artist {rng.randrange(max(musics // 20, 1))}",
+                "link": f"https://example.com/track/{music_id}",
+                "added_by": active_users.draw()[0],
+            }
+            for music_id in music_ids
+        ),
+        batch_size,
+    )
+
+    playlist_rows = [
+        {
+            "id": playlist_id,
+            "name": f"Playlist {playlist_id}",
+            "private": rng.random() < private_share,
+            "owner_id": active_users.draw()[0],
+        }
+        for playlist_id in range(first_playlist, first_playlist + playlists)
+    ]
+    await _insert_batches(engine, playlist_model, playlist_rows, batch_size)
+
+    # Sizes are approximate: repeated draws of the same popular track collapse
+    def tracks():
+        for playlist in playlist_rows:
+            size = playlist_sizes.draw()[0]
+            drawn = dict.fromkeys(popular_tracks.draw(size))
+            for index, music_id in enumerate(drawn, 1):
+                yield {
+                    "playlist_id": playlist["id"],
+                    "music_id": music_id,
+                    "position": index * POSITION_GAP,
+                }
+
+    tracks_written = await _insert_batches(
+        engine, playlist_music_association, tracks(), batch_size
+    )
+
+    # Rows went in with raw inserts, so the counters are filled in afterwards
+    await rebuild_counters(engine, batch_size=batch_size)
+
+    # Fresh statistics, so the planner sees the skew
+    async with engine.begin() as connection:
+        await sync_id_sequences(connection, user_model, music_model, playlist_model)
+        await connection.execute(text("ANALYZE"))
+
+    return {
+        "users": users,
+        "musics": musics,
+        "playlists": playlists,
+        "playlist_tracks": tracks_written,
+        "first_ids": {
+            "user": first_user,
+            "music": first_music,
+            "playlist": first_playlist,
+        },
+    }
+
+
+async def run(args):
+    from app.config.setup import Base, engine
+
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+
+    start = time.perf_counter()
+    report = await generate_dataset(
+        engine,
+        users=args.users,
+        musics=args.musics,
+        playlists=args.playlists,
+        max_playlist_size=args.max_playlist_size,
+        skew=args.skew,
+        private_share=args.private_share,
+        seed=args.seed,
+        batch_size=args.batch_size,
+    )
+    await engine.dispose()
+    print(report)
+    print(f"done in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--musics", type=int, default=1_000_000)
+    parser.add_argument("--playlists", type=int, default=100_000)
+    parser.add_argument("--max-playlist-size", type=int, default=5_000)
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent")
+    parser.add_argument("--private-share", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    asyncio.run(run(parser.parse_args()))
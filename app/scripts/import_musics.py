@@ -0,0 +1,48 @@
+"""Streams an NDJSON or CSV file into the musics table.
+
+Usage:
+    python -m app.scripts.import_musics tracks.ndjson --user-id 1
+    python -m app.scripts.import_musics tracks.csv --user-id 1 --format csv
+"""
+
+import os
+
+# One-off jobs use the small pool profile unless told otherwise
+os.environ.setdefault("DB_POOL_PROFILE", "migration")
+
+import argparse  # noqa: E402
+import asyncio  # noqa: E402
+import json  # noqa: E402
+from app.config.setup import AsyncSessionLocal  # noqa: E402
+from app.services import music as music_services  # noqa: E402
+
+
+async def read_lines(path: str):
+    with open(path, encoding="utf-8", newline="") as file:
+        for line in file:
+            yield line.rstrip("\r\n")
+
+
+async def run(path: str, user_id: int, file_format: str, batch_size: int):
+    async with AsyncSessionLocal() as db:
+        report = await music_services.import_musics(
+            db=db,
+            lines=read_lines(path),
+            user_id=user_id,
+            file_format=file_format,
+            batch_size=batch_size,
+        )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path")
+    parser.add_argument("--user-id", type=int, required=True)
+    parser.add_argument("--format", choices=["ndjson", "csv"], default=None)
+    parser.add_argument(
+        "--batch-size", type=int, default=music_services.IMPORT_BATCH_SIZE
+    )
+    args = parser.parse_args()
+    file_format = args.format or ("csv" if args.path.endswith(".csv") else "ndjson")
+    asyncio.run(run(args.path, args.user_id, file_format, args.batch_size))
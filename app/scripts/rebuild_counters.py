@@ -0,0 +1,98 @@
+"""Recomputes the denormalized counters from the rows they count.
+
+playlists.track_count, users.added_musics_count and users.playlists_count are
+kept in step by the services. This repairs them after manual SQL, bulk loads
+or a bug, one id range per transaction so no lock is held for long. Only rows
+that drifted are written, and their version is bumped so ETags change with
+them. Cached responses catch up when their TTL runs out.
+
+Usage:
+    python -m app.scripts.rebuild_counters --batch-size 50000
+"""
+
+import os
+
+# One-off jobs use the small pool profile unless told otherwise
+os.environ.setdefault("DB_POOL_PROFILE", "migration")
+
+import argparse  # noqa: E402
+import asyncio  # noqa: E402
+import time  # noqa: E402
+from sqlalchemy import func, select, update  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncEngine  # noqa: E402
+from app.db.models import Music as music_model  # noqa: E402
+from app.db.models import Playlist as playlist_model  # noqa: E402
+from app.db.models import User as user_model  # noqa: E402
+from app.db.models import playlist_music_association  # noqa: E402
+
+
+def _counters() -> dict:
+    # (model, counter column, correlated count of the rows it stands for)
+    return {
+        "playlists.track_count": (
+            playlist_model,
+            playlist_model.track_count,
+            select(func.count())
+            .select_from(playlist_music_association)
+            .where(playlist_music_association.c.playlist_id == playlist_model.id)
+            .scalar_subquery(),
+        ),
+        "users.added_musics_count": (
+            user_model,
+            user_model.added_musics_count,
+            select(func.count(music_model.id))
+            .where(music_model.added_by == user_model.id)
+            .scalar_subquery(),
+        ),
+        "users.playlists_count": (
+            user_model,
+            user_model.playlists_count,
+            select(func.count(playlist_model.id))
+            .where(playlist_model.owner_id == user_model.id)
+            .scalar_subquery(),
+        ),
+    }
+
+
+async def rebuild_counters(engine: AsyncEngine, batch_size: int = 10_000) -> dict:
+    """Returns how many rows each counter had wrong."""
+    report = {}
+    for name, (model, counter, actual) in _counters().items():
+        async with engine.connect() as connection:
+            last_id = await connection.scalar(select(func.max(model.id))) or 0
+
+        fixed = 0
+        for start in range(1, last_id + 1, batch_size):
+            statement = (
+                update(model)
+                .where(
+                    model.id >= start,
+                    model.id < start + batch_size,
+                    counter != actual,
+                )
+                .values({counter.key: actual, "version": model.version + 1})
+                .execution_options(synchronize_session=False)
+            )
+            async with engine.begin() as connection:
+                result = await connection.execute(statement)
+            fixed += result.rowcount
+        report[name] = fixed
+    return report
+
+
+async def run(args):
+    from app.config.setup import engine
+
+    start = time.perf_counter()
+    report = await rebuild_counters(engine, batch_size=args.batch_size)
+    await engine.dispose()
+    print(report)
+    print(f"done in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--batch-size", type=int, default=10_000, help="ids per transaction"
+    )
+    asyncio.run(run(parser.parse_args()))
@@ -1,18 +1,45 @@
 import jwt
-from app.config.setup import JWT_SECRET, ALGORITHM
+import time
+from app.config.setup import (
+    JWT_SECRET,
+    ALGORITHM,
+    PASSWORD_HASH_MAX_PENDING,
+    PASSWORD_HASH_WORKERS,
+    PRINCIPAL_CACHE_MAX_SIZE,
+    PRINCIPAL_CACHE_TTL_SECONDS,
+    TOKEN_CACHE_MAX_SIZE,
+)
 from app.db.models import User as user_model
+from app.schemas import user as user_schemas
+from app.utils.admission import client_address
+from app.utils.cache import TTLCache
+from app.utils.executor import BoundedExecutor
 from datetime import datetime, timedelta
 from passlib.context import CryptContext
 from sqlalchemy.future import select
 from app.db.core import get_async_db
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordBearer
+from fastapi.datastructures import Headers
 from sqlalchemy.ext.asyncio import AsyncSession
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# * bcrypt is deliberately slow, so it never runs on the event loop
+password_hasher = BoundedExecutor(
+    max_workers=PASSWORD_HASH_WORKERS,
+    max_pending=PASSWORD_HASH_MAX_PENDING,
+    name="password-hash",
+)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
+# * user id (jwt 'sub') -> UserOut, so warm requests skip the users lookup
+principal_cache = TTLCache(
+    max_size=PRINCIPAL_CACHE_MAX_SIZE, ttl=PRINCIPAL_CACHE_TTL_SECONDS
+)
+# * raw token -> decoded payload, each entry lives until the token's exp
+token_cache = TTLCache(max_size=TOKEN_CACHE_MAX_SIZE, ttl=0)
+
 
 # Custom dependency function to make the token optional
 async def get_optional_current_user(
@@ -39,31 +66,46 @@ async def get_current_user(
     payload = verify_token(token)
 
     user_id = payload.get("sub")  # * 'sub' is where the user_id is stored
+    user = principal_cache.get(user_id)
+    if user is not None:
+        return user
+
     # * Get the user from the database based on the user_id
-    user = await db.get(user_model, user_id)
-    if user is None:
+    db_user = await db.get(user_model, user_id)
+    if db_user is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
         )
 
+    user = user_schemas.UserOut.model_validate(db_user)
+    principal_cache.set(user_id, user)
     return user
 
 
+# * must be called by anything that changes or deletes a user
+def invalidate_user(user_id: int):
+    principal_cache.pop(user_id)
+
+
 # * hash the password
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+async def get_password_hash(password: str) -> str:
+    return await password_hasher.run(pwd_context.hash, password)
 
 
 # * check if hashed password matches the plain password
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password, hashed_password):
+    return await password_hasher.run(
+        pwd_context.verify, plain_password, hashed_password
+    )
 
 
 # * checks if user exists and password is correct
 async def authenticate_user(db: AsyncSession, email: str, password: str):
     result = await db.execute(select(user_model).filter(user_model.email == email))
     user = result.scalars().first()
-    if not user or not verify_password(password, user.password):
+    # * hand the connection back to the pool before the slow bcrypt check
+    await db.commit()
+    if not user or not await verify_password(password, user.password):
         return None
     return user
 
@@ -79,10 +121,26 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
 
 # * checks if token is valid and returns jwt payload
 def verify_token(token: str):
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
+
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[ALGORITHM])
+        token_cache.set(token, payload, ttl=payload.get("exp", 0) - time.time())
         return payload  # * This will contain the user info
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
+
+
+# * rate limit key for an ASGI request: the user behind a valid token, else the IP
+def get_rate_limit_key(scope) -> str:
+    authorization = Headers(scope=scope).get("authorization", "")
+    if authorization.startswith("Bearer "):
+        try:
+            return f"user:{verify_token(authorization[7:])['sub']}"
+        except HTTPException:
+            pass
+    return f"ip:{client_address(scope)}"
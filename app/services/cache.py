@@ -0,0 +1,71 @@
+from fastapi import Request, Response
+from ..config.setup import (
+    READ_YOUR_WRITES_SECONDS,
+    RESPONSE_CACHE_MAX_SIZE,
+    RESPONSE_CACHE_TTL_SECONDS,
+    RESPONSE_CACHE_TTLS,
+    RESPONSE_CACHE_URL,
+)
+from ..db.core import reads_own_writes
+from ..utils.cache import MemoryCacheBackend, RedisCacheBackend, ResponseCache
+from ..utils.functions import check_etag
+
+# Headers that are part of a cached response, everything else is rebuilt
+CACHED_HEADERS = ("etag", "x-next-cursor")
+
+
+def parse_ttls(value: str) -> dict[str, int]:
+    ttls = {}
+    for pair in filter(None, (part.strip() for part in value.split(","))):
+        route, _, seconds = pair.partition("=")
+        ttls[route.strip()] = int(seconds)
+    return ttls
+
+
+def get_cache_backend(url: str):
+    if url.startswith(("redis://", "valkey://")):
+        return RedisCacheBackend(url)
+    if url.startswith("memory://"):
+        return MemoryCacheBackend(max_size=RESPONSE_CACHE_MAX_SIZE)
+    raise ValueError(f"Unknown RESPONSE_CACHE_URL {url!r}")
+
+
+response_cache = ResponseCache(
+    backend=get_cache_backend(RESPONSE_CACHE_URL),
+    ttls=parse_ttls(RESPONSE_CACHE_TTLS),
+    default_ttl=RESPONSE_CACHE_TTL_SECONDS,
+)
+
+
+# * Returns the cached response, answering If-None-Match from the stored ETag
+# * Clients that just wrote skip it, it may hold what a lagging replica returned
+async def get_cached_response(request: Request, namespace: str, key: str) -> Response | None:
+    if reads_own_writes(request):
+        return None
+    cached = await response_cache.get(namespace, key)
+    if cached is None:
+        return None
+
+    body, headers = cached
+    response = Response(content=body, media_type="application/json", headers=headers)
+    if "etag" in headers:
+        return check_etag(request, response, headers["etag"]) or response
+    return response
+
+
+# * Stores an encoded JSON response with its cached headers and returns it
+# * A response read from a replica may miss a write that already bumped the
+# * namespace, so it is kept no longer than the replica is trusted to lag
+async def cache_response(
+    request: Request, namespace: str, key: str, route: str, response: Response
+) -> Response:
+    headers = {
+        name: value
+        for name, value in response.headers.items()
+        if name in CACHED_HEADERS
+    }
+    max_ttl = None
+    if getattr(request.state, "read_from_replica", False):
+        max_ttl = READ_YOUR_WRITES_SECONDS
+    await response_cache.set(namespace, key, route, response.body, headers, max_ttl)
+    return response
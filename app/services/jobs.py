@@ -0,0 +1,419 @@
+import asyncio
+import contextlib
+import functools
+import logging
+import os
+import uuid
+from datetime import timedelta
+from typing import AsyncIterator, Awaitable, Callable
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse
+from sqlalchemy import and_, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from ..config.setup import (
+    JOB_LEASE_SECONDS,
+    JOB_MAX_ATTEMPTS,
+    JOB_POLL_SECONDS,
+    JOB_RETRY_DELAY_SECONDS,
+    JOB_SPOOL_DIR,
+    JOB_WORKERS,
+    AsyncSessionLocal,
+)
+from ..db.core import schema_columns
+from ..db.models import Job as job_model
+from ..db.models import utcnow
+from ..schemas import job as job_schemas
+from ..schemas import playlist as playlist_schemas
+from ..services import music as music_services
+from ..services import playlist as playlist_services
+from ..utils.functions import iter_lines
+
+logger = logging.getLogger(__name__)
+
+SPOOL_CHUNK_SIZE = 1 << 16
+
+
+class JobContext:
+    """A claimed job as its handler sees it."""
+
+    def __init__(self, runner: "JobRunner", row):
+        self.runner = runner
+        self.id = row.id
+        self.requested_by = row.requested_by
+        self.payload = row.payload
+        self.attempt = row.attempts
+        self.finished = False
+
+    @property
+    def last_attempt(self) -> bool:
+        return self.attempt >= self.runner.max_attempts
+
+    # * Records how far the job got, which also renews the worker's lease on it
+    async def progress(self, done: int, total: int | None = None):
+        await self.runner.report_progress(self.id, done, total)
+
+    # * Marks the job succeeded in the handler's own transaction, so work that
+    # * committed is never run again by a worker claiming the job after a crash
+    async def succeed(self, db: AsyncSession, result: dict):
+        statement = (
+            update(job_model)
+            .where(job_model.id == self.id, job_model.status == "running")
+            .values(status="succeeded", result=result, error=None, finished_at=utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        await db.execute(statement)
+        self.finished = True
+
+
+Handler = Callable[[AsyncSession, JobContext], Awaitable[dict]]
+
+
+class JobRunner:
+    """Runs queued jobs on `workers` asyncio tasks inside the app process.
+
+    Jobs are rows in the jobs table, so they outlive restarts and any process on
+    the same database can run them, with no broker. A worker claims the oldest
+    due job with a guarded UPDATE and owns it for `lease` seconds, renewed by
+    every progress report and every `lease / 3` seconds while its handler runs;
+    the job of a worker that died is claimed again once its lease runs out, or
+    failed if it already used up its attempts. Handlers whose work is a single
+    transaction commit their success with it (JobContext.succeed), so such a job
+    never runs twice. A failed job is retried up to `max_attempts` times,
+    `retry_delay` seconds later and twice as long each time, except for an
+    HTTPException (a missing playlist), which fails it straight away.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker,
+        handlers: dict[str, Handler],
+        workers: int = 2,
+        max_attempts: int = 3,
+        retry_delay: float = 5,
+        lease: float = 60,
+        poll_interval: float = 2,
+    ):
+        self.session_factory = session_factory
+        self.handlers = handlers
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.running = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.retried = 0
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+    # * Queues a job in the caller's session and returns it as a JobOut dict
+    async def enqueue(
+        self, db: AsyncSession, kind: str, requested_by: int, payload: dict
+    ) -> dict:
+        statement = (
+            insert(job_model)
+            .values(kind=kind, requested_by=requested_by, payload=payload)
+            .returning(*schema_columns(job_model, job_schemas.JobOut))
+        )
+        row = (await db.execute(statement)).first()
+        await db.commit()
+        self._wakeup.set()
+        return row._asdict()
+
+    async def claim(self):
+        async with self.session_factory() as db:
+            # Jobs whose workers died on their last attempt are not run again
+            abandoned = await db.scalars(
+                update(job_model)
+                .where(
+                    job_model.status == "running",
+                    job_model.run_after <= utcnow(),
+                    job_model.attempts >= self.max_attempts,
+                )
+                .values(
+                    status="failed",
+                    error="Worker stopped before finishing",
+                    finished_at=utcnow(),
+                )
+                .returning(job_model.payload)
+                .execution_options(synchronize_session=False)
+            )
+            payloads = abandoned.all()
+            await db.commit()
+            self.failed += len(payloads)
+            for payload in payloads:
+                _remove_spooled(payload)
+
+            while True:
+                now = utcnow()
+                due = and_(
+                    job_model.status.in_(("queued", "running")),
+                    job_model.run_after <= now,
+                )
+                job_id = await db.scalar(
+                    select(job_model.id)
+                    .where(due)
+                    .order_by(job_model.run_after, job_model.id)
+                    .limit(1)
+                )
+                if job_id is None:
+                    return None
+
+                statement = (
+                    update(job_model)
+                    .where(job_model.id == job_id, due)
+                    .values(
+                        status="running",
+                        attempts=job_model.attempts + 1,
+                        run_after=now + timedelta(seconds=self.lease),
+                    )
+                    .returning(
+                        job_model.id,
+                        job_model.kind,
+                        job_model.requested_by,
+                        job_model.payload,
+                        job_model.attempts,
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+                row = (await db.execute(statement)).first()
+                await db.commit()
+                if row is not None:  # else another worker got there first
+                    return row
+
+    async def _update(self, job_id: int, *where, **values):
+        async with self.session_factory() as db:
+            statement = (
+                update(job_model)
+                .where(job_model.id == job_id, *where)
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            )
+            await db.execute(statement)
+            await db.commit()
+
+    # * Extends the lease on a running job, along with any other column values
+    async def renew(self, job_id: int, **values):
+        await self._update(
+            job_id,
+            job_model.status == "running",
+            run_after=utcnow() + timedelta(seconds=self.lease),
+            **values,
+        )
+
+    async def report_progress(self, job_id: int, done: int, total: int | None = None):
+        values = {"progress": done}
+        if total is not None:
+            values["total"] = total
+        await self.renew(job_id, **values)
+
+    # * Keeps the lease of a job whose handler reports no progress
+    async def _heartbeat(self, job_id: int):
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                await self.renew(job_id)
+            except Exception:
+                logger.warning("Could not renew the lease on job %s", job_id)
+
+    async def _fail(self, job: JobContext, error: Exception):
+        if isinstance(error, HTTPException):
+            message = str(error.detail)
+        else:
+            message = str(error).splitlines()[0] if str(error) else type(error).__name__
+
+        if not isinstance(error, HTTPException) and not job.last_attempt:
+            self.retried += 1
+            delay = self.retry_delay * 2 ** (job.attempt - 1)
+            logger.warning("Job %s failed, retrying in %gs: %s", job.id, delay, message)
+            await self._update(
+                job.id,
+                status="queued",
+                error=message,
+                run_after=utcnow() + timedelta(seconds=delay),
+            )
+            return
+
+        self.failed += 1
+        logger.warning("Job %s failed: %s", job.id, message)
+        await self._update(job.id, status="failed", error=message, finished_at=utcnow())
+
+    # * Claims and runs one job, False when none is due
+    async def run_one(self) -> bool:
+        row = await self.claim()
+        if row is None:
+            return False
+
+        job = JobContext(self, row)
+        self.running += 1
+        heartbeat = asyncio.create_task(self._heartbeat(job.id))
+        try:
+            async with self.session_factory() as db:
+                result = await self.handlers[row.kind](db, job)
+        except Exception as error:
+            if job.finished:  # what failed came after its work committed
+                self.succeeded += 1
+                logger.warning("Job %s failed after succeeding: %s", job.id, error)
+            else:
+                await self._fail(job, error)
+        else:
+            self.succeeded += 1
+            if not job.finished:
+                await self._update(
+                    job.id,
+                    status="succeeded",
+                    result=result,
+                    error=None,
+                    finished_at=utcnow(),
+                )
+        finally:
+            heartbeat.cancel()
+            self.running -= 1
+        return True
+
+    # * Runs due jobs until there are none left, returns how many ran
+    async def run_pending(self) -> int:
+        count = 0
+        while await self.run_one():
+            count += 1
+        return count
+
+    async def _work(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                if await self.run_one():
+                    continue
+            except Exception:
+                logger.exception("Job worker could not reach the jobs table")
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self._tasks),
+            "running": self.running,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "retried": self.retried,
+        }
+
+
+async def get_job(db: AsyncSession, requester_id: int, job_id: int):
+    statement = select(*schema_columns(job_model, job_schemas.JobOut)).where(
+        job_model.id == job_id
+    )
+    job = (await db.execute(statement)).first()
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found",
+        )
+    if job.requested_by != requester_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You can only see your own jobs",
+        )
+    return job
+
+
+# * 202 pointing at the job, for routes answering Prefer: respond-async
+def job_accepted(job: dict) -> JSONResponse:
+    return JSONResponse(
+        job_schemas.JobOut.model_validate(job).model_dump(mode="json"),
+        status_code=status.HTTP_202_ACCEPTED,
+        headers={
+            "Location": f"/jobs/{job['id']}",
+            "Preference-Applied": "respond-async",
+        },
+    )
+
+
+# * Writes a request body to JOB_SPOOL_DIR for a job to read later, returns the path
+async def spool_body(chunks: AsyncIterator[bytes]) -> str:
+    os.makedirs(JOB_SPOOL_DIR, exist_ok=True)
+    path = os.path.join(JOB_SPOOL_DIR, f"{uuid.uuid4().hex}.upload")
+    with open(path, "wb") as file:
+        async for chunk in chunks:
+            await asyncio.to_thread(file.write, chunk)
+    return path
+
+
+# * Deletes the request body spooled for a job, if its payload has one
+def _remove_spooled(payload: dict):
+    if "path" in payload:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(payload["path"])
+
+
+async def _read_spooled(path: str) -> AsyncIterator[bytes]:
+    with open(path, "rb") as file:
+        while chunk := await asyncio.to_thread(file.read, SPOOL_CHUNK_SIZE):
+            yield chunk
+
+
+async def _import_musics(db: AsyncSession, job: JobContext) -> dict:
+    path = job.payload["path"]
+    finished = False
+    try:
+        report = await music_services.import_musics(
+            db=db,
+            lines=iter_lines(_read_spooled(path)),
+            user_id=job.requested_by,
+            file_format=job.payload["format"],
+            on_progress=job.progress,
+        )
+        finished = True
+        return report
+    finally:
+        # A retry reads the body again, rows already imported are skipped
+        if finished or job.last_attempt:
+            _remove_spooled(job.payload)
+
+
+async def _copy_playlist(db: AsyncSession, job: JobContext) -> dict:
+    return await playlist_services.copy_playlist(
+        db=db,
+        requester_id=job.requested_by,
+        playlist_id=job.payload["playlist_id"],
+        playlist=playlist_schemas.PlaylistCopy.model_validate(job.payload["playlist"]),
+        before_commit=functools.partial(job.succeed, db),
+    )
+
+
+async def _combine_playlists(db: AsyncSession, job: JobContext) -> dict:
+    return await playlist_services.combine_playlists(
+        db=db,
+        requester_id=job.requested_by,
+        playlist=playlist_schemas.PlaylistCombine.model_validate(
+            job.payload["playlist"]
+        ),
+        before_commit=functools.partial(job.succeed, db),
+    )
+
+
+JOB_HANDLERS = {
+    "music-import": _import_musics,
+    "playlist-copy": _copy_playlist,
+    "playlist-combine": _combine_playlists,
+}
+
+job_runner = JobRunner(
+    AsyncSessionLocal,
+    handlers=JOB_HANDLERS,
+    workers=JOB_WORKERS,
+    max_attempts=JOB_MAX_ATTEMPTS,
+    retry_delay=JOB_RETRY_DELAY_SECONDS,
+    lease=JOB_LEASE_SECONDS,
+    poll_interval=JOB_POLL_SECONDS,
+)
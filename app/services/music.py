@@ -1,10 +1,29 @@
-from sqlalchemy.exc import IntegrityError, NoResultFound
+import csv
+import json
+import logging
+import re
+from typing import AsyncIterator, Awaitable, Callable
+from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError, NoResultFound, SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from sqlalchemy import and_, column, delete, func, literal_column, or_, table, text
+from sqlalchemy import update
 from fastapi import HTTPException, status
-from app.db.models import Music as music_model
+from app.db.core import get_dialect_insert, schema_columns
+from app.db.models import Music as music_model, music_search_vector
+from app.db.models import Playlist as playlist_model
+from app.db.models import playlist_music_association
+from app.services import user as user_service
+from app.services.cache import response_cache
 from app.schemas import music as music_schemas
 
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = 1000
+IMPORT_MAX_REPORTED_ERRORS = 20
+IMPORT_MAX_RECORD_LINES = 100
+
 
 async def add_music(db: AsyncSession, music: music_schemas.MusicBase, user_id: int):
     db_music = music_model(
@@ -15,6 +34,9 @@ async def add_music(db: AsyncSession, music: music_schemas.MusicBase, user_id: i
     )
     db.add(db_music)
     try:
+        await user_service.adjust_user_counters(
+            db=db, user_id=user_id, added_musics_count=1
+        )
         await db.commit()
         await db.refresh(db_music)
     except IntegrityError:
@@ -23,26 +45,137 @@ async def add_music(db: AsyncSession, music: music_schemas.MusicBase, user_id: i
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Music already exists",
         )
+    await response_cache.invalidate("musics")
     return db_music
 
 
-async def get_musics(db: AsyncSession, skip: int = 0, limit: int = 10):
-    statement = select(music_model).offset(skip).limit(limit)
+# * after_id switches to keyset paging (seek on the primary key), skip is legacy
+async def get_musics(
+    db: AsyncSession, skip: int = 0, limit: int = 10, after_id: int = None
+):
+    statement = (
+        select(*schema_columns(music_model, music_schemas.MusicOut))
+        .order_by(music_model.id)
+        .limit(limit)
+    )
+    if after_id is not None:
+        statement = statement.where(music_model.id > after_id)
+    else:
+        statement = statement.offset(skip)
     result = await db.execute(statement)
-    return result.scalars().all()
+    return result.all()
 
 
-async def get_user_added_musics(
-    db: AsyncSession, user_id: int, skip: int = 0, limit: int = 10
+def _user_added_musics_statement(
+    columns: list, user_id: int, skip: int, limit: int, after_id: int
 ):
     statement = (
-        select(music_model)
+        select(*columns)
         .where(music_model.added_by == user_id)
-        .offset(skip)
+        .order_by(music_model.id)
         .limit(limit)
     )
+    if after_id is not None:
+        return statement.where(music_model.id > after_id)
+    return statement.offset(skip)
+
+
+async def get_user_added_musics(
+    db: AsyncSession,
+    user_id: int,
+    skip: int = 0,
+    limit: int = 10,
+    after_id: int = None,
+):
+    statement = _user_added_musics_statement(
+        schema_columns(music_model, music_schemas.MusicOut),
+        user_id,
+        skip,
+        limit,
+        after_id,
+    )
+    result = await db.execute(statement)
+    return result.all()
+
+
+# * (id, version) of the same page get_user_added_musics returns, for its ETag
+async def get_user_added_musics_versions(
+    db: AsyncSession,
+    user_id: int,
+    skip: int = 0,
+    limit: int = 10,
+    after_id: int = None,
+):
+    statement = _user_added_musics_statement(
+        [music_model.id, music_model.version], user_id, skip, limit, after_id
+    )
+    result = await db.execute(statement)
+    return [tuple(row) for row in result.all()]
+
+
+# SQLite FTS5 shadow table of musics, see app/db/models.py
+musics_fts = table("musics_fts", column("rowid"))
+
+
+def _search_terms(query: str) -> list[str]:
+    # Only word characters reach the FTS query syntax of either database
+    return re.findall(r"\w+", query.lower())[:8]
+
+
+def _postgres_search(query: str, terms: list[str]):
+    tsquery = func.to_tsquery(
+        literal_column("'simple'"), " & ".join(f"{term}:*" for term in terms)
+    )
+    score = func.ts_rank(music_search_vector, tsquery) + func.greatest(
+        func.similarity(music_model.title, query),
+        func.similarity(music_model.artist, query),
+    )
+    statement = select(music_model, score.label("score")).where(
+        or_(
+            music_search_vector.op("@@")(tsquery),
+            music_model.title.op("%")(query),
+            music_model.artist.op("%")(query),
+        )
+    )
+    return statement, score
+
+
+def _sqlite_search(terms: list[str]):
+    # bm25 is lower for better matches, negate it so both databases sort descending
+    score = -func.bm25(literal_column("musics_fts"))
+    statement = (
+        select(music_model, score.label("score"))
+        .join(musics_fts, musics_fts.c.rowid == music_model.id)
+        .where(
+            text("musics_fts MATCH :match").bindparams(
+                match=" ".join(f'"{term}"*' for term in terms)
+            )
+        )
+    )
+    return statement, score
+
+
+# * Ranked, prefix and typo tolerant search; after is the (score, id) of the last row
+async def search_musics(
+    db: AsyncSession, query: str, limit: int = 10, after: tuple = None
+):
+    terms = _search_terms(query)
+    if not terms:
+        return []
+
+    if db.bind.dialect.name == "postgresql":
+        statement, score = _postgres_search(query, terms)
+    else:
+        statement, score = _sqlite_search(terms)
+
+    if after is not None:
+        last_score, last_id = after
+        statement = statement.where(
+            or_(score < last_score, and_(score == last_score, music_model.id > last_id))
+        )
+    statement = statement.order_by(score.desc(), music_model.id).limit(limit)
     result = await db.execute(statement)
-    return result.scalars().all()
+    return result.all()
 
 
 async def get_music_by_id(db: AsyncSession, music_id: int):
@@ -55,23 +188,250 @@ async def get_music_by_id(db: AsyncSession, music_id: int):
         )
 
 
+async def get_music_version(db: AsyncSession, music_id: int):
+    statement = select(music_model.version).where(music_model.id == music_id)
+    result = await db.execute(statement)
+    return result.scalar_one_or_none()
+
+
+# * Rows of the music if requester_id added it, for owner-checked statements
+def _owned_music(music_id: int, requester_id: int):
+    return (music_model.id == music_id) & (music_model.added_by == requester_id)
+
+
+# * Playlists render their tracks, so a track change is a change to them too.
+# * track_delta=-1 when the track is being removed from all of them, added_by
+# * limits it to a music that user added.
+async def _bump_playlists_containing(
+    db: AsyncSession, music_id: int, track_delta: int = 0, added_by: int = None
+):
+    playlist_ids = select(playlist_music_association.c.playlist_id).where(
+        playlist_music_association.c.music_id == music_id
+    )
+    if added_by is not None:
+        playlist_ids = playlist_ids.where(
+            playlist_music_association.c.music_id.in_(
+                select(music_model.id).where(_owned_music(music_id, added_by))
+            )
+        )
+    statement = (
+        update(playlist_model)
+        .where(playlist_model.id.in_(playlist_ids))
+        .values(
+            version=playlist_model.version + 1,
+            track_count=playlist_model.track_count + track_delta,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(statement)
+
+
+# * The owner-checked statement matched nothing, one lookup tells 404 from 403
+async def _raise_music_miss(
+    db: AsyncSession, music_id: int, requester_id: int, detail: str
+):
+    statement = select(music_model.added_by).where(music_model.id == music_id)
+    row = (await db.execute(statement)).first()
+    if row is None or row.added_by == requester_id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Music not found"
+        )
+    raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=detail)
+
+
+# * UPDATE ... RETURNING when the requester added the music, then the playlists
+# * holding it are bumped for their ETags
 async def update_music(
-    db: AsyncSession, music_id: int, music: music_schemas.MusicUpdate
+    db: AsyncSession,
+    requester_id: int,
+    music_id: int,
+    music: music_schemas.MusicUpdate,
 ):
-    db_music = await get_music_by_id(db=db, music_id=music_id)
-    if music.title:
-        db_music.title = music.title
-    if music.artist:
-        db_music.artist = music.artist
-    if music.link:
-        db_music.link = music.link
+    values = {"version": music_model.version + 1}
+    for field in ("title", "artist", "link"):
+        if getattr(music, field):
+            values[field] = getattr(music, field)
+
+    statement = (
+        update(music_model)
+        .where(_owned_music(music_id, requester_id))
+        .values(values)
+        .returning(*schema_columns(music_model, music_schemas.MusicOut))
+    )
+    row = (await db.execute(statement)).first()
+    if row is None:
+        await _raise_music_miss(
+            db, music_id, requester_id, "You can only update the music you added"
+        )
+
+    await _bump_playlists_containing(db=db, music_id=music_id)
     await db.commit()
-    await db.refresh(db_music)
-    return db_music
+    await response_cache.invalidate("musics", "playlists")
+    return row._asdict()
 
 
-async def remove_music(db: AsyncSession, music_id: int):
-    db_music = await get_music_by_id(db=db, music_id=music_id)
-    await db.delete(db_music)
+# * Every statement only matches when the requester added the music, the
+# * DELETE ... RETURNING says whether anything was deleted
+async def remove_music(db: AsyncSession, requester_id: int, music_id: int):
+    await _bump_playlists_containing(
+        db=db, music_id=music_id, track_delta=-1, added_by=requester_id
+    )
+    # Its playlist rows go with it through ON DELETE CASCADE
+    statement = (
+        delete(music_model)
+        .where(_owned_music(music_id, requester_id))
+        .returning(*schema_columns(music_model, music_schemas.MusicOut))
+    )
+    row = (await db.execute(statement)).first()
+    if row is None:
+        await _raise_music_miss(
+            db, music_id, requester_id, "You can only delete the music you added"
+        )
+
+    await user_service.adjust_user_counters(
+        db=db, user_id=requester_id, added_musics_count=-1
+    )
     await db.commit()
-    return db_music
+    await response_cache.invalidate("musics", "playlists")
+    return row._asdict()
+
+
+# * True while a quoted CSV field is still open at the end of text
+def _csv_record_open(text: str) -> bool:
+    if '"' not in text:
+        return False
+    try:
+        next(csv.reader([text], strict=True))
+    except csv.Error as error:
+        return str(error) == "unexpected end of data"
+    return False
+
+
+# * Yields (number of its first line, text) for every non-blank record. A CSV
+# * record runs on while a quoted field is open, up to IMPORT_MAX_RECORD_LINES
+async def _import_records(lines: AsyncIterator[str], file_format: str):
+    record = None
+    line_number = record_line = 0
+    async for line in lines:
+        line_number += 1
+        if record is not None:
+            record += "\n" + line
+        elif line.strip():
+            record, record_line = line, line_number
+        else:
+            continue
+        if (
+            file_format == "csv"
+            and line_number - record_line + 1 < IMPORT_MAX_RECORD_LINES
+            and _csv_record_open(record)
+        ):
+            continue
+        yield record_line, record
+        record = None
+    if record is not None:
+        yield record_line, record
+
+
+# * Yields (line number, row dict or error message) for NDJSON or CSV records
+async def _parse_import_rows(lines: AsyncIterator[str], file_format: str):
+    header = None
+    async for line_number, line in _import_records(lines, file_format):
+        try:
+            if file_format == "csv":
+                values = next(csv.reader([line]))
+                if header is None:
+                    header = [column.strip() for column in values]
+                    continue
+                row = dict(zip(header, values))
+            else:
+                row = json.loads(line)
+            yield line_number, music_schemas.MusicBase.model_validate(row)
+        except (ValueError, ValidationError) as error:
+            yield line_number, str(error).splitlines()[0]
+
+
+async def _insert_import_batch(db: AsyncSession, batch: dict, user_id: int):
+    insert_stmt = (
+        get_dialect_insert(db)(music_model)
+        .on_conflict_do_nothing(index_elements=["title", "artist"])
+        .returning(music_model.id)
+    )
+    rows = [
+        {
+            "title": music.title,
+            "artist": music.artist,
+            "link": music.link,
+            "added_by": user_id,
+        }
+        for music in batch.values()
+    ]
+    result = await db.execute(insert_stmt, rows)
+    inserted = len(result.all())
+    if inserted:
+        await user_service.adjust_user_counters(
+            db=db, user_id=user_id, added_musics_count=inserted
+        )
+    await db.commit()
+    return inserted
+
+
+# * Streams rows into musics in large batches, skipping known (title, artist) pairs
+# * on_progress gets the last line read after every batch
+async def import_musics(
+    db: AsyncSession,
+    lines: AsyncIterator[str],
+    user_id: int,
+    file_format: str = "ndjson",
+    batch_size: int = IMPORT_BATCH_SIZE,
+    on_progress: Callable[[int], Awaitable] | None = None,
+):
+    report = {"inserted": 0, "skipped": 0, "failed": 0, "errors": []}
+
+    def fail(line_number: int, error: str, count: int = 1):
+        report["failed"] += count
+        if len(report["errors"]) < IMPORT_MAX_REPORTED_ERRORS:
+            report["errors"].append({"line": line_number, "error": error})
+
+    async def flush(batch: dict, first_line: int, line_number: int):
+        try:
+            inserted = await _insert_import_batch(db, batch, user_id)
+        except SQLAlchemyError:
+            # The error carries the statement and its rows, keep it out of the report
+            logger.exception(
+                "Import batch of lines %d-%d failed", first_line, line_number
+            )
+            await db.rollback()
+            fail(
+                line_number,
+                f"Rows {first_line}-{line_number} could not be inserted",
+                len(batch),
+            )
+            return
+        report["inserted"] += inserted
+        report["skipped"] += len(batch) - inserted
+        if on_progress is not None:
+            await on_progress(line_number)
+
+    batch = {}
+    first_line = line_number = 0
+    async for line_number, music in _parse_import_rows(lines, file_format):
+        if isinstance(music, str):
+            fail(line_number, music)
+            continue
+
+        key = (music.title, music.artist)
+        if key in batch:
+            report["skipped"] += 1
+            continue
+        if not batch:
+            first_line = line_number
+        batch[key] = music
+        if len(batch) >= batch_size:
+            await flush(batch, first_line, line_number)
+            batch = {}
+
+    if batch:
+        await flush(batch, first_line, line_number)
+    if report["inserted"]:
+        await response_cache.invalidate("musics")
+    return report
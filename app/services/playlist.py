@@ -1,16 +1,21 @@
-from sqlalchemy.exc import IntegrityError, NoResultFound
+from typing import Awaitable, Callable
+from sqlalchemy.exc import IntegrityError
 from fastapi import HTTPException, status
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import subqueryload, selectinload
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import insert, delete
+from sqlalchemy import bindparam, case, delete, func, insert, literal, update
 from app.services import music as music_service
-from app.db.models import playlist_music_association
+from app.services import user as user_service
+from app.db.core import get_dialect_insert, schema_columns
+from app.db.models import POSITION_GAP, playlist_music_association
 from app.db.models import Playlist as playlist_model
 from app.db.models import Music as music_model
+from app.services.cache import response_cache
 from app.schemas import playlist as playlist_schemas
 from app.schemas import music as music_schemas
 
+STREAM_BATCH_SIZE = 500
+
 
 async def create_playlist(
     db: AsyncSession, playlist: playlist_schemas.PlaylistBase, user_id: int
@@ -22,6 +27,9 @@ async def create_playlist(
     )
     db.add(db_playlist)
     try:
+        await user_service.adjust_user_counters(
+            db=db, user_id=user_id, playlists_count=1
+        )
         await db.commit()
         await db.refresh(db_playlist)
     except IntegrityError:
@@ -30,35 +38,123 @@ async def create_playlist(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="playlist already exists",
         )
+    await response_cache.invalidate("playlists")
     return db_playlist
 
 
-async def add_music_to_playlist(
-    db: AsyncSession,
-    requester_id: int,
-    playlist_id: int,
-    music_id: int,
-):
-    # Use selectinload or joinedload to eagerly load musics
+# * Position of the last track of a playlist (0 when empty), inlined into statements
+def _last_position(playlist_id: int):
+    return (
+        select(func.coalesce(func.max(playlist_music_association.c.position), 0))
+        .where(playlist_music_association.c.playlist_id == playlist_id)
+        .scalar_subquery()
+    )
+
+
+# * Renumbers a playlist POSITION_GAP apart, keeping its order. Only runs when an
+# * insert or move finds no room left between two neighbours.
+async def rebalance_playlist(db: AsyncSession, playlist_id: int):
     statement = (
-        select(playlist_model)
-        .options(selectinload(playlist_model.musics))  # Eagerly load musics
-        .filter(playlist_model.id == playlist_id)
+        select(playlist_music_association.c.music_id)
+        .where(playlist_music_association.c.playlist_id == playlist_id)
+        .order_by(playlist_music_association.c.position)
+    )
+    music_ids = (await db.execute(statement)).scalars().all()
+    if not music_ids:
+        return
+
+    # Flip every position negative first, so no new one collides with an old one
+    await db.execute(
+        update(playlist_music_association)
+        .where(playlist_music_association.c.playlist_id == playlist_id)
+        .values(position=-1 - playlist_music_association.c.position)
+    )
+    await db.execute(
+        update(playlist_music_association)
+        .where(
+            playlist_music_association.c.playlist_id == playlist_id,
+            playlist_music_association.c.music_id == bindparam("track_id"),
+        )
+        .values(position=bindparam("new_position")),
+        [
+            {"track_id": music_id, "new_position": index * POSITION_GAP}
+            for index, music_id in enumerate(music_ids, 1)
+        ],
     )
+
+
+# * Position for a track placed right before before_id, or after the last track
+# * when before_id is None. moving_id is the track being moved, if any.
+async def _position_before(
+    db: AsyncSession, playlist_id: int, before_id: int = None, moving_id: int = None
+):
+    if before_id is None:
+        return _last_position(playlist_id) + POSITION_GAP
+
+    for _ in range(2):
+        anchor = await db.scalar(
+            select(playlist_music_association.c.position).where(
+                playlist_music_association.c.playlist_id == playlist_id,
+                playlist_music_association.c.music_id == before_id,
+            )
+        )
+        if anchor is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Music to place before is not in the playlist",
+            )
+
+        statement = select(func.max(playlist_music_association.c.position)).where(
+            playlist_music_association.c.playlist_id == playlist_id,
+            playlist_music_association.c.position < anchor,
+        )
+        if moving_id is not None:
+            statement = statement.where(
+                playlist_music_association.c.music_id != moving_id
+            )
+        previous = await db.scalar(statement)
+        # Positions never go below 0, so the first track leaves room down to -1
+        previous = -1 if previous is None else previous
+        if anchor - previous >= 2:
+            return (anchor + previous) // 2
+        await rebalance_playlist(db=db, playlist_id=playlist_id)
+
+
+# * Owner check that reads one column instead of the playlist and its tracks
+async def check_playlist_owner(
+    db: AsyncSession, playlist_id: int, requester_id: int, detail: str
+):
+    statement = select(playlist_model.owner_id).filter(playlist_model.id == playlist_id)
     result = await db.execute(statement)
-    db_playlist = result.scalar_one_or_none()
-    if not db_playlist:
+    row = result.first()
+    if row is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Playlist not found",
         )
 
-    if db_playlist.owner_id != requester_id:
+    if row.owner_id != requester_id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
-            detail="You can only add music to your own playlists",
+            detail=detail,
         )
 
+
+# * Appends the track, or inserts it right before the before_id track
+async def add_music_to_playlist(
+    db: AsyncSession,
+    requester_id: int,
+    playlist_id: int,
+    music_id: int,
+    before_id: int = None,
+):
+    await check_playlist_owner(
+        db=db,
+        playlist_id=playlist_id,
+        requester_id=requester_id,
+        detail="You can only add music to your own playlists",
+    )
+
     # Fetch music
     db_music = await music_service.get_music_by_id(db=db, music_id=music_id)
     if not db_music:
@@ -83,71 +179,266 @@ async def add_music_to_playlist(
 
     # Insert the new record into the playlist_music association table
     try:
+        position = await _position_before(
+            db=db, playlist_id=playlist_id, before_id=before_id
+        )
         insert_stmt = insert(playlist_music_association).values(
-            playlist_id=playlist_id, music_id=music_id
+            playlist_id=playlist_id, music_id=music_id, position=position
         )
         await db.execute(insert_stmt)
+        await bump_playlist_version(db=db, playlist_id=playlist_id, track_delta=1)
         await db.commit()  # Commit the changes to the DB
     except IntegrityError:
+        # A concurrent add took the same position (or the same track) first
         await db.rollback()
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Error adding music to playlist",
+            status_code=status.HTTP_409_CONFLICT,
+            detail="The playlist changed while adding, try again",
         )
 
-    return music_schemas.MusicOut.model_validate(db_music)
+    await response_cache.invalidate("playlists")
+    return db_music
+
 
+# * Appends many tracks, in the given order, with one
+# * INSERT ... SELECT ... ON CONFLICT DO NOTHING
+async def add_musics_to_playlist(
+    db: AsyncSession,
+    requester_id: int,
+    playlist_id: int,
+    music_ids: list[int],
+):
+    await check_playlist_owner(
+        db=db,
+        playlist_id=playlist_id,
+        requester_id=requester_id,
+        detail="You can only add music to your own playlists",
+    )
+    music_ids = list(dict.fromkeys(music_ids))  # drop repeats, keep order
 
-async def get_playlist_by_id(db: AsyncSession, playlist_id: int):
+    # Slots past the last track in request order, skipped ids just leave a gap
+    slot = case(
+        {music_id: index for index, music_id in enumerate(music_ids, 1)},
+        value=music_model.id,
+    )
+    insert_stmt = (
+        get_dialect_insert(db)(playlist_music_association)
+        .from_select(
+            ["playlist_id", "music_id", "position"],
+            select(
+                literal(playlist_id),
+                music_model.id,
+                _last_position(playlist_id) + slot * POSITION_GAP,
+            ).where(music_model.id.in_(music_ids)),
+        )
+        .on_conflict_do_nothing(index_elements=["playlist_id", "music_id"])
+        .returning(playlist_music_association.c.music_id)
+    )
     try:
-        return await db.get(playlist_model, playlist_id)
-    except NoResultFound:
+        result = await db.execute(insert_stmt)
+    except IntegrityError:
+        # A concurrent append read the same last position and took those slots
+        await db.rollback()
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Playlist not found",
+            status_code=status.HTTP_409_CONFLICT,
+            detail="The playlist changed while adding, try again",
+        )
+    added = set(result.scalars().all())
+
+    # Only ids that were not inserted need telling apart: duplicate or unknown
+    existing = added
+    if len(added) < len(music_ids):
+        statement = select(music_model.id).where(
+            music_model.id.in_(set(music_ids) - added)
+        )
+        result = await db.execute(statement)
+        existing = added | set(result.scalars().all())
+    if added:
+        await bump_playlist_version(
+            db=db, playlist_id=playlist_id, track_delta=len(added)
         )
+    await db.commit()
+    if added:
+        await response_cache.invalidate("playlists")
+
+    outcomes = []
+    for music_id in music_ids:
+        if music_id in added:
+            outcome = "added"
+        elif music_id in existing:
+            outcome = "already_in_playlist"
+        else:
+            outcome = "not_found"
+        outcomes.append({"music_id": music_id, "status": outcome})
+    return outcomes
 
 
-async def get_user_playlists(db: AsyncSession, user_id: int, requester_id: int = None):
+# * Removes many tracks with one DELETE ... WHERE music_id IN (...)
+async def remove_musics_from_playlist(
+    db: AsyncSession,
+    requester_id: int,
+    playlist_id: int,
+    music_ids: list[int],
+):
+    await check_playlist_owner(
+        db=db,
+        playlist_id=playlist_id,
+        requester_id=requester_id,
+        detail="You can only remove music from your own playlists",
+    )
+    music_ids = list(dict.fromkeys(music_ids))  # drop repeats, keep order
+
+    delete_stmt = (
+        delete(playlist_music_association)
+        .where(
+            playlist_music_association.c.playlist_id == playlist_id,
+            playlist_music_association.c.music_id.in_(music_ids),
+        )
+        .returning(playlist_music_association.c.music_id)
+    )
+    result = await db.execute(delete_stmt)
+    removed = set(result.scalars().all())
+    if removed:
+        await bump_playlist_version(
+            db=db, playlist_id=playlist_id, track_delta=-len(removed)
+        )
+    await db.commit()
+    if removed:
+        await response_cache.invalidate("playlists")
+
+    return [
+        {
+            "music_id": music_id,
+            "status": "removed" if music_id in removed else "not_in_playlist",
+        }
+        for music_id in music_ids
+    ]
+
+
+# * Playlists of user_id the requester can see, in id order so a body and the
+# * ETag built from its versions list the same playlists the same way
+def _user_playlists_statement(columns: list, user_id: int, requester_id: int):
     if requester_id is not None and requester_id == user_id:
-        statement = select(playlist_model).filter(
+        statement = select(*columns).filter(
             (playlist_model.owner_id == user_id)
             & ((playlist_model.private == True) | (playlist_model.private == False))
         )
     else:
-        statement = select(playlist_model).filter(
+        statement = select(*columns).filter(
             (playlist_model.owner_id == user_id) & (playlist_model.private == False)
         )
+    return statement.order_by(playlist_model.id)
+
 
+async def get_user_playlists(db: AsyncSession, user_id: int, requester_id: int = None):
+    statement = _user_playlists_statement(
+        schema_columns(playlist_model, playlist_schemas.PlaylistOut),
+        user_id,
+        requester_id,
+    )
     result = await db.execute(statement)
-    return result.scalars().all()
+    return result.all()
 
 
-async def get_playlist_musics(
-    db: AsyncSession, playlist_id: int, requester_id: int = None
+# * (id, version) of every playlist get_user_playlists returns, for its ETag
+async def get_user_playlists_versions(
+    db: AsyncSession, user_id: int, requester_id: int = None
 ):
-    statement = (
-        select(playlist_model)
-        .filter(playlist_model.id == playlist_id)
-        .options(subqueryload(playlist_model.musics))
+    statement = _user_playlists_statement(
+        [playlist_model.id, playlist_model.version], user_id, requester_id
     )
     result = await db.execute(statement)
-    db_playlist = result.scalar_one_or_none()
+    return [tuple(row) for row in result.all()]
+
+
+# * Marks a playlist changed for its ETag, moving track_count by track_delta
+async def bump_playlist_version(
+    db: AsyncSession, playlist_id: int, track_delta: int = 0
+):
+    statement = (
+        update(playlist_model)
+        .where(playlist_model.id == playlist_id)
+        .values(
+            version=playlist_model.version + 1,
+            track_count=playlist_model.track_count + track_delta,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(statement)
+
+
+# * Read rules shared by every playlist track listing
+def _check_playlist_visible(db_playlist, requester_id: int = None):
     if not db_playlist:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Playlist not found",
         )
 
-    if db_playlist.private == True:
-        if requester_id is not None and requester_id == db_playlist.owner_id:
-            return db_playlist
-        else:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized"
+    if db_playlist.private == True and (
+        requester_id is None or requester_id != db_playlist.owner_id
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Unauthorized"
+        )
+    return db_playlist
+
+
+# * Loads only the playlist row (with its version), after checking the requester
+# * may read it
+async def get_readable_playlist(
+    db: AsyncSession, playlist_id: int, requester_id: int = None
+):
+    statement = select(playlist_model).filter(playlist_model.id == playlist_id)
+    result = await db.execute(statement)
+    return _check_playlist_visible(result.scalar_one_or_none(), requester_id)
+
+
+# * Tracks in playlist order, an index range scan on (playlist_id, position)
+def _playlist_musics_statement(playlist_id: int, *extra_columns):
+    return (
+        select(*schema_columns(music_model, music_schemas.MusicOut), *extra_columns)
+        .join(
+            playlist_music_association,
+            playlist_music_association.c.music_id == music_model.id,
+        )
+        .where(playlist_music_association.c.playlist_id == playlist_id)
+        .order_by(playlist_music_association.c.position)
+    )
+
+
+# * A playlist's tracks in order, or one page of them when limit is set, seeking
+# * past after_position. Rows end with their position, for the next cursor.
+# * Check visibility with get_readable_playlist first.
+async def get_playlist_musics(
+    db: AsyncSession,
+    playlist_id: int,
+    limit: int = None,
+    after_position: int = None,
+):
+    statement = _playlist_musics_statement(
+        playlist_id, playlist_music_association.c.position
+    ).limit(limit)
+    if after_position is not None:
+        statement = statement.where(
+            playlist_music_association.c.position > after_position
+        )
+    result = await db.execute(statement)
+    return result.all()
+
+
+# * Yields every track row of a playlist through a server-side cursor, so memory stays
+# * flat for any playlist size. It opens its own session on `bind` because the
+# * request session is closed before a streamed body is sent.
+async def stream_playlist_musics(bind: AsyncEngine, playlist_id: int):
+    async with AsyncSession(bind) as db:
+        result = await db.stream(
+            _playlist_musics_statement(playlist_id).execution_options(
+                yield_per=STREAM_BATCH_SIZE
             )
-    else:
-        return db_playlist
+        )
+        async for row in result:
+            yield row
 
 
 async def remove_music_from_playlist(
@@ -156,25 +447,12 @@ async def remove_music_from_playlist(
     playlist_id: int,
     music_id: int,
 ):
-    # Use selectinload or joinedload to eagerly load musics
-    statement = (
-        select(playlist_model)
-        .options(selectinload(playlist_model.musics))  # Eagerly load musics
-        .filter(playlist_model.id == playlist_id)
+    await check_playlist_owner(
+        db=db,
+        playlist_id=playlist_id,
+        requester_id=requester_id,
+        detail="You can only remove music from your own playlists",
     )
-    result = await db.execute(statement)
-    db_playlist = result.scalar_one_or_none()
-    if not db_playlist:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Playlist not found",
-        )
-
-    if db_playlist.owner_id != requester_id:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You can only remove music from your own playlists",
-        )
 
     # Fetch music
     db_music = await music_service.get_music_by_id(db=db, music_id=music_id)
@@ -205,6 +483,7 @@ async def remove_music_from_playlist(
             playlist_music_association.c.music_id == music_id,
         )
         await db.execute(delete_stmt)
+        await bump_playlist_version(db=db, playlist_id=playlist_id, track_delta=-1)
         await db.commit()  # Commit the changes to the DB
     except IntegrityError:
         await db.rollback()
@@ -213,25 +492,331 @@ async def remove_music_from_playlist(
             detail="Error removing music from playlist",
         )
 
-    return music_schemas.MusicOut.model_validate(db_music)
+    await response_cache.invalidate("playlists")
+    return db_music
+
+
+# * Moves a track right before the before_id track, or to the end. Only the moved
+# * row is written, unless the playlist has to be renumbered to make room.
+async def move_music_in_playlist(
+    db: AsyncSession,
+    requester_id: int,
+    playlist_id: int,
+    music_id: int,
+    before_id: int = None,
+):
+    await check_playlist_owner(
+        db=db,
+        playlist_id=playlist_id,
+        requester_id=requester_id,
+        detail="You can only reorder your own playlists",
+    )
+
+    try:
+        position = await _position_before(
+            db=db, playlist_id=playlist_id, before_id=before_id, moving_id=music_id
+        )
+        update_stmt = (
+            update(playlist_music_association)
+            .where(
+                playlist_music_association.c.playlist_id == playlist_id,
+                playlist_music_association.c.music_id == music_id,
+            )
+            .values(position=position)
+            .returning(playlist_music_association.c.music_id)
+        )
+        result = await db.execute(update_stmt)
+        if result.first() is None:
+            await db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Music is not in the playlist",
+            )
+        await bump_playlist_version(db=db, playlist_id=playlist_id)
+        await db.commit()
+    except IntegrityError:
+        # Another edit took the same position first
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="The playlist changed while moving, try again",
+        )
+
+    await response_cache.invalidate("playlists")
+    return {"music_id": music_id, "status": "moved"}
+
+
+# * Loads the playlists (id, name, owner, privacy) after checking the requester
+# * may read every one of them, with the rules of get_readable_playlist
+async def get_readable_playlists(
+    db: AsyncSession, playlist_ids: list[int], requester_id: int = None
+):
+    statement = select(
+        playlist_model.id,
+        playlist_model.name,
+        playlist_model.owner_id,
+        playlist_model.private,
+    ).where(playlist_model.id.in_(playlist_ids))
+    found = {row.id: row for row in (await db.execute(statement)).all()}
+    return [
+        _check_playlist_visible(found.get(playlist_id), requester_id)
+        for playlist_id in playlist_ids
+    ]
+
+
+# * Tracks of the playlists the requester may read, each with the index of its
+# * playlist in playlist_ids (rank) and its position there
+def _readable_tracks(playlist_ids: list[int], requester_id: int):
+    readable = select(playlist_model.id).where(
+        playlist_model.id.in_(playlist_ids),
+        (playlist_model.private == False) | (playlist_model.owner_id == requester_id),
+    )
+    rank = case(
+        {playlist_id: index for index, playlist_id in enumerate(playlist_ids)},
+        value=playlist_music_association.c.playlist_id,
+    )
+    return select(
+        playlist_music_association.c.music_id,
+        rank.label("rank"),
+        playlist_music_association.c.position,
+    ).where(playlist_music_association.c.playlist_id.in_(readable))
+
+
+# * (music_id, rank, position) of the tracks a set operation keeps. The first
+# * playlist's order wins, union then adds what the next ones bring, in order.
+def _combined_tracks(operation: str, playlist_ids: list[int], requester_id: int):
+    tracks = _readable_tracks(playlist_ids, requester_id).subquery()
+    others = _readable_tracks(playlist_ids, requester_id).subquery()
+    if operation == "union":
+        first_seen = func.row_number().over(
+            partition_by=tracks.c.music_id,
+            order_by=(tracks.c.rank, tracks.c.position),
+        )
+        ranked = select(tracks, first_seen.label("occurrence")).subquery()
+        return select(ranked.c.music_id, ranked.c.rank, ranked.c.position).where(
+            ranked.c.occurrence == 1
+        )
+
+    statement = select(tracks.c.music_id, tracks.c.rank, tracks.c.position).where(
+        tracks.c.rank == 0
+    )
+    if operation == "intersection":
+        in_every = (
+            select(others.c.music_id)
+            .group_by(others.c.music_id)
+            .having(func.count(others.c.rank.distinct()) == len(playlist_ids))
+        )
+        return statement.where(tracks.c.music_id.in_(in_every))
+    in_others = select(others.c.music_id).where(others.c.rank > 0)
+    return statement.where(tracks.c.music_id.not_in(in_others))
+
+
+# * INSERT ... SELECT of the chosen tracks into a playlist, numbered POSITION_GAP
+# * apart after its last track, in (rank, position) order
+def _copy_tracks_statement(db: AsyncSession, playlist_id: int, tracks):
+    chosen = tracks.subquery()
+    position = (
+        _last_position(playlist_id)
+        + func.row_number().over(order_by=(chosen.c.rank, chosen.c.position))
+        * POSITION_GAP
+    )
+    already_there = select(playlist_music_association.c.music_id).where(
+        playlist_music_association.c.playlist_id == playlist_id
+    )
+    return (
+        get_dialect_insert(db)(playlist_music_association)
+        .from_select(
+            ["playlist_id", "music_id", "position"],
+            select(literal(playlist_id), chosen.c.music_id, position).where(
+                chosen.c.music_id.not_in(already_there)
+            ),
+        )
+        .on_conflict_do_nothing(index_elements=["playlist_id", "music_id"])
+    )
+
+
+# * Bumps the playlist after tracks were copied in and returns it
+async def _finish_track_copy(
+    db: AsyncSession,
+    playlist_id: int,
+    added: int,
+    before_commit: Callable[[dict], Awaitable] | None = None,
+):
+    statement = (
+        update(playlist_model)
+        .where(playlist_model.id == playlist_id)
+        .values(
+            version=playlist_model.version + 1,
+            track_count=playlist_model.track_count + added,
+        )
+        .returning(*schema_columns(playlist_model, playlist_schemas.PlaylistOut))
+        .execution_options(synchronize_session=False)
+    )
+    row = (await db.execute(statement)).first()
+    if before_commit is not None:
+        await before_commit(row._asdict())
+    await db.commit()
+    await response_cache.invalidate("playlists")
+    return row._asdict()
+
+
+# * A new playlist of the requester holding the chosen tracks
+async def _create_playlist_with_tracks(
+    db: AsyncSession,
+    requester_id: int,
+    name: str,
+    private: bool,
+    tracks,
+    before_commit: Callable[[dict], Awaitable] | None = None,
+):
+    statement = (
+        insert(playlist_model)
+        .values(name=name, private=private, owner_id=requester_id)
+        .returning(playlist_model.id)
+    )
+    playlist_id = (await db.execute(statement)).scalar_one()
+    result = await db.execute(_copy_tracks_statement(db, playlist_id, tracks))
+    await user_service.adjust_user_counters(
+        db=db, user_id=requester_id, playlists_count=1
+    )
+    return await _finish_track_copy(
+        db, playlist_id, result.rowcount, before_commit=before_commit
+    )
+
 
+# * Copies a readable playlist, tracks and order included, into a new playlist
+# * before_commit gets the new playlist inside the transaction that creates it
+async def copy_playlist(
+    db: AsyncSession,
+    requester_id: int,
+    playlist_id: int,
+    playlist: playlist_schemas.PlaylistCopy,
+    before_commit: Callable[[dict], Awaitable] | None = None,
+):
+    (source,) = await get_readable_playlists(db, [playlist_id], requester_id)
+    return await _create_playlist_with_tracks(
+        db=db,
+        requester_id=requester_id,
+        name=playlist.name or f"{source.name} (copy)",
+        private=source.private if playlist.private is None else playlist.private,
+        tracks=_combined_tracks("union", [playlist_id], requester_id),
+        before_commit=before_commit,
+    )
+
+
+# * Union, intersection or difference (first minus the rest) of readable
+# * playlists, into a new playlist. before_commit as in copy_playlist
+async def combine_playlists(
+    db: AsyncSession,
+    requester_id: int,
+    playlist: playlist_schemas.PlaylistCombine,
+    before_commit: Callable[[dict], Awaitable] | None = None,
+):
+    playlist_ids = list(dict.fromkeys(playlist.playlist_ids))
+    await get_readable_playlists(db, playlist_ids, requester_id)
+    return await _create_playlist_with_tracks(
+        db=db,
+        requester_id=requester_id,
+        name=playlist.name,
+        private=playlist.private,
+        tracks=_combined_tracks(playlist.operation, playlist_ids, requester_id),
+        before_commit=before_commit,
+    )
+
+
+# * Appends the tracks of a readable playlist that the requester's playlist does
+# * not have yet, in the source order
+async def merge_playlist(
+    db: AsyncSession, requester_id: int, playlist_id: int, source_id: int
+):
+    await check_playlist_owner(
+        db=db,
+        playlist_id=playlist_id,
+        requester_id=requester_id,
+        detail="You can only merge into your own playlists",
+    )
+    await get_readable_playlists(db, [source_id], requester_id)
 
+    tracks = _combined_tracks("union", [source_id], requester_id)
+    try:
+        result = await db.execute(_copy_tracks_statement(db, playlist_id, tracks))
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Playlist changed while merging, try again",
+        )
+    return await _finish_track_copy(db, playlist_id, result.rowcount)
+
+
+# * Rows of the playlist if requester_id owns it, for owner-checked statements
+def _owned_playlist(playlist_id: int, requester_id: int):
+    return (playlist_model.id == playlist_id) & (
+        playlist_model.owner_id == requester_id
+    )
+
+
+# * The owner-checked statement matched nothing, one lookup tells 404 from 403
+async def _raise_playlist_miss(
+    db: AsyncSession, playlist_id: int, requester_id: int, detail: str
+):
+    await check_playlist_owner(
+        db=db, playlist_id=playlist_id, requester_id=requester_id, detail=detail
+    )
+    # Owners never change, so this only happens if it was created meanwhile
+    raise HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail="Playlist not found",
+    )
+
+
+# * A single UPDATE ... RETURNING when the requester owns the playlist
 async def update_playlist(
-    db: AsyncSession, playlist_id: int, playlist: playlist_schemas.PlaylistUpdate
+    db: AsyncSession,
+    requester_id: int,
+    playlist_id: int,
+    playlist: playlist_schemas.PlaylistUpdate,
 ):
-    db_playlist = await get_playlist_by_id(db=db, playlist_id=playlist_id)
+    values = {"version": playlist_model.version + 1}
     if playlist.name:
-        db_playlist.name = playlist.name
+        values["name"] = playlist.name
     if playlist.private is not None:
-        db_playlist.private = playlist.private
+        values["private"] = playlist.private
+
+    statement = (
+        update(playlist_model)
+        .where(_owned_playlist(playlist_id, requester_id))
+        .values(values)
+        .returning(*schema_columns(playlist_model, playlist_schemas.PlaylistOut))
+    )
+    row = (await db.execute(statement)).first()
+    if row is None:
+        await _raise_playlist_miss(
+            db, playlist_id, requester_id, "You can only update your own playlists"
+        )
 
     await db.commit()
-    await db.refresh(db_playlist)
-    return db_playlist
+    await response_cache.invalidate("playlists")
+    return row._asdict()
 
 
-async def delete_playlist(db: AsyncSession, playlist_id: int):
-    db_playlist = await get_playlist_by_id(db=db, playlist_id=playlist_id)
-    await db.delete(db_playlist)
+# * One owner-guarded DELETE ... RETURNING, no row back means a miss
+async def delete_playlist(db: AsyncSession, requester_id: int, playlist_id: int):
+    # Its tracks go with it through ON DELETE CASCADE
+    statement = (
+        delete(playlist_model)
+        .where(_owned_playlist(playlist_id, requester_id))
+        .returning(*schema_columns(playlist_model, playlist_schemas.PlaylistOut))
+    )
+    row = (await db.execute(statement)).first()
+    if row is None:
+        await _raise_playlist_miss(
+            db, playlist_id, requester_id, "You can only delete your own playlists"
+        )
+
+    await user_service.adjust_user_counters(
+        db=db, user_id=requester_id, playlists_count=-1
+    )
     await db.commit()
-    return db_playlist
+    await response_cache.invalidate("playlists")
+    return row._asdict()
@@ -1,14 +1,21 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError, NoResultFound
 from sqlalchemy.future import select
+from sqlalchemy import delete, event, func, update
+from sqlalchemy.orm import Session
 from fastapi import HTTPException, status
 from ..services import auth as auth_services
+from ..services.cache import response_cache
+from ..db.core import schema_columns
 from ..db.models import User as user_model
+from ..db.models import Music as music_model
+from ..db.models import Playlist as playlist_model
+from ..db.models import playlist_music_association
 from ..schemas import user as user_schemas
 
 
 async def create_user(db: AsyncSession, user: user_schemas.UserCreate):
-    hashed_password = auth_services.get_password_hash(
+    hashed_password = await auth_services.get_password_hash(
         user.password
     )  # Hash the password
     db_user = user_model(
@@ -39,10 +46,89 @@ async def get_user(db: AsyncSession, user_id: int):
         )
 
 
-async def get_users(db: AsyncSession, skip: int = 0, limit: int = 10):
-    statement = select(user_model).offset(skip).limit(limit)
+async def get_user_version(db: AsyncSession, user_id: int):
+    statement = select(user_model.version).where(user_model.id == user_id)
     result = await db.execute(statement)
-    return result.scalars().all()
+    return result.scalar_one_or_none()
+
+
+# * after_id switches to keyset paging (seek on the primary key), skip is legacy
+async def get_users(
+    db: AsyncSession, skip: int = 0, limit: int = 10, after_id: int = None
+):
+    statement = (
+        select(*schema_columns(user_model, user_schemas.UserOut))
+        .order_by(user_model.id)
+        .limit(limit)
+    )
+    if after_id is not None:
+        statement = statement.where(user_model.id > after_id)
+    else:
+        statement = statement.offset(skip)
+    result = await db.execute(statement)
+    return result.all()
+
+
+# * Moves a user's library counters in the caller's transaction, e.g.
+# * adjust_user_counters(db, user_id, playlists_count=1)
+async def adjust_user_counters(db: AsyncSession, user_id: int, **deltas: int):
+    statement = (
+        update(user_model)
+        .where(user_model.id == user_id)
+        .values(
+            {
+                **{
+                    name: getattr(user_model, name) + delta
+                    for name, delta in deltas.items()
+                },
+                "version": user_model.version + 1,
+            }
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(statement)
+    # The cached principal (/users/me) carries the counters too
+    db.sync_session.info.setdefault("stale_principals", set()).add(user_id)
+
+
+# * Cached principals are dropped only once their counters are committed, so a
+# * concurrent request cannot cache the old values again in between
+@event.listens_for(Session, "after_commit")
+def _invalidate_stale_principals(session: Session):
+    for user_id in session.info.pop("stale_principals", ()):
+        auth_services.invalidate_user(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_stale_principals(session: Session):
+    session.info.pop("stale_principals", None)
+
+
+# * Other users' playlists lose the tracks this user added when they are deleted
+async def _drop_user_musics_from_playlists(db: AsyncSession, user_id: int):
+    user_tracks = (
+        select(playlist_music_association.c.playlist_id)
+        .join(music_model, music_model.id == playlist_music_association.c.music_id)
+        .where(music_model.added_by == user_id)
+    )
+    removed = (
+        user_tracks.with_only_columns(func.count())
+        .where(playlist_music_association.c.playlist_id == playlist_model.id)
+        .scalar_subquery()
+    )
+    statement = (
+        update(playlist_model)
+        .where(
+            playlist_model.id.in_(user_tracks),
+            playlist_model.owner_id != user_id,
+        )
+        .values(
+            track_count=playlist_model.track_count - removed,
+            version=playlist_model.version + 1,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(statement)
 
 
 # ! This is not updating user password
@@ -54,14 +140,30 @@ async def update_user(
         db_user.username = updated_user.username
     if updated_user.email:
         db_user.email = updated_user.email
+    db_user.version = user_model.version + 1
     await db.commit()
     await db.refresh(db_user)
+    auth_services.invalidate_user(user_id)
     return db_user
 
 
 async def delete_user(db: AsyncSession, user_id: int):
-    db_user = await get_user(db=db, user_id=user_id)
+    await _drop_user_musics_from_playlists(db=db, user_id=user_id)
+    # Their musics, playlists and playlist rows go with them through ON DELETE
+    # CASCADE, in this transaction and without loading any of them
+    statement = (
+        delete(user_model)
+        .where(user_model.id == user_id)
+        .returning(*schema_columns(user_model, user_schemas.UserOut))
+    )
+    row = (await db.execute(statement)).first()
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found",
+        )
 
-    await db.delete(db_user)
     await db.commit()
-    return db_user
+    auth_services.invalidate_user(user_id)
+    await response_cache.invalidate("musics", "playlists")
+    return row._asdict()
@@ -0,0 +1,197 @@
+import asyncio
+import math
+import re
+import time
+from collections import OrderedDict
+from typing import Callable
+from fastapi.responses import JSONResponse
+
+
+def parse_rate_limits(value: str) -> dict[str, tuple[float, float]]:
+    """Parses "name=rate/burst,..." into {name: (tokens per second, burst)}."""
+    limits = {}
+    for pair in filter(None, (part.strip() for part in value.split(","))):
+        name, _, limit = pair.partition("=")
+        rate, _, burst = limit.partition("/")
+        limits[name.strip()] = (float(rate), float(burst or rate))
+    return limits
+
+
+class RateLimiter:
+    """One token bucket per client, refilled at `rate` (> 0) tokens a second up
+    to `burst`.
+
+    Buckets are refilled lazily when their client comes back, so a request costs
+    a dict lookup and some arithmetic. Past `max_clients` the least recently seen
+    client is forgotten, which only ever gives it a full bucket again.
+    """
+
+    def __init__(self, rate: float, burst: float, max_clients: int = 100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self.limited = 0
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    # * Takes a token, or returns how many seconds until the next one
+    def acquire(self, client_key: str) -> float:
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(client_key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            self.limited += 1
+            wait = (1 - tokens) / self.rate
+
+        self._buckets[client_key] = (tokens, now)
+        if len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        self._buckets.clear()
+        self.limited = 0
+
+    def stats(self) -> dict:
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "clients": len(self._buckets),
+            "limited": self.limited,
+        }
+
+
+class AdmissionController:
+    """Caps the requests in flight so the pool never has a long queue behind it.
+
+    Up to `max_concurrent` requests run at once, sized after the connection pool.
+    Up to `max_queue` more wait at most `queue_timeout` seconds for a slot; past
+    that they are turned away straight away, so a spike fails some requests fast
+    instead of making every request wait for `pool_timeout`.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.running = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._slots = asyncio.Semaphore(max_concurrent)
+
+    async def enter(self) -> bool:
+        if self._slots.locked():
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                return False
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                return False
+            finally:
+                self.waiting -= 1
+        else:
+            await self._slots.acquire()
+
+        self.running += 1
+        self.admitted += 1
+        return True
+
+    def leave(self):
+        self.running -= 1
+        self._slots.release()
+
+    def reset(self):
+        self.admitted = 0
+        self.rejected = 0
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "running": self.running,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+def _rejection(status_code: int, detail: str, retry_after: float) -> JSONResponse:
+    return JSONResponse(
+        {"detail": detail},
+        status_code=status_code,
+        headers={"Retry-After": str(max(math.ceil(retry_after), 1))},
+    )
+
+
+class AdmissionMiddleware:
+    """Rate limits each client, then admits the request through the controller.
+
+    Requests matching one of `routes` ({name: (method, path regex)}) draw from
+    the bucket of the same name in `limiters`, every other request from the
+    "default" one. `client_key(scope)` names the client, by default its address.
+    Paths in `exempt_paths` (probes, metrics) skip both checks.
+    """
+
+    def __init__(
+        self,
+        app,
+        controller: AdmissionController | None,
+        limiters: dict[str, RateLimiter],
+        routes: dict[str, tuple[str, str]],
+        client_key: Callable[[dict], str] | None = None,
+        exempt_paths: tuple[str, ...] = (),
+    ):
+        self.app = app
+        self.controller = controller
+        self.limiters = limiters
+        self.routes = [
+            (name, method, re.compile(pattern))
+            for name, (method, pattern) in routes.items()
+            if name in limiters
+        ]
+        self.client_key = client_key or client_address
+        self.exempt_paths = set(exempt_paths)
+
+    def _limiter_for(self, scope) -> RateLimiter | None:
+        for name, method, pattern in self.routes:
+            if scope["method"] == method and pattern.fullmatch(scope["path"]):
+                return self.limiters[name]
+        return self.limiters.get("default")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        limiter = self._limiter_for(scope)
+        if limiter is not None:
+            wait = limiter.acquire(self.client_key(scope))
+            if wait:
+                response = _rejection(429, "Too many requests", wait)
+                await response(scope, receive, send)
+                return
+
+        if self.controller is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not await self.controller.enter():
+            response = _rejection(503, "Server is busy, try again shortly", 1)
+            await response(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.leave()
+
+
+def client_address(scope) -> str:
+    client = scope.get("client")
+    return client[0] if client else "unknown"
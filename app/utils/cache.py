@@ -0,0 +1,248 @@
+import asyncio
+import json
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries also expire after a time-to-live.
+
+    Not shared between worker processes, so anything cached here can be stale
+    for at most `ttl` seconds on workers that did not see the invalidation.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, tuple[Any, float]] = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    # * ttl overrides the cache default for this entry only
+    def set(self, key: Hashable, value: Any, ttl: float = None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0 or self.max_size <= 0:
+            return
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+class MemoryCacheBackend:
+    """Per-process LRU backend, the default when no cache server is configured."""
+
+    def __init__(self, max_size: int):
+        self._entries = TTLCache(max_size=max_size, ttl=60)
+        self._counters: dict[str, int] = {}
+
+    async def get(self, key: str) -> bytes | None:
+        if key in self._counters:
+            return str(self._counters[key]).encode()
+        return self._entries.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: int):
+        self._entries.set(key, value, ttl=ttl)
+
+    async def incr(self, key: str) -> int:
+        self._counters[key] = self._counters.get(key, 0) + 1
+        return self._counters[key]
+
+    async def clear(self):
+        self._entries.clear()
+        self._counters.clear()
+
+
+class RedisCacheBackend:
+    """Speaks the Redis protocol (RESP) over one connection, no client library needed.
+
+    Works against Redis and anything compatible with it (Valkey, KeyDB or a
+    local stand-in). Commands share the connection one at a time.
+    """
+
+    def __init__(self, url: str, timeout: float = 0.5):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._lock = asyncio.Lock()
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+
+    async def get(self, key: str) -> bytes | None:
+        return await self._command("GET", key)
+
+    async def set(self, key: str, value: bytes, ttl: int):
+        await self._command("SET", key, value, "EX", ttl)
+
+    async def incr(self, key: str) -> int:
+        return await self._command("INCR", key)
+
+    async def clear(self):
+        await self._command("FLUSHDB")
+
+    async def _command(self, *args):
+        async with self._lock:
+            try:
+                return await asyncio.wait_for(self._send(*args), self.timeout)
+            except BaseException:
+                # A half-read reply would corrupt every later command, start over
+                await self._close()
+                raise
+
+    async def _send(self, *args):
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(
+                self.host, self.port
+            )
+            if self.password:
+                await self._roundtrip("AUTH", self.password)
+            if self.db:
+                await self._roundtrip("SELECT", self.db)
+        return await self._roundtrip(*args)
+
+    async def _roundtrip(self, *args):
+        parts = [arg if isinstance(arg, bytes) else str(arg).encode() for arg in args]
+        payload = b"*%d\r\n" % len(parts) + b"".join(
+            b"$%d\r\n%s\r\n" % (len(part), part) for part in parts
+        )
+        self._writer.write(payload)
+        await self._writer.drain()
+        return await self._read_reply()
+
+    async def _read_reply(self):
+        line = (await self._reader.readuntil(b"\r\n"))[:-2]
+        kind, rest = line[:1], line[1:]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RuntimeError(f"Cache server error: {rest.decode()}")
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length == -1:
+                return None
+            return (await self._reader.readexactly(length + 2))[:-2]
+        if kind == b"*":
+            return [await self._read_reply() for _ in range(max(int(rest), 0))]
+        raise RuntimeError(f"Unexpected cache server reply: {line!r}")
+
+    async def _close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+
+class ResponseCache:
+    """Serialized responses grouped in namespaces that writes invalidate.
+
+    Each namespace has a generation counter that is part of every key, so
+    invalidating a namespace is a single INCR and old entries just age out.
+    Backend failures count as misses and never fail a request.
+    """
+
+    def __init__(self, backend, ttls: dict[str, int], default_ttl: int):
+        self.backend = backend
+        self.ttls = ttls
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    async def _key(self, namespace: str, key: str) -> str:
+        generation = await self.backend.get(f"generation:{namespace}")
+        return f"response:{namespace}:{int(generation or 0)}:{key}"
+
+    async def get(self, namespace: str, key: str) -> tuple[bytes, dict] | None:
+        try:
+            value = await self.backend.get(await self._key(namespace, key))
+        except Exception:
+            logger.warning("Response cache read failed", exc_info=True)
+            self.errors += 1
+            return None
+
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        headers, body = value.split(b"\n", 1)
+        return body, json.loads(headers)
+
+    async def set(
+        self,
+        namespace: str,
+        key: str,
+        route: str,
+        body: bytes,
+        headers: dict,
+        max_ttl: float | None = None,
+    ):
+        ttl = self.ttls.get(route, self.default_ttl)
+        if max_ttl is not None:
+            ttl = min(ttl, math.ceil(max_ttl))
+        if ttl <= 0:
+            return
+        value = json.dumps(headers).encode() + b"\n" + body
+        try:
+            await self.backend.set(await self._key(namespace, key), value, ttl)
+        except Exception:
+            logger.warning("Response cache write failed", exc_info=True)
+            self.errors += 1
+
+    async def invalidate(self, *namespaces: str):
+        for namespace in namespaces:
+            try:
+                await self.backend.incr(f"generation:{namespace}")
+            except Exception:
+                logger.warning("Response cache invalidation failed", exc_info=True)
+                self.errors += 1
+
+    async def clear(self):
+        await self.backend.clear()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "errors": self.errors}
@@ -0,0 +1,58 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+from fastapi import HTTPException, status
+
+
+class BoundedExecutor:
+    """Runs blocking calls on a dedicated thread pool instead of the event loop.
+
+    At most `max_pending` calls may be running or queued at once; callers past
+    that limit get a 503 straight away rather than waiting behind the queue. A
+    call counts until its thread is done with it, even when the request that
+    made it was cancelled; `completed` counts the calls that returned.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int, name: str):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix=name
+        )
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, try again shortly",
+                headers={"Retry-After": "1"},
+            )
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, fn, *args)
+        self.pending += 1
+        future.add_done_callback(self._finished)
+        # A cancelled caller leaves the call running, it stays pending until done
+        return await asyncio.shield(future)
+
+    def _finished(self, future: asyncio.Future):
+        self.pending -= 1
+        if not future.cancelled() and future.exception() is None:
+            self.completed += 1
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "running": min(self.pending, self.max_workers),
+            "queued": max(self.pending - self.max_workers, 0),
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
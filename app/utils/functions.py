@@ -1,4 +1,11 @@
-from fastapi import HTTPException, status
+import base64
+import binascii
+import codecs
+import hashlib
+import json
+from typing import AsyncIterator
+import orjson
+from fastapi import HTTPException, Request, Response, status
 
 
 def checkUserAuthenticity(user_id: int, current_user_id: int):
@@ -7,3 +14,100 @@ def checkUserAuthenticity(user_id: int, current_user_id: int):
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You do not have permission for this action",
         )
+
+
+# * Cursors are opaque to clients: urlsafe base64 over a small JSON object
+def encode_cursor(values: dict) -> str:
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+# * Decodes a cursor and returns the requested keys in order
+def decode_cursor(cursor: str, *keys: str) -> tuple:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return tuple(values[key] for key in keys)
+    except (ValueError, TypeError, KeyError, binascii.Error):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor",
+        )
+
+
+# * Sets the X-Next-Cursor header when a full page was returned
+def set_next_cursor(response: Response, rows: list, limit: int):
+    if rows and len(rows) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor({"id": rows[-1].id})
+
+
+# * Returns the id a keyset page should seek past, None for legacy offset paging
+def get_cursor_id(cursor: str | None) -> int | None:
+    if cursor is None:
+        return None
+    (last_id,) = decode_cursor(cursor, "id")
+    if not isinstance(last_id, int):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor",
+        )
+    return last_id
+
+
+# * Splits a stream of byte chunks into text lines without buffering the whole body
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+# * True when the client sent Prefer: respond-async (RFC 7240) and can take a 202
+def prefers_async(request: Request) -> bool:
+    preferences = request.headers.get("prefer", "").split(",")
+    return any(
+        preference.split(";")[0].strip().lower() == "respond-async"
+        for preference in preferences
+    )
+
+
+# * Strong ETag built from whatever versions a response body depends on
+def make_etag(*parts) -> str:
+    return '"%s"' % hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
+
+
+# * Sets the ETag and returns a 304 response when the client already has it
+def check_etag(request: Request, response: Response, etag: str) -> Response | None:
+    response.headers["ETag"] = etag
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return None
+
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    if etag in tags or "*" in tags:
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
+        )
+    return None
+
+
+# * Encodes selected rows once with orjson, without response model validation.
+# * Only for rows selected with schema_columns, whose keys already are the schema's
+def dump_rows(rows) -> bytes:
+    return orjson.dumps([row._asdict() for row in rows])
+
+
+# * Wraps an encoded JSON body, keeping the headers set on the injected response
+def json_response(body: bytes, response: Response) -> Response:
+    headers = {
+        name: value
+        for name, value in response.headers.items()
+        if name not in ("content-length", "content-type")
+    }
+    return Response(content=body, media_type="application/json", headers=headers)
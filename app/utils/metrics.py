@@ -0,0 +1,230 @@
+import contextvars
+import logging
+import time
+from collections import defaultdict
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class RequestStats:
+    """SQL work done on behalf of one request, filled in by the engine events."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+# Set by the middleware for the duration of a request, read by the engine events
+request_stats: contextvars.ContextVar[RequestStats | None] = contextvars.ContextVar(
+    "request_stats", default=None
+)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.values = defaultdict(float)
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        self.values[labels] += amount
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} counter",
+        ]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.labels, labels)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labels: tuple, buckets: tuple):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = buckets
+        self.counts = {}  # labels -> per bucket counts, the last one is +Inf
+        self.sums = defaultdict(float)
+
+    def observe(self, labels: tuple, value: float):
+        counts = self.counts.setdefault(labels, [0] * (len(self.buckets) + 1))
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+                break
+        else:
+            counts[-1] += 1
+        self.sums[labels] += value
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        for labels, counts in sorted(self.counts.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                bucket = _labels(self.labels, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{bucket} {cumulative}")
+            label_text = _labels(self.labels, labels)
+            lines.append(f"{self.name}_sum{label_text} {self.sums[labels]:g}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+def render_gauges(name: str, documentation: str, values: dict) -> list[str]:
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} gauge"]
+    for labels, value in values.items():
+        lines.append(f"{name}{_labels(*labels)} {value:g}")
+    return lines
+
+
+REQUESTS = Counter(
+    "http_requests_total",
+    "Requests by route and status.",
+    ("method", "route", "status"),
+)
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Time to the response headers, by route.",
+    ("method", "route"),
+    LATENCY_BUCKETS,
+)
+REQUEST_DB_SECONDS = Histogram(
+    "http_request_db_seconds",
+    "Time spent in SQL statements per request, by route.",
+    ("method", "route"),
+    LATENCY_BUCKETS,
+)
+REQUEST_QUERIES = Histogram(
+    "http_request_queries",
+    "SQL statements per request, by route.",
+    ("method", "route"),
+    QUERY_COUNT_BUCKETS,
+)
+SLOW_QUERIES = Counter("db_slow_queries_total", "Statements over the slow threshold.")
+REQUEST_METRICS = (REQUESTS, REQUEST_SECONDS, REQUEST_DB_SECONDS, REQUEST_QUERIES)
+
+
+# * Types of the bound parameters, never their values
+def parameter_shape(parameters, executemany: bool = False):
+    if executemany:
+        first = parameters[0] if parameters else ()
+        return f"{len(parameters)} x {parameter_shape(first)}"
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    return [type(value).__name__ for value in parameters or ()]
+
+
+class SqlInstrumentation:
+    """Times every statement on every Engine, including the test and replica ones.
+
+    Statements run on behalf of a request add to its RequestStats, and any
+    statement slower than `slow_query_seconds` is logged (None disables the log).
+    """
+
+    def __init__(self, slow_query_seconds: float | None):
+        self.slow_query_seconds = slow_query_seconds
+
+    def install(self):
+        if not event.contains(Engine, "before_cursor_execute", self.before_execute):
+            event.listen(Engine, "before_cursor_execute", self.before_execute)
+            event.listen(Engine, "after_cursor_execute", self.after_execute)
+            event.listen(Engine, "handle_error", self.on_error)
+
+    def before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        stats = request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+
+        if self.slow_query_seconds is not None and elapsed >= self.slow_query_seconds:
+            SLOW_QUERIES.inc()
+            logger.warning(
+                "Slow query (%.1f ms): %s parameters=%s",
+                elapsed * 1000,
+                statement[:2000],
+                parameter_shape(parameters, executemany),
+            )
+
+    # * A failed statement never reaches after_execute, drop its start time here
+    def on_error(self, exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_start"):
+            connection.info["query_start"].pop()
+
+
+class MetricsMiddleware:
+    """Reports each request's SQL totals in Server-Timing and records route metrics."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        start = time.perf_counter()
+        responded = False
+
+        def record(status_code) -> float:
+            elapsed = time.perf_counter() - start
+            route = scope.get("route")
+            labels = (scope["method"], route.path if route else "unmatched")
+            REQUESTS.inc((*labels, str(status_code)))
+            REQUEST_SECONDS.observe(labels, elapsed)
+            REQUEST_DB_SECONDS.observe(labels, stats.db_seconds)
+            REQUEST_QUERIES.observe(labels, stats.queries)
+            return elapsed
+
+        async def send_with_timing(message):
+            nonlocal responded
+            if message["type"] == "http.response.start":
+                responded = True
+                elapsed = record(message["status"])
+                timing = (
+                    f'db;dur={stats.db_seconds * 1000:.2f};desc="{stats.queries} queries"'
+                    f", total;dur={elapsed * 1000:.2f}"
+                )
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"server-timing", timing.encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        except Exception:
+            # The 500 goes out from ServerErrorMiddleware, outside this one
+            if not responded:
+                record(500)
+            raise
+        finally:
+            request_stats.reset(token)
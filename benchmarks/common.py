@@ -0,0 +1,145 @@
+import os
+import time
+import statistics
+
+# The app settings are read at import time, so benchmarks get safe defaults
+# before anything from app/ is imported. A real .env or exported DATABASE_URL wins.
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///./bench.db")
+os.environ.setdefault("JWT_SECRET", "benchmark-secret")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "60")
+# One client drives all the load here, so rate limits and admission control are off
+os.environ.setdefault("RATE_LIMIT_PER_SECOND", "0")
+os.environ.setdefault("RATE_LIMITS", "")
+os.environ.setdefault("ADMISSION_MAX_CONCURRENT", "0")
+
+from sqlalchemy import func, insert, literal, select, update  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine  # noqa: E402
+from app.config.setup import Base  # noqa: E402
+from app.db.pool import enable_foreign_keys  # noqa: E402
+from app.db.models import User as user_model, Music as music_model  # noqa: E402
+from app.db.models import Playlist as playlist_model  # noqa: E402
+from app.db.models import POSITION_GAP, playlist_music_association  # noqa: E402
+from app.db.core import sync_id_sequences  # noqa: E402
+
+BENCH_USER_ID = 1
+BATCH_SIZE = 10_000
+
+
+def bench_username(user_id: int) -> str:
+    return "bench_user" if user_id == BENCH_USER_ID else f"bench_user_{user_id}"
+
+
+def get_engine(database_url: str = None) -> AsyncEngine:
+    return enable_foreign_keys(
+        create_async_engine(database_url or os.environ["DATABASE_URL"])
+    )
+
+
+# * Creates the schema and tops the musics table up to `rows` rows
+async def seed_musics(engine: AsyncEngine, rows: int):
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+        if await connection.scalar(select(user_model.id).limit(1)) is None:
+            await connection.execute(
+                insert(user_model).values(
+                    id=BENCH_USER_ID,
+                    username=bench_username(BENCH_USER_ID),
+                    email=f"{bench_username(BENCH_USER_ID)}@email.com",
+                    password="not-a-real-hash",
+                )
+            )
+            await sync_id_sequences(connection, user_model)
+        existing = await connection.scalar(select(func.count(music_model.id)))
+
+    for start in range(existing, rows, BATCH_SIZE):
+        batch = [
+            {
+                "title": f"Track {number}",
+                "artist": f"Artist {number % 5000}",
+                "link": f"https://example.com/track/{number}",
+                "added_by": BENCH_USER_ID,
+            }
+            for number in range(start, min(start + BATCH_SIZE, rows))
+        ]
+        async with engine.begin() as connection:
+            await connection.execute(insert(music_model), batch)
+
+
+# * Tops the users table up to `users` bench users (ids 1..users) sharing one password
+async def seed_users(engine: AsyncEngine, users: int, password_hash: str):
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+        existing = set(
+            (await connection.execute(select(user_model.id))).scalars().all()
+        )
+        missing = [
+            {
+                "id": user_id,
+                "username": bench_username(user_id),
+                "email": f"{bench_username(user_id)}@email.com",
+                "password": password_hash,
+            }
+            for user_id in range(BENCH_USER_ID, users + 1)
+            if user_id not in existing
+        ]
+        if missing:
+            await connection.execute(insert(user_model), missing)
+            await sync_id_sequences(connection, user_model)
+        await connection.execute(
+            update(user_model)
+            .where(user_model.id.in_(existing))
+            .values(password=password_hash)
+        )
+
+
+# * Returns the id of the named playlist, creating it with the first `tracks` musics
+async def seed_playlist(
+    engine: AsyncEngine, owner_id: int, name: str, tracks: int, private: bool = False
+) -> int:
+    async with engine.begin() as connection:
+        playlist_id = await connection.scalar(
+            select(playlist_model.id).where(
+                playlist_model.owner_id == owner_id, playlist_model.name == name
+            )
+        )
+        if playlist_id is not None:
+            return playlist_id
+
+        result = await connection.execute(
+            insert(playlist_model)
+            .values(name=name, private=private, owner_id=owner_id)
+            .returning(playlist_model.id)
+        )
+        playlist_id = result.scalar_one()
+        music_ids = (
+            select(music_model.id).order_by(music_model.id).limit(tracks).subquery()
+        )
+        await connection.execute(
+            insert(playlist_music_association).from_select(
+                ["playlist_id", "music_id", "position"],
+                select(
+                    literal(playlist_id), music_ids.c.id, music_ids.c.id * POSITION_GAP
+                ),
+            )
+        )
+    return playlist_id
+
+
+# * Runs an async callable `repeat` times and returns the median in milliseconds
+async def median_ms(call, repeat: int = 5) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await call()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+# * Nearest-rank percentile, p in [0, 100]
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(int(round(p / 100 * len(ordered))) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
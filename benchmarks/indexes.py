@@ -0,0 +1,120 @@
+"""Hot lookups with and without the access path indexes, on a generated dataset.
+
+Fills an empty database with app/scripts/generate_dataset.py first, then times
+each lookup with the indexes dropped and again once they are recreated:
+    python -m benchmarks.indexes --users 20000 --musics 1000000 --playlists 200000
+"""
+
+import argparse
+import asyncio
+from sqlalchemy import desc, func, select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from benchmarks.common import get_engine, median_ms
+from app.config.setup import Base
+from app.db.models import Music as music_model
+from app.db.models import Playlist as playlist_model
+from app.db.models import playlist_music_association
+from app.scripts.generate_dataset import generate_dataset
+from app.services import music as music_services
+from app.services import playlist as playlist_services
+
+# Added by migration f1c7a3e9b5d2
+INDEXES = [
+    "ix_musics_added_by",
+    "ix_playlists_owner_id_private",
+    "ix_playlists_public_owner_id",
+    "ix_playlist_music_music_id",
+]
+POSTGRES_ONLY = {"ix_playlists_public_owner_id"}
+
+
+def _indexes(engine: AsyncEngine) -> list:
+    found = {
+        index.name: index
+        for table in Base.metadata.tables.values()
+        for index in table.indexes
+    }
+    return [
+        found[name]
+        for name in INDEXES
+        if engine.dialect.name == "postgresql" or name not in POSTGRES_ONLY
+    ]
+
+
+async def _pick(engine: AsyncEngine, column, heaviest: bool) -> int:
+    # The value with the most rows, or a long tail one (few rows, the common case)
+    statement = select(column).group_by(column).limit(1)
+    statement = statement.order_by(desc(func.count()) if heaviest else func.count())
+    async with engine.connect() as connection:
+        return await connection.scalar(statement)
+
+
+async def _holding_playlists(db: AsyncSession, music_id: int):
+    statement = select(playlist_music_association.c.playlist_id).where(
+        playlist_music_association.c.music_id == music_id
+    )
+    return (await db.execute(statement)).all()
+
+
+async def measure(engine: AsyncEngine, repeat: int) -> dict[str, float]:
+    owner_id = await _pick(engine, playlist_model.owner_id, heaviest=False)
+    uploader_id = await _pick(engine, music_model.added_by, heaviest=False)
+    music_id = await _pick(engine, playlist_music_association.c.music_id, heaviest=True)
+    lookups = {
+        "own playlists": lambda db: playlist_services.get_user_playlists(
+            db=db, user_id=owner_id, requester_id=owner_id
+        ),
+        "public playlists": lambda db: playlist_services.get_user_playlists(
+            db=db, user_id=owner_id
+        ),
+        "uploads page": lambda db: music_services.get_user_added_musics(
+            db=db, user_id=uploader_id, limit=10, after_id=0
+        ),
+        "playlists holding a track": lambda db: _holding_playlists(db, music_id),
+    }
+    async with AsyncSession(engine) as db:
+        return {
+            name: await median_ms(lambda: lookup(db), repeat)
+            for name, lookup in lookups.items()
+        }
+
+
+async def run(args):
+    engine = get_engine()
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+        empty = await connection.scalar(select(music_model.id).limit(1)) is None
+    if empty:
+        await generate_dataset(
+            engine,
+            users=args.users,
+            musics=args.musics,
+            playlists=args.playlists,
+            seed=args.seed,
+            password_hash="not-a-real-hash",
+        )
+
+    indexes = _indexes(engine)
+    async with engine.begin() as connection:
+        for index in indexes:
+            await connection.run_sync(index.drop, checkfirst=True)
+    before = await measure(engine, args.repeat)
+    async with engine.begin() as connection:
+        for index in indexes:
+            await connection.run_sync(index.create, checkfirst=True)
+    after = await measure(engine, args.repeat)
+
+    print(f"{'lookup':>26} {'no index ms':>12} {'indexed ms':>11}")
+    for name in before:
+        print(f"{name:>26} {before[name]:>12.2f} {after[name]:>11.2f}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--musics", type=int, default=1_000_000)
+    parser.add_argument("--playlists", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=5)
+    asyncio.run(run(parser.parse_args()))
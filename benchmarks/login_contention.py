@@ -0,0 +1,78 @@
+"""/music/all latency while /users/login is being hammered.
+
+bcrypt runs on the password hashing pool, so browsing latency should stay
+flat when logins pile up. Usage:
+    python -m benchmarks.login_contention --logins 16 --requests 300
+"""
+
+import argparse
+import asyncio
+import time
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import update
+from benchmarks.common import get_engine, percentile, seed_musics, BENCH_USER_ID
+from app.db.models import User as user_model
+from app.main import app
+from app.services import auth as auth_services
+
+PASSWORD = "password123"
+
+
+async def browse(client: AsyncClient, requests: int) -> list[float]:
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = await client.get("/music/all", params={"limit": 50})
+        response.raise_for_status()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+async def hammer_login(client: AsyncClient, stop: asyncio.Event):
+    login = {"email": "bench_user@email.com", "password": PASSWORD}
+    while not stop.is_set():
+        await client.post("/users/login", json=login)
+
+
+async def measure(client: AsyncClient, requests: int, logins: int) -> list[float]:
+    stop = asyncio.Event()
+    hammers = [asyncio.create_task(hammer_login(client, stop)) for _ in range(logins)]
+    try:
+        return await browse(client, requests)
+    finally:
+        stop.set()
+        await asyncio.gather(*hammers)
+
+
+async def run(logins: int, requests: int):
+    engine = get_engine()
+    await seed_musics(engine, 1_000)
+    async with engine.begin() as connection:
+        await connection.execute(
+            update(user_model)
+            .where(user_model.id == BENCH_USER_ID)
+            .values(password=auth_services.pwd_context.hash(PASSWORD))
+        )
+    await engine.dispose()
+
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://bench") as client:
+        await browse(client, 20)  # warm up connections
+        idle = await measure(client, requests, logins=0)
+        busy = await measure(client, requests, logins=logins)
+
+    print(f"{'scenario':>16} {'p50 ms':>10} {'p99 ms':>10}")
+    for name, timings in (("idle", idle), (f"{logins} logins", busy)):
+        print(
+            f"{name:>16} {percentile(timings, 50):>10.2f} "
+            f"{percentile(timings, 99):>10.2f}"
+        )
+    print("password hash pool:", auth_services.password_hasher.stats())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=300)
+    args = parser.parse_args()
+    asyncio.run(run(args.logins, args.requests))
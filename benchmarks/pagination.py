@@ -0,0 +1,47 @@
+"""Offset vs keyset pagination latency across page depth.
+
+Usage:
+    python -m benchmarks.pagination --rows 1000000
+    DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.pagination
+"""
+
+import argparse
+import asyncio
+from sqlalchemy.ext.asyncio import AsyncSession
+from benchmarks.common import get_engine, median_ms, seed_musics
+from app.services import music as music_services
+
+PAGE_SIZE = 50
+
+
+async def run(rows: int, repeat: int):
+    engine = get_engine()
+    await seed_musics(engine, rows)
+
+    depths = [depth for depth in (0, 1_000, 10_000, 100_000, 500_000) if depth < rows]
+    depths.append(rows - PAGE_SIZE)
+
+    print(f"{'depth':>10} {'offset ms':>12} {'keyset ms':>12}")
+    async with AsyncSession(engine) as db:
+        for depth in depths:
+            offset_ms = await median_ms(
+                lambda: music_services.get_musics(db=db, skip=depth, limit=PAGE_SIZE),
+                repeat,
+            )
+            # Ids are dense after seeding, so the cursor for a depth is the depth itself
+            keyset_ms = await median_ms(
+                lambda: music_services.get_musics(
+                    db=db, limit=PAGE_SIZE, after_id=depth
+                ),
+                repeat,
+            )
+            print(f"{depth:>10} {offset_ms:>12.2f} {keyset_ms:>12.2f}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.repeat))
@@ -0,0 +1,409 @@
+"""Mixed-scenario load test with per-route throughput and p50/p95/p99 latency.
+
+Drives app.main:app in-process over httpx ASGITransport, or a running server with
+--base-url (seeding still goes through DATABASE_URL, point both at the same
+database). Results are written as JSON so runs can be compared with --compare.
+
+Usage:
+    python -m benchmarks.run --duration 30 --concurrency 32
+    python -m benchmarks.run --scenario large-read --playlist-size 50000
+    DATABASE_URL=postgresql+asyncpg://... python -m benchmarks.run \\
+        --base-url http://localhost:8000 --compare benchmarks/results/last.json
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import subprocess
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+import httpx
+from benchmarks.common import (
+    bench_username,
+    get_engine,
+    percentile,
+    seed_musics,
+    seed_playlist,
+    seed_users,
+)
+from app.scripts.rebuild_counters import rebuild_counters
+from app.services import auth as auth_services
+
+PASSWORD = "password123"
+RESULTS_DIR = Path(__file__).parent / "results"
+LARGE_PLAYLIST_NAME = "bench large playlist"
+
+# Share of actions per scenario, mixed is what a typical minute of traffic looks like
+SCENARIOS = {
+    "mixed": {"browse": 60, "edit": 20, "large-read": 15, "login": 5},
+    "browse": {"browse": 100},
+    "edit": {"edit": 100},
+    "large-read": {"large-read": 100},
+    "login": {"login": 100},
+}
+
+
+class Recorder:
+    def __init__(self):
+        self.timings = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.recording = False
+
+    async def request(
+        self, client: httpx.AsyncClient, method: str, route: str, url: str, **kwargs
+    ):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            status = response.status_code
+        except httpx.HTTPError:
+            response, status = None, "error"
+        if self.recording:
+            self.timings[f"{method} {route}"].append(
+                (time.perf_counter() - start) * 1000
+            )
+            self.statuses[f"{method} {route}"][str(status)] += 1
+        return response
+
+    def summary(self, seconds: float) -> dict:
+        routes = {}
+        for route, timings in sorted(self.timings.items()):
+            statuses = self.statuses[route]
+            routes[route] = {
+                "requests": len(timings),
+                "throughput_rps": round(len(timings) / seconds, 2),
+                "p50_ms": round(percentile(timings, 50), 3),
+                "p95_ms": round(percentile(timings, 95), 3),
+                "p99_ms": round(percentile(timings, 99), 3),
+                "max_ms": round(max(timings), 3),
+                "server_errors": sum(
+                    count
+                    for status, count in statuses.items()
+                    if status == "error" or status.startswith("5")
+                ),
+                "statuses": dict(statuses),
+            }
+        every = [timing for timings in self.timings.values() for timing in timings]
+        total = {
+            "requests": len(every),
+            "throughput_rps": round(len(every) / seconds, 2),
+            "p50_ms": round(percentile(every, 50), 3),
+            "p95_ms": round(percentile(every, 95), 3),
+            "p99_ms": round(percentile(every, 99), 3),
+        }
+        return {"total": total, "routes": routes}
+
+
+class VirtualUser:
+    def __init__(
+        self, recorder: Recorder, client, rng: random.Random, user_id: int, world: dict
+    ):
+        self.recorder = recorder
+        self.client = client
+        self.rng = rng
+        self.user_id = user_id
+        self.world = world
+        self.headers = {}
+        self.added = []  # tracks this user put in their playlist, to remove later
+
+    async def login(self):
+        response = await self.recorder.request(
+            self.client,
+            "POST",
+            "/users/login",
+            "/users/login",
+            json={
+                "email": f"{bench_username(self.user_id)}@email.com",
+                "password": PASSWORD,
+            },
+        )
+        if response is not None and response.status_code == 200:
+            self.headers = {
+                "Authorization": f"Bearer {response.json()['access_token']}"
+            }
+
+    def music_id(self) -> int:
+        return self.rng.randint(1, self.world["musics"])
+
+    def other_user_id(self) -> int:
+        return self.rng.randint(1, self.world["users"])
+
+    async def browse(self):
+        request = self.recorder.request
+        choice = self.rng.random()
+        if choice < 0.35:
+            response = await request(
+                self.client, "GET", "/music/all", "/music/all", params={"limit": 50}
+            )
+            cursor = (
+                response.headers.get("X-Next-Cursor") if response is not None else None
+            )
+            if cursor and self.rng.random() < 0.5:
+                await request(
+                    self.client,
+                    "GET",
+                    "/music/all",
+                    "/music/all",
+                    params={"limit": 50, "cursor": cursor},
+                )
+        elif choice < 0.55:
+            await request(
+                self.client, "GET", "/music/{music_id}", f"/music/{self.music_id()}"
+            )
+        elif choice < 0.7:
+            await request(
+                self.client,
+                "GET",
+                "/music/search",
+                "/music/search",
+                params={"q": f"Track {self.music_id()}"},
+            )
+        elif choice < 0.85:
+            await request(
+                self.client,
+                "GET",
+                "/playlist/from-user/{user_id}",
+                f"/playlist/from-user/{self.other_user_id()}",
+                headers=self.headers if self.rng.random() < 0.5 else {},
+            )
+        else:
+            await request(
+                self.client,
+                "GET",
+                "/music/from-user/{user_id}",
+                f"/music/from-user/{self.other_user_id()}",
+            )
+
+    async def edit(self):
+        request = self.recorder.request
+        playlist_id = self.world["playlists"][self.user_id]
+        choice = self.rng.random()
+        if choice < 0.6 and (choice < 0.35 or not self.added):
+            music_id = self.music_id()
+            response = await request(
+                self.client,
+                "POST",
+                "/playlist/{playlist_id}/add-music/{music_id}",
+                f"/playlist/{playlist_id}/add-music/{music_id}",
+                headers=self.headers,
+            )
+            if response is not None and response.status_code == 201:
+                self.added.append(music_id)
+        elif choice < 0.6:
+            music_id = self.added.pop(self.rng.randrange(len(self.added)))
+            await request(
+                self.client,
+                "PUT",
+                "/playlist/{playlist_id}/remove-music/{music_id}",
+                f"/playlist/{playlist_id}/remove-music/{music_id}",
+                headers=self.headers,
+            )
+        elif choice < 0.85:
+            await request(
+                self.client,
+                "POST",
+                "/playlist/{playlist_id}/add-musics",
+                f"/playlist/{playlist_id}/add-musics",
+                json={"music_ids": [self.music_id() for _ in range(20)]},
+                headers=self.headers,
+            )
+        else:
+            await request(
+                self.client,
+                "PUT",
+                "/playlist/{playlist_id}",
+                f"/playlist/{playlist_id}",
+                json={"private": self.rng.random() < 0.5},
+                headers=self.headers,
+            )
+
+    async def large_read(self):
+        url = f"/playlist/{self.world['large_playlist']}/musics"
+        route = "/playlist/{playlist_id}/musics"
+        if self.rng.random() < 0.3:
+            await self.recorder.request(
+                self.client,
+                "GET",
+                f"{route}?format=ndjson",
+                url,
+                params={"format": "ndjson"},
+            )
+            return
+
+        params = {"limit": 100}
+        for _ in range(self.rng.randint(1, 5)):
+            response = await self.recorder.request(
+                self.client, "GET", f"{route}?limit", url, params=params
+            )
+            cursor = (
+                response.headers.get("X-Next-Cursor") if response is not None else None
+            )
+            if not cursor:
+                break
+            params = {"limit": 100, "cursor": cursor}
+
+    async def run(self, weights: dict, deadline: float):
+        await self.login()
+        actions = {
+            "browse": self.browse,
+            "edit": self.edit,
+            "large-read": self.large_read,
+            "login": self.login,
+        }
+        names = list(weights)
+        while time.perf_counter() < deadline:
+            name = self.rng.choices(names, weights=[weights[name] for name in names])[0]
+            await actions[name]()
+
+
+async def seed(args) -> dict:
+    engine = get_engine()
+    await seed_users(engine, args.users, auth_services.pwd_context.hash(PASSWORD))
+    await seed_musics(engine, args.musics)
+    playlists = {
+        user_id: await seed_playlist(
+            engine, user_id, f"bench playlist {user_id}", tracks=0
+        )
+        for user_id in range(1, args.users + 1)
+    }
+    large_playlist = await seed_playlist(
+        engine, 1, LARGE_PLAYLIST_NAME, tracks=args.playlist_size
+    )
+    await rebuild_counters(engine)
+    dialect = engine.dialect.name
+    await engine.dispose()
+    return {
+        "users": args.users,
+        "musics": args.musics,
+        "playlists": playlists,
+        "large_playlist": large_playlist,
+        "dialect": dialect,
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_summary(results: dict, previous: dict | None):
+    print(
+        f"{'route':<52} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'5xx':>5}"
+        + (f" {'p95 was':>8}" if previous else "")
+    )
+    rows = [*results["routes"].items(), ("total", results["total"])]
+    for route, stats in rows:
+        line = (
+            f"{route:<52} {stats['throughput_rps']:>8.1f} {stats['p50_ms']:>8.2f} "
+            f"{stats['p95_ms']:>8.2f} {stats['p99_ms']:>8.2f} {stats.get('server_errors', ''):>5}"
+        )
+        if previous:
+            before = (
+                previous["total"] if route == "total" else previous["routes"].get(route)
+            )
+            if before:
+                change = (
+                    (stats["p95_ms"] - before["p95_ms"])
+                    / max(before["p95_ms"], 1e-9)
+                    * 100
+                )
+                line += f" {before['p95_ms']:>8.2f} ({change:+.0f}%)"
+        print(line)
+
+
+async def run(args):
+    world = await seed(args)
+    weights = SCENARIOS[args.scenario]
+
+    if args.base_url:
+        client = httpx.AsyncClient(
+            base_url=args.base_url,
+            limits=httpx.Limits(max_connections=args.concurrency),
+            timeout=60,
+        )
+    else:
+        from app.main import app
+
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60
+        )
+
+    recorder = Recorder()
+    async with client:
+        users = [
+            VirtualUser(
+                recorder,
+                client,
+                random.Random(args.seed * 1_000 + number),
+                user_id=number % args.users + 1,
+                world=world,
+            )
+            for number in range(args.concurrency)
+        ]
+        start = time.perf_counter()
+        deadline = start + args.warmup + args.duration
+        tasks = [asyncio.create_task(user.run(weights, deadline)) for user in users]
+        await asyncio.sleep(args.warmup)
+        recorder.recording = True
+        measured_from = time.perf_counter()
+        await asyncio.gather(*tasks)
+        seconds = time.perf_counter() - measured_from
+
+    results = {
+        "meta": {
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "dialect": world["dialect"],
+            "target": args.base_url or "asgi",
+            "python": platform.python_version(),
+            "seconds": round(seconds, 2),
+            "args": {
+                key: value for key, value in vars(args).items() if key != "compare"
+            },
+        },
+        **recorder.summary(seconds),
+    }
+
+    output = (
+        Path(args.output)
+        if args.output
+        else RESULTS_DIR
+        / (f"{world['dialect']}-{args.scenario}-{datetime.now():%Y%m%d-%H%M%S}.json")
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+
+    previous = json.loads(Path(args.compare).read_text()) if args.compare else None
+    print_summary(results, previous)
+    print(f"results written to {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", choices=SCENARIOS, default="mixed")
+    parser.add_argument("--duration", type=float, default=30, help="measured seconds")
+    parser.add_argument(
+        "--warmup", type=float, default=3, help="unmeasured seconds first"
+    )
+    parser.add_argument("--concurrency", type=int, default=32, help="virtual users")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--musics", type=int, default=100_000)
+    parser.add_argument("--playlist-size", type=int, default=10_000)
+    parser.add_argument(
+        "--seed", type=int, default=1, help="makes action sequences repeatable"
+    )
+    parser.add_argument("--base-url", help="run against a server instead of in-process")
+    parser.add_argument("--output", help="results file, benchmarks/results/ by default")
+    parser.add_argument("--compare", help="earlier results file to diff p95 against")
+    asyncio.run(run(parser.parse_args()))
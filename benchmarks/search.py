@@ -0,0 +1,49 @@
+"""/music/search latency against a naive LIKE '%q%' scan on a seeded catalog.
+
+Seed a fresh database, the search index is created together with the schema:
+    python -m benchmarks.search --rows 1000000
+"""
+
+import argparse
+import asyncio
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from benchmarks.common import get_engine, median_ms, seed_musics
+from app.db.models import Music as music_model
+from app.services import music as music_services
+
+QUERIES = ["track 4242", "artist 17", "trac 99999", "artist 4999 track"]
+
+
+async def like_scan(db: AsyncSession, query: str):
+    pattern = f"%{query}%"
+    statement = (
+        select(music_model)
+        .where(or_(music_model.title.ilike(pattern), music_model.artist.ilike(pattern)))
+        .limit(10)
+    )
+    return (await db.execute(statement)).scalars().all()
+
+
+async def run(rows: int, repeat: int):
+    engine = get_engine()
+    await seed_musics(engine, rows)
+
+    print(f"{'query':>20} {'search ms':>12} {'LIKE scan ms':>14}")
+    async with AsyncSession(engine) as db:
+        for query in QUERIES:
+            search_ms = await median_ms(
+                lambda: music_services.search_musics(db=db, query=query, limit=10),
+                repeat,
+            )
+            scan_ms = await median_ms(lambda: like_scan(db, query), repeat)
+            print(f"{query:>20} {search_ms:>12.2f} {scan_ms:>14.2f}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.repeat))
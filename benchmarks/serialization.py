@@ -0,0 +1,67 @@
+"""Rows per second, per worker, of the list response path before and after row tuples.
+
+before: ORM objects, from_attributes validation against MusicOut, stdlib json
+after:  plain row tuples selected with schema_columns, encoded once by orjson
+
+Usage:
+    python -m benchmarks.serialization --rows 100000
+"""
+
+import argparse
+import asyncio
+import json
+from pydantic import TypeAdapter
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from benchmarks.common import get_engine, median_ms, seed_musics
+from app.db.models import Music as music_model
+from app.schemas import music as music_schemas
+from app.services import music as music_services
+from app.utils.functions import dump_rows
+
+music_list_adapter = TypeAdapter(list[music_schemas.MusicOut])
+
+
+# * What FastAPI does with a response_model: validate every row, then json.dumps
+async def before(db: AsyncSession, limit: int) -> bytes:
+    result = await db.execute(select(music_model).order_by(music_model.id).limit(limit))
+    musics = music_list_adapter.validate_python(
+        result.scalars().all(), from_attributes=True
+    )
+    content = music_list_adapter.dump_python(musics, mode="json")
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+async def after(db: AsyncSession, limit: int) -> bytes:
+    return dump_rows(await music_services.get_musics(db=db, limit=limit))
+
+
+async def run(rows: int, repeat: int):
+    engine = get_engine()
+    await seed_musics(engine, rows)
+
+    page_sizes = [size for size in (100, 1_000, 10_000, 100_000) if size <= rows]
+    print(f"{'rows':>8} {'before rows/s':>14} {'after rows/s':>14} {'speedup':>8}")
+    for limit in page_sizes:
+        # A fresh session per call, so identity map hits do not flatter the ORM path
+        async def call(path):
+            async with AsyncSession(engine) as db:
+                await path(db, limit)
+
+        before_ms = await median_ms(lambda: call(before), repeat)
+        after_ms = await median_ms(lambda: call(after), repeat)
+        before_rate = limit / before_ms * 1000
+        after_rate = limit / after_ms * 1000
+        print(
+            f"{limit:>8} {before_rate:>14,.0f} {after_rate:>14,.0f} "
+            f"{after_rate / before_rate:>7.1f}x"
+        )
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.repeat))
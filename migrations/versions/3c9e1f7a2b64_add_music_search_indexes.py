@@ -0,0 +1,78 @@
+"""Add music search indexes
+
+Revision ID: 3c9e1f7a2b64
+Revises: 6a6d8ef7ef9e
+Create Date: 2026-10-18 09:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c9e1f7a2b64'
+down_revision: Union[str, None] = '6a6d8ef7ef9e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SEARCH_DOCUMENT = (
+    "to_tsvector('simple', (coalesce(title, '') || ' ') || coalesce(artist, ''))"
+)
+
+SQLITE_FTS = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS musics_fts USING fts5(
+        title, artist, content='musics', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS musics_fts_ai AFTER INSERT ON musics BEGIN
+        INSERT INTO musics_fts(rowid, title, artist)
+        VALUES (new.id, new.title, new.artist);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS musics_fts_ad AFTER DELETE ON musics BEGIN
+        INSERT INTO musics_fts(musics_fts, rowid, title, artist)
+        VALUES ('delete', old.id, old.title, old.artist);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS musics_fts_au AFTER UPDATE ON musics BEGIN
+        INSERT INTO musics_fts(musics_fts, rowid, title, artist)
+        VALUES ('delete', old.id, old.title, old.artist);
+        INSERT INTO musics_fts(rowid, title, artist)
+        VALUES (new.id, new.title, new.artist);
+    END""",
+    # Index the rows that existed before the table was created
+    "INSERT INTO musics_fts(musics_fts) VALUES ('rebuild')",
+]
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.create_index(
+            'ix_musics_search_vector', 'musics', [sa.text(SEARCH_DOCUMENT)],
+            postgresql_using='gin',
+        )
+        op.create_index(
+            'ix_musics_title_trgm', 'musics', ['title'],
+            postgresql_using='gin', postgresql_ops={'title': 'gin_trgm_ops'},
+        )
+        op.create_index(
+            'ix_musics_artist_trgm', 'musics', ['artist'],
+            postgresql_using='gin', postgresql_ops={'artist': 'gin_trgm_ops'},
+        )
+    elif dialect == 'sqlite':
+        for statement in SQLITE_FTS:
+            op.execute(statement)
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.drop_index('ix_musics_artist_trgm', table_name='musics')
+        op.drop_index('ix_musics_title_trgm', table_name='musics')
+        op.drop_index('ix_musics_search_vector', table_name='musics')
+    elif dialect == 'sqlite':
+        for trigger in ('musics_fts_ai', 'musics_fts_ad', 'musics_fts_au'):
+            op.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        op.execute('DROP TABLE IF EXISTS musics_fts')
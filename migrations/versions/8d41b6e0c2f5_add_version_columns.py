@@ -0,0 +1,32 @@
+"""Add version columns for ETags
+
+Revision ID: 8d41b6e0c2f5
+Revises: 3c9e1f7a2b64
+Create Date: 2026-10-18 09:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d41b6e0c2f5'
+down_revision: Union[str, None] = '3c9e1f7a2b64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    for table in ('users', 'musics', 'playlists'):
+        op.add_column(
+            table,
+            sa.Column('version', sa.Integer(), server_default='1', nullable=False),
+        )
+
+
+def downgrade() -> None:
+    # Plain ALTER TABLE (SQLite 3.35+), a batch rebuild would drop the FTS triggers
+    for table in ('playlists', 'musics', 'users'):
+        op.execute(f'ALTER TABLE {table} DROP COLUMN version')
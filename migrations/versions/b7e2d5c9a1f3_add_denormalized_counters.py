@@ -0,0 +1,49 @@
+"""Add playlist track counts and user library counters
+
+Revision ID: b7e2d5c9a1f3
+Revises: 8d41b6e0c2f5
+Create Date: 2026-10-18 14:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e2d5c9a1f3'
+down_revision: Union[str, None] = '8d41b6e0c2f5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COUNTERS = (
+    ('playlists', 'track_count'),
+    ('users', 'added_musics_count'),
+    ('users', 'playlists_count'),
+)
+
+
+def upgrade() -> None:
+    for table, column in COUNTERS:
+        op.add_column(
+            table,
+            sa.Column(column, sa.Integer(), server_default='0', nullable=False),
+        )
+
+    # Backfill, the services keep them in step from here on
+    op.execute(
+        'UPDATE playlists SET track_count = (SELECT count(*) FROM playlist_music '
+        'WHERE playlist_music.playlist_id = playlists.id)'
+    )
+    op.execute(
+        'UPDATE users SET added_musics_count = (SELECT count(*) FROM musics '
+        'WHERE musics.added_by = users.id), playlists_count = (SELECT count(*) '
+        'FROM playlists WHERE playlists.owner_id = users.id)'
+    )
+
+
+def downgrade() -> None:
+    # Plain ALTER TABLE (SQLite 3.35+), a batch rebuild would drop the FTS triggers
+    for table, column in reversed(COUNTERS):
+        op.execute(f'ALTER TABLE {table} DROP COLUMN {column}')
@@ -0,0 +1,61 @@
+"""Add playlist track positions
+
+Revision ID: d4a8c3e1f6b2
+Revises: b7e2d5c9a1f3
+Create Date: 2026-10-18 16:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4a8c3e1f6b2'
+down_revision: Union[str, None] = 'b7e2d5c9a1f3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# app.db.models.POSITION_GAP when this revision was written
+POSITION_GAP = 1 << 16
+
+
+def upgrade() -> None:
+    op.add_column(
+        'playlist_music',
+        sa.Column('position', sa.BigInteger(), server_default='0', nullable=False),
+    )
+    # Numbers each playlist's tracks from 1 in the order they were read in so far,
+    # music id, with the usual gaps. row_number() is a BIGINT on Postgres, so the
+    # product cannot overflow like music_id * POSITION_GAP would.
+    op.execute(
+        f'''
+        UPDATE playlist_music SET position = (
+            SELECT ranked.track_number * {POSITION_GAP}
+            FROM (
+                SELECT
+                    playlist_id,
+                    music_id,
+                    row_number() OVER (
+                        PARTITION BY playlist_id ORDER BY music_id
+                    ) AS track_number
+                FROM playlist_music
+            ) AS ranked
+            WHERE ranked.playlist_id = playlist_music.playlist_id
+            AND ranked.music_id = playlist_music.music_id
+        )
+        '''
+    )
+    op.create_index(
+        'ix_playlist_music_position',
+        'playlist_music',
+        ['playlist_id', 'position'],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_playlist_music_position', table_name='playlist_music')
+    # Plain ALTER TABLE (SQLite 3.35+), like the other column drops
+    op.execute('ALTER TABLE playlist_music DROP COLUMN position')
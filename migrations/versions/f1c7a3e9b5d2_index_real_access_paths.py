@@ -0,0 +1,56 @@
+"""Index the real access paths
+
+Revision ID: f1c7a3e9b5d2
+Revises: d4a8c3e1f6b2
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1c7a3e9b5d2'
+down_revision: Union[str, None] = 'd4a8c3e1f6b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Copies of the primary keys, and ix_musics_title which _title_artist_uc covers
+REDUNDANT_INDEXES = [
+    ('ix_users_id', 'users', ['id']),
+    ('ix_musics_id', 'musics', ['id']),
+    ('ix_playlists_id', 'playlists', ['id']),
+    ('ix_musics_title', 'musics', ['title']),
+]
+
+
+def upgrade() -> None:
+    # /music/from-user/{user_id}
+    op.create_index('ix_musics_added_by', 'musics', ['added_by', 'id'])
+    # /playlist/from-user/{user_id}
+    op.create_index(
+        'ix_playlists_owner_id_private', 'playlists', ['owner_id', 'private']
+    )
+    if op.get_bind().dialect.name == 'postgresql':
+        op.create_index(
+            'ix_playlists_public_owner_id', 'playlists', ['owner_id', 'id'],
+            postgresql_where=sa.text('private = false'),
+        )
+    # Playlists holding a track, and the ON DELETE CASCADE from musics
+    op.create_index(
+        'ix_playlist_music_music_id', 'playlist_music', ['music_id', 'playlist_id']
+    )
+    for name, table, _ in REDUNDANT_INDEXES:
+        op.drop_index(name, table_name=table)
+
+
+def downgrade() -> None:
+    for name, table, columns in REDUNDANT_INDEXES:
+        op.create_index(name, table, columns)
+    op.drop_index('ix_playlist_music_music_id', table_name='playlist_music')
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_playlists_public_owner_id', table_name='playlists')
+    op.drop_index('ix_playlists_owner_id_private', table_name='playlists')
+    op.drop_index('ix_musics_added_by', table_name='musics')
@@ -4,19 +4,32 @@ import os
 # Adds the project root directory to the Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
+# Lazy loads raise in tests, so a route fanning out into N+1 queries fails loudly
+os.environ.setdefault("ORM_RAISE_ON_LAZY_LOAD", "1")
+# The test schema comes from create_all, not migrations
+os.environ.setdefault("READINESS_CHECK_MIGRATIONS", "0")
+
+import contextlib
 import pytest
+from sqlalchemy import event
 from httpx import AsyncClient, ASGITransport  # HTTP client for testing
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from app.config.setup import Base  # Base class (holds metadata for models)
 from app.db.core import get_async_db  # Function to retrieve the database session
+from app.db.core import get_async_read_db
+from app.db.pool import enable_foreign_keys
 from app.main import app  # Import FastAPI application
-from app.db.models import User, Music, Playlist  # Import database models
+from app.main import admission_controller, rate_limiters
+from app.db.models import User, Music, Playlist, Job  # Import database models
+from app.services import auth as auth_services
+from app.services.cache import response_cache
+from app.services.jobs import job_runner
 
 # Define an in-memory SQLite database for testing
 SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
 
 # Create an async database engine
-engine = create_async_engine(SQLALCHEMY_DATABASE_URL, echo=True)
+engine = enable_foreign_keys(create_async_engine(SQLALCHEMY_DATABASE_URL, echo=True))
 
 # Create a session factory for generating async database sessions
 TestingSessionLocal = async_sessionmaker(
@@ -26,6 +39,8 @@ TestingSessionLocal = async_sessionmaker(
     class_=AsyncSession,
     bind=engine,
 )
+# Jobs run against the test database too, tests drive them with run_pending()
+job_runner.session_factory = TestingSessionLocal
 
 
 # Function to seed initial test data into the database
@@ -35,6 +50,8 @@ async def seed_database(session):
         username="seed_user",
         email="seed_user@email.com",
         password="$2a$12$TDJFaiwRleVEBYnvd/CVbuGIjbu/zVhImLgXuGlQgDrV8a734kK.2",
+        added_musics_count=2,
+        playlists_count=2,
     )
     seed_music_in_playlist = Music(
         id=1,
@@ -56,6 +73,7 @@ async def seed_database(session):
         private=False,
         owner_id=seed_user.id,
         musics=[seed_music_in_playlist],
+        track_count=1,
     )
     private_seed_playlist = Playlist(
         id=2,
@@ -63,6 +81,15 @@ async def seed_database(session):
         private=True,
         owner_id=seed_user.id,
         musics=[seed_music_in_playlist],
+        track_count=1,
+    )
+    finished_seed_job = Job(
+        id=1,
+        kind="playlist-copy",
+        status="succeeded",
+        requested_by=seed_user.id,
+        payload={"playlist_id": 1, "playlist": {}},
+        attempts=1,
     )
     session.add_all(
         [
@@ -73,6 +100,8 @@ async def seed_database(session):
             seed_music_left_out,
         ]
     )
+    await session.flush()  # the job has no relationship ordering it after its user
+    session.add(finished_seed_job)
     await session.commit()
 
 
@@ -88,6 +117,16 @@ async def setup_database():
     async with TestingSessionLocal() as session:
         await seed_database(session)
 
+    # In-process caches would otherwise outlive the recreated tables
+    auth_services.principal_cache.clear()
+    auth_services.token_cache.clear()
+    await response_cache.clear()
+    # Every test starts with full rate limit buckets
+    for limiter in rate_limiters.values():
+        limiter.clear()
+    if admission_controller is not None:
+        admission_controller.reset()
+
     yield  # This allows tests to run while the database exists
 
     # ? This drops all tables after tests complete, since I need seed to persist It'll be left commented
@@ -111,8 +150,41 @@ async def client(db):
         yield db
 
     app.dependency_overrides[get_async_db] = override_get_db
+    # Replica reads hit the same test database
+    app.dependency_overrides[get_async_read_db] = override_get_db
 
     # Use ASGITransport to run FastAPI app in tests
     transport = ASGITransport(app=app)
     async with AsyncClient(transport=transport, base_url="http://test") as ac:
         yield ac  # Provide the test client to the test cases
+
+
+# This fixture records every SQL statement sent to the test database
+@pytest.fixture(scope="function")
+def query_counter():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", record)
+    yield statements
+    event.remove(engine.sync_engine, "before_cursor_execute", record)
+
+
+# Fails when the statements run inside the block go over the budget, e.g.
+#     with query_budget(2):
+#         await client.get("/playlist/1/musics")
+@pytest.fixture(scope="function")
+def query_budget(query_counter):
+    @contextlib.contextmanager
+    def budget(max_queries: int):
+        query_counter.clear()
+        yield query_counter
+        assert (
+            len(query_counter) <= max_queries
+        ), f"{len(query_counter)} queries, budget is {max_queries}:\n" + "\n".join(
+            query_counter
+        )
+
+    return budget
@@ -0,0 +1,89 @@
+import asyncio
+from fastapi.responses import JSONResponse
+from httpx import ASGITransport, AsyncClient
+from app.main import rate_limiters
+from app.utils.admission import (
+    AdmissionController,
+    AdmissionMiddleware,
+    RateLimiter,
+    parse_rate_limits,
+)
+from tests.test_helpers import get_token
+
+
+def test_parse_rate_limits():
+    assert parse_rate_limits("login=0.2/5, playlist-musics=5") == {
+        "login": (0.2, 5.0),
+        "playlist-musics": (5.0, 5.0),
+    }
+
+
+def test_rate_limiter_refills_over_time(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("app.utils.admission.time.monotonic", lambda: now[0])
+    limiter = RateLimiter(rate=2, burst=2)
+
+    assert limiter.acquire("a") == 0
+    assert limiter.acquire("a") == 0
+    assert limiter.acquire("a") == 0.5
+    assert limiter.acquire("b") == 0  # every client has its own bucket
+
+    now[0] += 0.5
+    assert limiter.acquire("a") == 0
+    assert limiter.stats()["limited"] == 1
+
+
+async def test_login_has_its_own_budget(client, monkeypatch):
+    monkeypatch.setitem(rate_limiters, "login", RateLimiter(rate=0.01, burst=2))
+    login = {"email": "seed_user@email.com", "password": "wrong"}
+
+    first = await client.post("/users/login", json=login)
+    second = await client.post("/users/login", json=login)
+    third = await client.post("/users/login", json=login)
+    other_route = await client.get("/music/all")
+
+    assert first.status_code == second.status_code == 403
+    assert third.status_code == 429
+    assert int(third.headers["Retry-After"]) >= 1
+    assert other_route.status_code == 200
+
+
+async def test_authenticated_clients_are_limited_by_user(client, monkeypatch):
+    headers = await get_token(client)
+    monkeypatch.setitem(rate_limiters, "default", RateLimiter(rate=0.01, burst=1))
+
+    assert (await client.get("/users/me", headers=headers)).status_code == 200
+    assert (await client.get("/users/me", headers=headers)).status_code == 429
+    # Anonymous requests from the same address draw from the address' bucket
+    assert (await client.get("/music/all")).status_code == 200
+
+
+async def test_admission_turns_requests_away_past_the_queue():
+    release = asyncio.Event()
+
+    async def slow_app(scope, receive, send):
+        await release.wait()
+        await JSONResponse({"ok": True})(scope, receive, send)
+
+    controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=0.05)
+    app = AdmissionMiddleware(slow_app, controller, limiters={}, routes={})
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://t") as ac:
+        running = asyncio.create_task(ac.get("/"))
+        while controller.running == 0:
+            await asyncio.sleep(0)
+
+        queued = asyncio.create_task(ac.get("/"))
+        while controller.waiting == 0:
+            await asyncio.sleep(0)
+        rejected = await ac.get("/")  # the queue is full, no wait at all
+        timed_out = await queued  # waited queue_timeout for a slot
+
+        release.set()
+        finished = await running
+
+    assert rejected.status_code == timed_out.status_code == 503
+    assert rejected.headers["Retry-After"] == "1"
+    assert finished.status_code == 200
+    assert controller.stats()["rejected"] == 2
+    assert controller.stats()["running"] == 0
@@ -0,0 +1,87 @@
+import asyncio
+import contextlib
+import pytest
+from app.utils.cache import MemoryCacheBackend, RedisCacheBackend, ResponseCache
+
+
+# A stand-in speaking just enough of the Redis protocol for the cache backend
+@contextlib.asynccontextmanager
+async def redis_stand_in():
+    store = {}
+
+    async def handle(reader, writer):
+        while True:
+            try:
+                count = int((await reader.readline())[1:])
+            except (ValueError, ConnectionError):
+                break
+            args = []
+            for _ in range(count):
+                length = int((await reader.readline())[1:])
+                args.append((await reader.readexactly(length + 2))[:-2])
+
+            command = args[0].upper()
+            if command == b"GET":
+                value = store.get(args[1])
+                if value is None:
+                    reply = b"$-1\r\n"
+                else:
+                    reply = b"$%d\r\n%s\r\n" % (len(value), value)
+            elif command == b"SET":
+                store[args[1]] = args[2]
+                reply = b"+OK\r\n"
+            elif command == b"INCR":
+                store[args[1]] = b"%d" % (int(store.get(args[1], 0)) + 1)
+                reply = b":%s\r\n" % store[args[1]]
+            elif command == b"FLUSHDB":
+                store.clear()
+                reply = b"+OK\r\n"
+            else:
+                reply = b"-ERR unknown command\r\n"
+            writer.write(reply)
+            await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    yield f"redis://127.0.0.1:{port}/0"
+    server.close()
+    await server.wait_closed()
+
+
+@pytest.mark.parametrize("backend_name", ["memory", "redis"])
+async def test_response_cache_invalidates_by_namespace(backend_name):
+    async with redis_stand_in() as redis_url:
+        if backend_name == "redis":
+            backend = RedisCacheBackend(redis_url)
+        else:
+            backend = MemoryCacheBackend(max_size=10)
+        await check_response_cache(backend)
+
+
+async def check_response_cache(backend):
+    cache = ResponseCache(backend=backend, ttls={"skip": 0}, default_ttl=30)
+
+    await cache.set("musics", "all", "music-all", b"[]", {"etag": '"1"'})
+    await cache.set("playlists", "1", "playlist-musics", b"{}", {})
+    await cache.set("musics", "never", "skip", b"[]", {})
+
+    assert await cache.get("musics", "all") == (b"[]", {"etag": '"1"'})
+    assert await cache.get("musics", "never") is None
+
+    await cache.invalidate("musics")
+
+    assert await cache.get("musics", "all") is None
+    assert await cache.get("playlists", "1") == (b"{}", {})
+    assert cache.stats() == {"hits": 2, "misses": 2, "errors": 0}
+
+
+async def test_unreachable_cache_server_is_a_miss():
+    cache = ResponseCache(
+        backend=RedisCacheBackend("redis://127.0.0.1:1/0"), ttls={}, default_ttl=30
+    )
+
+    await cache.set("musics", "all", "music-all", b"[]", {})
+
+    assert await cache.get("musics", "all") is None
+    assert cache.stats()["errors"] == 2
@@ -0,0 +1,303 @@
+import asyncio
+import logging
+import math
+import pytest
+from sqlalchemy import insert, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine
+from starlette.requests import Request
+from app.config.setup import READ_YOUR_WRITES_SECONDS, Base
+from app import main
+from app.db import core
+from app.db.health import DatabaseHealth, get_migration_heads
+from app.db.models import Music, User
+from app.db.pool import POOL_PROFILES, get_engine_options, get_pool_status
+from app.db.replicas import ReplicaSet
+from app.main import app, sql_instrumentation
+from app.services.cache import response_cache
+from app.utils import metrics
+from tests.test_helpers import get_token
+
+
+async def test_pool_status_endpoint(client):
+    response = await client.get("/db/pool")
+    json_response = response.json()
+
+    assert response.status_code == 200
+    assert json_response["profile"] in POOL_PROFILES
+    assert json_response["pool_class"]
+    assert json_response["replicas"] == []
+
+
+async def test_instrumented_pool_tracks_checkouts(tmp_path):
+    database_url = f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}"
+    settings = {**POOL_PROFILES["migration"], "statement_cache_size": None}
+    engine = create_async_engine(
+        database_url, **get_engine_options(database_url, settings)
+    )
+
+    async with engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+        in_use = get_pool_status(engine)
+
+    idle = get_pool_status(engine)
+    await engine.dispose()
+
+    assert in_use["checked_out"] == 1
+    assert in_use["pool_size"] == 1
+    assert idle["checked_out"] == 0
+    assert idle["checkouts"] == 1
+    assert idle["checkout_timeouts"] == 0
+
+
+async def test_server_timing_reports_the_request_sql(client, query_counter):
+    response = await client.get("/music/1")
+    timing = response.headers["Server-Timing"]
+
+    assert timing.startswith("db;dur=")
+    assert f'desc="{len(query_counter)} queries"' in timing
+    assert "total;dur=" in timing
+
+
+async def test_metrics_endpoint_has_route_histograms(client):
+    await client.get("/music/1")
+    response = await client.get("/metrics")
+    body = response.text
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert (
+        'http_request_duration_seconds_bucket{method="GET",route="/music/{music_id}",le="+Inf"}'
+        in body
+    )
+    assert 'http_request_queries_count{method="GET",route="/music/{music_id}"}' in body
+    assert 'app_cache{cache="response",stat="hits"}' in body
+    assert 'password_hash_pool{stat="workers"}' in body
+
+
+async def test_unhandled_errors_are_counted_as_500s():
+    async def broken(scope, receive, send):
+        raise RuntimeError("boom")
+
+    labels = ("GET", "unmatched", "500")
+    before = metrics.REQUESTS.values[labels]
+    timed = sum(metrics.REQUEST_SECONDS.counts.get(labels[:2], []))
+    with pytest.raises(RuntimeError):
+        await metrics.MetricsMiddleware(broken)(
+            {"type": "http", "method": "GET"}, None, None
+        )
+
+    assert metrics.REQUESTS.values[labels] == before + 1
+    assert sum(metrics.REQUEST_SECONDS.counts[labels[:2]]) == timed + 1
+
+
+async def test_failed_statements_do_not_leave_timers_behind(db):
+    connection = await db.connection()
+    with pytest.raises(OperationalError):
+        await connection.execute(text("SELECT * FROM missing_table"))
+
+    assert connection.info["query_start"] == []
+
+
+async def test_slow_queries_are_logged_without_values(client, monkeypatch):
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    metrics.logger.addHandler(handler)
+    monkeypatch.setattr(sql_instrumentation, "slow_query_seconds", 0)
+    try:
+        await client.get("/music/from-user/1", params={"limit": 5})
+    finally:
+        metrics.logger.removeHandler(handler)
+
+    messages = [record.getMessage() for record in records]
+    assert any("FROM musics" in message for message in messages)
+    assert any("parameters=['int', 'int', 'int']" in message for message in messages)
+
+
+@pytest.fixture
+async def replica(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}")
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+        await connection.execute(
+            insert(User).values(id=1, username="u", email="u@email.com", password="x")
+        )
+        await connection.execute(
+            insert(Music).values(
+                id=1, title="Only On Replica", artist="R", link="l", added_by=1
+            )
+        )
+    yield engine
+    await engine.dispose()
+
+
+# * Routes the read dependency through `replicas`, with the test database as primary
+@pytest.fixture
+def use_replicas(db, monkeypatch):
+    def use(*replicas):
+        replica_set = ReplicaSet(primary=db.bind, replicas=list(replicas))
+        monkeypatch.setattr(core, "replica_set", replica_set)
+        monkeypatch.delitem(
+            app.dependency_overrides, core.get_async_read_db, raising=False
+        )
+        return replica_set
+
+    return use
+
+
+def test_only_safe_routes_read_from_replicas():
+    def depends_on(dependant, call):
+        return any(
+            sub.call is call or depends_on(sub, call)
+            for sub in dependant.dependencies
+        )
+
+    replica_routes = {
+        (method, route.path)
+        for route in app.routes
+        if hasattr(route, "dependant")
+        and depends_on(route.dependant, core.get_async_read_db)
+        for method in route.methods
+    }
+
+    assert replica_routes == {
+        ("GET", "/music/all"),
+        ("GET", "/music/search"),
+        ("GET", "/music/from-user/{user_id}"),
+        ("GET", "/music/{music_id}"),
+        ("GET", "/playlist/from-user/{user_id}"),
+        ("GET", "/playlist/{playlist_id}/musics"),
+    }
+
+
+async def test_safe_reads_go_to_a_replica(client, replica, use_replicas):
+    use_replicas(replica)
+
+    replica_read = await client.get("/music/all")
+    primary_read = await client.get("/music/2")
+
+    assert [music["title"] for music in replica_read.json()] == ["Only On Replica"]
+    # Served from the primary, the replica has no such track
+    assert primary_read.status_code == 404
+    assert (await client.get("/music/1")).json()["title"] == "Only On Replica"
+
+
+async def test_replica_reads_are_cached_no_longer_than_the_lag_window(
+    client, replica, use_replicas, monkeypatch
+):
+    ttls = []
+    backend_set = response_cache.backend.set
+
+    async def record_ttl(key, value, ttl):
+        ttls.append(ttl)
+        await backend_set(key, value, ttl)
+
+    monkeypatch.setattr(response_cache.backend, "set", record_ttl)
+    use_replicas(replica)
+    await client.get("/music/all")
+    use_replicas()
+    await client.get("/music/all", params={"limit": 5})
+
+    assert ttls == [
+        math.ceil(READ_YOUR_WRITES_SECONDS),
+        response_cache.ttls.get("music-all", response_cache.default_ttl),
+    ]
+
+
+async def test_reads_stay_on_the_primary_after_a_write(client, replica, use_replicas):
+    replica_set = use_replicas(replica)
+    headers = await get_token(client)
+
+    # What the write routes' session dependency does once the request is over
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "headers": [(b"authorization", headers["Authorization"].encode())],
+    }
+    session = core.get_async_db(Request(scope))
+    await anext(session)
+    await session.aclose()
+
+    anonymous_read = await client.get("/music/all")
+    own_read = await client.get("/music/all", headers=headers)
+
+    assert len(own_read.json()) == 2
+    assert [music["title"] for music in anonymous_read.json()] == ["Only On Replica"]
+    assert replica_set.stats()["sticky_clients"] == 1
+
+
+async def test_unhealthy_replicas_fall_back_to_the_primary(
+    client, replica, use_replicas, tmp_path
+):
+    unreachable = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'missing' / 'replica.db'}"
+    )
+    replica_set = use_replicas(unreachable, replica)
+    await replica_set.check()
+    assert replica_set.healthy == [replica]
+
+    replica_set = use_replicas(unreachable)
+    await replica_set.check()
+    response = await client.get("/music/all")
+
+    assert replica_set.healthy == []
+    assert len(response.json()) == 2
+    assert replica_set.stats()["primary_fallbacks"] == 1
+    await unreachable.dispose()
+
+
+async def test_livez_does_not_touch_the_database(client, query_counter):
+    response = await client.get("/livez")
+
+    assert response.status_code == 200
+    assert response.json() == {"status": "ok"}
+    assert query_counter == []
+
+
+async def test_readyz_answers_from_the_last_check(
+    client, db, monkeypatch, query_counter
+):
+    heads = get_migration_heads()
+    health = DatabaseHealth(db.bind, interval=60, migration_heads=heads)
+    monkeypatch.setattr(main, "database_health", health)
+
+    behind = await client.get("/readyz")
+    assert behind.status_code == 503
+    assert behind.json()["failing"] == ["migrations"]
+    assert behind.json()["database"]["ok"] is True
+
+    async with db.bind.begin() as connection:
+        await connection.execute(
+            text("CREATE TABLE alembic_version (version_num TEXT)")
+        )
+        for head in heads:
+            await connection.execute(
+                text("INSERT INTO alembic_version VALUES (:head)"), {"head": head}
+            )
+    await health.check()
+    query_counter.clear()
+    ready = await client.get("/readyz")
+
+    assert ready.status_code == 200
+    assert ready.json()["status"] == "ready"
+    assert ready.json()["database"]["migrations"]["up_to_date"] is True
+    assert "utilization" in ready.json()["pool"]
+    assert query_counter == []  # served from the background check
+
+
+async def test_database_health_check_times_out(client, db, monkeypatch):
+    async def hang():
+        await asyncio.sleep(10)
+
+    health = DatabaseHealth(db.bind, interval=60, timeout=0.05)
+    monkeypatch.setattr(health, "_query", hang)
+    monkeypatch.setattr(main, "database_health", health)
+
+    root = await client.get("/")
+    ready = await client.get("/readyz")
+
+    assert root.status_code == 500
+    assert ready.status_code == 503
+    assert ready.json()["failing"] == ["database"]
+    assert ready.json()["database"]["error"] == "timed out after 0.05s"
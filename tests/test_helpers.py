@@ -3,6 +3,8 @@ seed_user = {
     "username": "seed_user",
     "email": "seed_user@email.com",
     "password": "$2a$12$TDJFaiwRleVEBYnvd/CVbuGIjbu/zVhImLgXuGlQgDrV8a734kK.2",
+    "added_musics_count": 2,
+    "playlists_count": 2,
 }
 seed_music_in_playlist = {
     "id": 1,
@@ -24,6 +26,7 @@ public_seed_playlist = {
     "private": False,
     "owner_id": seed_user["id"],
     "musics": seed_music_in_playlist,
+    "track_count": 1,
 }
 private_seed_playlist = {
     "id": 2,
@@ -31,6 +34,7 @@ private_seed_playlist = {
     "private": True,
     "owner_id": seed_user["id"],
     "musics": seed_music_in_playlist,
+    "track_count": 1,
 }
 
 
@@ -0,0 +1,236 @@
+import asyncio
+import os
+from sqlalchemy import update
+from app.db.models import Job, utcnow
+from app.services.jobs import JobRunner, job_runner
+from tests.test_helpers import get_token, private_seed_playlist, public_seed_playlist
+
+ASYNC = {"Prefer": "respond-async"}
+
+
+async def test_import_runs_as_a_job(client, db):
+    headers = await get_token(client)
+    body = (
+        '{"title": "Job Song", "artist": "Job Artist", "link": "l"}\n'
+        '{"title": "Seed Song", "artist": "Seed Artist", "link": "l"}\n'
+    )
+
+    response = await client.post(
+        "/music/import", content=body, headers={**headers, **ASYNC}
+    )
+    job = response.json()
+    path = (await db.get(Job, job["id"])).payload["path"]
+
+    assert response.status_code == 202
+    assert response.headers["Location"] == f"/jobs/{job['id']}"
+    assert response.headers["Preference-Applied"] == "respond-async"
+    assert job["status"] == "queued"
+    assert os.path.exists(path)
+
+    assert await job_runner.run_pending() == 1
+    done = (await client.get(response.headers["Location"], headers=headers)).json()
+
+    assert done["status"] == "succeeded"
+    assert done["attempts"] == 1
+    assert done["progress"] == 2
+    assert done["result"] == {"inserted": 1, "skipped": 1, "failed": 0, "errors": []}
+    assert not os.path.exists(path)  # the spooled body goes once it is imported
+    search = await client.get("/music/search", params={"q": "job song"})
+    assert [music["title"] for music in search.json()] == ["Job Song"]
+
+
+async def test_playlist_jobs_return_what_the_route_would(client):
+    headers = await get_token(client)
+    copy = await client.post(
+        f"/playlist/{public_seed_playlist['id']}/copy",
+        json={"name": "Copied later"},
+        headers={**headers, **ASYNC},
+    )
+    combine = await client.post(
+        "/playlist/combine",
+        json={
+            "name": "Combined later",
+            "operation": "union",
+            "playlist_ids": [public_seed_playlist["id"], private_seed_playlist["id"]],
+        },
+        headers={**headers, **ASYNC},
+    )
+    assert copy.status_code == combine.status_code == 202
+
+    assert await job_runner.run_pending() == 2
+    copied = (await client.get(f"/jobs/{copy.json()['id']}", headers=headers)).json()
+    combined = await client.get(f"/jobs/{combine.json()['id']}", headers=headers)
+
+    assert copied["result"]["name"] == "Copied later"
+    assert copied["result"]["track_count"] == 1
+    assert combined.json()["result"]["name"] == "Combined later"
+    musics = await client.get(f"/playlist/{copied['result']['id']}/musics")
+    assert musics.json()["name"] == "Copied later"
+
+
+async def test_playlist_jobs_commit_their_success_with_their_work(
+    client, monkeypatch
+):
+    async def unreachable(*args, **kwargs):
+        raise ConnectionError("database went away")
+
+    headers = await get_token(client)
+    response = await client.post(
+        f"/playlist/{public_seed_playlist['id']}/copy",
+        json={"name": "Copied once"},
+        headers={**headers, **ASYNC},
+    )
+    # Status updates outside the handler's transaction are lost
+    with monkeypatch.context() as patch:
+        patch.setattr(job_runner, "_update", unreachable)
+        assert await job_runner.run_pending() == 1
+
+    job = (await client.get(f"/jobs/{response.json()['id']}", headers=headers)).json()
+    assert job["status"] == "succeeded"
+    assert job["result"]["name"] == "Copied once"
+    assert await job_runner.run_pending() == 0
+
+
+async def test_client_errors_fail_a_job_without_retries(client):
+    headers = await get_token(client)
+    response = await client.post("/playlist/999/copy", headers={**headers, **ASYNC})
+
+    await job_runner.run_pending()
+    job = (await client.get(f"/jobs/{response.json()['id']}", headers=headers)).json()
+
+    assert job["status"] == "failed"
+    assert job["attempts"] == 1
+    assert job["error"] == "Playlist not found"
+    assert job["finished_at"] is not None
+
+
+async def test_failed_jobs_are_retried_with_backoff(db):
+    calls = []
+
+    async def flaky(session, job):
+        calls.append(job.attempt)
+        await job.progress(len(calls), total=2)
+        if len(calls) == 1:
+            raise ConnectionError("database went away")
+        return {"ok": True}
+
+    runner = JobRunner(
+        job_runner.session_factory, handlers={"flaky": flaky}, retry_delay=60, lease=60
+    )
+    queued = await runner.enqueue(db, kind="flaky", requested_by=1, payload={})
+
+    assert await runner.run_pending() == 1
+    retried = await db.get(Job, queued["id"], populate_existing=True)
+    assert retried.status == "queued"
+    assert retried.error == "database went away"
+    assert retried.run_after > utcnow()  # not due before the delay
+    assert await runner.run_pending() == 0
+
+    async with db.bind.begin() as connection:
+        await connection.execute(update(Job).values(run_after=utcnow()))
+    assert await runner.run_pending() == 1
+
+    done = await db.get(Job, queued["id"], populate_existing=True)
+    assert calls == [1, 2]
+    assert (done.status, done.result, done.progress, done.total) == (
+        "succeeded",
+        {"ok": True},
+        2,
+        2,
+    )
+    assert runner.stats()["retried"] == runner.stats()["succeeded"] == 1
+
+
+async def test_jobs_of_dead_workers_are_claimed_again(db):
+    runner = JobRunner(job_runner.session_factory, handlers={}, lease=60)
+    queued = await runner.enqueue(db, kind="any", requested_by=1, payload={})
+
+    claimed = await runner.claim()
+    assert claimed.id == queued["id"]
+    assert await runner.claim() is None  # its lease still runs
+
+    async with db.bind.begin() as connection:
+        await connection.execute(update(Job).values(run_after=utcnow()))
+    reclaimed = await runner.claim()
+    assert (reclaimed.id, reclaimed.attempts) == (queued["id"], 2)
+
+
+async def test_jobs_out_of_attempts_are_failed_instead_of_claimed(db, tmp_path):
+    spooled = tmp_path / "body.upload"
+    spooled.write_text("{}")
+    runner = JobRunner(job_runner.session_factory, handlers={}, max_attempts=1)
+    queued = await runner.enqueue(
+        db, kind="any", requested_by=1, payload={"path": str(spooled)}
+    )
+    await runner.claim()
+
+    async with db.bind.begin() as connection:
+        await connection.execute(update(Job).values(run_after=utcnow()))
+    assert await runner.claim() is None
+
+    job = await db.get(Job, queued["id"], populate_existing=True)
+    assert (job.status, job.error) == ("failed", "Worker stopped before finishing")
+    assert job.finished_at is not None
+    assert runner.stats()["failed"] == 1
+    assert not spooled.exists()
+
+
+async def test_running_jobs_keep_their_lease_without_progress(db):
+    claims = []
+
+    async def slow(session, job):
+        await asyncio.sleep(runner.lease * 2)
+        claims.append(await runner.claim())
+        return {}
+
+    runner = JobRunner(job_runner.session_factory, handlers={"slow": slow}, lease=0.3)
+    await runner.enqueue(db, kind="slow", requested_by=1, payload={})
+
+    assert await runner.run_pending() == 1
+    assert claims == [None]  # renewed while it ran, so nobody took it over
+
+
+async def test_workers_pick_up_queued_jobs(db):
+    done = asyncio.Event()
+
+    async def handler(session, job):
+        done.set()
+        return {}
+
+    runner = JobRunner(
+        job_runner.session_factory,
+        handlers={"wake": handler},
+        workers=2,
+        poll_interval=60,
+    )
+    runner.start()
+    try:
+        await runner.enqueue(db, kind="wake", requested_by=1, payload={})
+        await asyncio.wait_for(done.wait(), 5)  # woken up, not polled
+    finally:
+        await runner.stop()
+    assert runner.stats()["workers"] == 0
+
+
+async def test_jobs_are_only_shown_to_who_queued_them(client):
+    await client.post(
+        "/users",
+        json={
+            "username": "other_user",
+            "email": "other_user@email.com",
+            "password": "password123",
+        },
+    )
+    login = await client.post(
+        "/users/login",
+        json={"email": "other_user@email.com", "password": "password123"},
+    )
+    other_headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    forbidden = await client.get("/jobs/1", headers=other_headers)
+    missing = await client.get("/jobs/999", headers=other_headers)
+    anonymous = await client.get("/jobs/1")
+
+    assert forbidden.status_code == 403
+    assert missing.status_code == 404
+    assert anonymous.status_code == 401
@@ -1,3 +1,5 @@
+from sqlalchemy.exc import OperationalError
+from app.services import music as music_services
 from tests.test_helpers import (
     seed_music_in_playlist,
     seed_music_left_out,
@@ -22,6 +24,118 @@ async def test_get_all_music(client):
     assert json_response[1]["link"] == seed_music_left_out["link"]
 
 
+async def test_get_all_music_has_exactly_the_music_out_fields(client):
+    response = await client.get("/music/all")
+
+    assert response.headers["content-type"] == "application/json"
+    assert response.json() == [seed_music_in_playlist, seed_music_left_out]
+
+
+async def test_get_all_music_with_cursor(client):
+    first_page = await client.get("/music/all", params={"limit": 1})
+    next_cursor = first_page.headers["X-Next-Cursor"]
+
+    assert first_page.status_code == 200
+    assert [music["id"] for music in first_page.json()] == [
+        seed_music_in_playlist["id"]
+    ]
+
+    second_page = await client.get(
+        "/music/all", params={"limit": 1, "cursor": next_cursor}
+    )
+
+    assert second_page.status_code == 200
+    assert [music["id"] for music in second_page.json()] == [
+        seed_music_left_out["id"]
+    ]
+
+    last_page = await client.get(
+        "/music/all",
+        params={"limit": 1, "cursor": second_page.headers["X-Next-Cursor"]},
+    )
+
+    assert last_page.status_code == 200
+    assert last_page.json() == []
+    assert "X-Next-Cursor" not in last_page.headers
+
+
+async def test_get_all_music_with_invalid_cursor(client):
+    response = await client.get("/music/all", params={"cursor": "not-a-cursor"})
+
+    assert response.status_code == 400
+
+
+async def test_search_music_by_prefix(client):
+    response = await client.get("/music/search", params={"q": "orang pater"})
+    json_response = response.json()
+
+    assert response.status_code == 200
+    assert [music["id"] for music in json_response] == [seed_music_left_out["id"]]
+
+
+async def test_search_music_ranks_and_pages(client):
+    headers = await get_token(client)
+    for title in ["Seed Seed Seed", "Seedling"]:
+        await client.post(
+            "/music",
+            json={"title": title, "artist": "Other", "link": "https://example.com"},
+            headers=headers,
+        )
+
+    first_page = await client.get("/music/search", params={"q": "seed", "limit": 2})
+    second_page = await client.get(
+        "/music/search",
+        params={
+            "q": "seed",
+            "limit": 2,
+            "cursor": first_page.headers["X-Next-Cursor"],
+        },
+    )
+    titles = [music["title"] for music in first_page.json() + second_page.json()]
+
+    assert first_page.status_code == 200
+    assert second_page.status_code == 200
+    assert titles[0] == "Seed Seed Seed"
+    assert sorted(titles) == sorted(
+        ["Seed Seed Seed", "Seedling", seed_music_in_playlist["title"]]
+    )
+
+
+async def test_search_music_sees_updates(client):
+    headers = await get_token(client)
+    await client.put(
+        f"/music/{seed_music_left_out['id']}",
+        json={"title": "Renamed Track"},
+        headers=headers,
+    )
+
+    old_title = await client.get("/music/search", params={"q": "orange"})
+    new_title = await client.get("/music/search", params={"q": "renamed"})
+
+    assert old_title.json() == []
+    assert [music["id"] for music in new_title.json()] == [seed_music_left_out["id"]]
+
+
+async def test_get_all_music_is_cached_until_a_write(client, query_counter):
+    await client.get("/music/all")
+    query_counter.clear()
+    cached = await client.get("/music/all")
+
+    assert cached.status_code == 200
+    assert len(cached.json()) == 2
+    assert len(query_counter) == 0
+
+    headers = await get_token(client)
+    await client.post(
+        "/music",
+        json={"title": "Cached", "artist": "Nobody", "link": "https://example.com"},
+        headers=headers,
+    )
+    fresh = await client.get("/music/all")
+
+    assert len(fresh.json()) == 3
+
+
 async def test_add_music(client):
     headers = await get_token(client)
     new_music_data = {
@@ -40,6 +154,92 @@ async def test_add_music(client):
     assert json_response["link"] == new_music_data["link"]
 
 
+async def test_import_musics_from_ndjson(client):
+    headers = await get_token(client)
+    body = "\n".join(
+        [
+            '{"title": "Imported", "artist": "Someone", "link": "https://example.com/1"}',
+            '{"title": "Imported", "artist": "Someone", "link": "https://example.com/1"}',
+            '{"title": "%s", "artist": "%s", "link": "https://example.com/2"}'
+            % (seed_music_left_out["title"], seed_music_left_out["artist"]),
+            "not json",
+            '{"title": "Missing fields"}',
+        ]
+    )
+    response = await client.post(
+        "/music/import",
+        content=body,
+        headers={**headers, "Content-Type": "application/x-ndjson"},
+    )
+    json_response = response.json()
+
+    assert response.status_code == 200
+    assert json_response["inserted"] == 1
+    assert json_response["skipped"] == 2
+    assert json_response["failed"] == 2
+    assert [error["line"] for error in json_response["errors"]] == [4, 5]
+
+
+async def test_import_musics_from_csv(client):
+    headers = await get_token(client)
+    body = (
+        "title,artist,link\r\n"
+        '"Song, with comma",Band,https://example.com/a\r\n'
+        "Other Song,Band,https://example.com/b\r\n"
+    )
+    response = await client.post(
+        "/music/import",
+        params={"format": "csv"},
+        content=body,
+        headers={**headers, "Content-Type": "text/csv"},
+    )
+
+    assert response.status_code == 200
+    assert response.json()["inserted"] == 2
+
+    musics = await client.get("/music/all")
+    assert "Song, with comma" in [music["title"] for music in musics.json()]
+
+
+async def test_import_musics_from_csv_with_quoted_line_breaks(client):
+    headers = await get_token(client)
+    body = (
+        "title,artist,link\r\n"
+        '"Song\r\nin two lines",Band,https://example.com/a\r\n'
+        'Song "Quoted",Band,https://example.com/b\r\n'
+        "Missing link,Band\r\n"
+    )
+    response = await client.post(
+        "/music/import",
+        params={"format": "csv"},
+        content=body,
+        headers={**headers, "Content-Type": "text/csv"},
+    )
+
+    assert response.json()["inserted"] == 2
+    assert [error["line"] for error in response.json()["errors"]] == [5]
+    musics = await client.get("/music/all")
+    assert "Song\nin two lines" in [music["title"] for music in musics.json()]
+
+
+async def test_failed_import_batches_do_not_leak_the_statement(client, monkeypatch):
+    async def broken_insert(db, batch, user_id):
+        raise OperationalError("INSERT INTO musics ...", {"title": "Secret"}, None)
+
+    monkeypatch.setattr(music_services, "_insert_import_batch", broken_insert)
+    headers = await get_token(client)
+    body = "\n".join(
+        '{"title": "Song %d", "artist": "Band", "link": "l"}' % index
+        for index in range(3)
+    )
+    response = await client.post("/music/import", content=body, headers=headers)
+
+    assert response.json()["failed"] == 3
+    assert response.json()["errors"] == [
+        {"line": 3, "error": "Rows 1-3 could not be inserted"}
+    ]
+
+
 async def test_get_music_list_added_by_user(client):
     response = await client.get(f"/music/from-user/{seed_user['id']}")
     json_response = response.json()
@@ -55,6 +255,46 @@ async def test_get_music_list_added_by_user(client):
     assert json_response[1]["link"] == seed_music_left_out["link"]
 
 
+async def test_get_music_list_added_by_user_with_cursor(client):
+    first_page = await client.get(
+        f"/music/from-user/{seed_user['id']}", params={"limit": 1}
+    )
+    second_page = await client.get(
+        f"/music/from-user/{seed_user['id']}",
+        params={"limit": 1, "cursor": first_page.headers["X-Next-Cursor"]},
+    )
+
+    assert second_page.status_code == 200
+    assert [music["id"] for music in second_page.json()] == [
+        seed_music_left_out["id"]
+    ]
+
+
+async def test_get_music_by_id_not_modified(client):
+    url = f"/music/{seed_music_in_playlist['id']}"
+    first = await client.get(url)
+    etag = first.headers["ETag"]
+
+    assert first.status_code == 200
+    assert first.json() == seed_music_in_playlist
+
+    cached = await client.get(url, headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+
+    headers = await get_token(client)
+    await client.put(url, json={"link": "https://example.com/new"}, headers=headers)
+    changed = await client.get(url, headers={"If-None-Match": etag})
+
+    assert changed.status_code == 200
+    assert changed.json()["link"] == "https://example.com/new"
+
+
+async def test_get_missing_music_by_id(client):
+    response = await client.get("/music/999")
+
+    assert response.status_code == 404
+
+
 async def test_update_music(client):
     updated_music_data = {
         "title": "updated title",
@@ -86,3 +326,73 @@ async def test_delete_music(client):
     assert response_json["title"] == seed_music_in_playlist["title"]
     assert response_json["artist"] == seed_music_in_playlist["artist"]
     assert response_json["link"] == seed_music_in_playlist["link"]
+
+
+async def test_music_mutations_tell_missing_from_forbidden(client):
+    await client.post(
+        "/users",
+        json={
+            "username": "other_user",
+            "email": "other_user@email.com",
+            "password": "password123",
+        },
+    )
+    login = await client.post(
+        "/users/login",
+        json={"email": "other_user@email.com", "password": "password123"},
+    )
+    other_headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+    music_url = f"/music/{seed_music_in_playlist['id']}"
+
+    update = await client.put(music_url, json={"title": "x"}, headers=other_headers)
+    delete = await client.delete(music_url, headers=other_headers)
+    missing = await client.put("/music/999", json={"title": "x"}, headers=other_headers)
+    playlists = await client.get(f"/playlist/from-user/{seed_user['id']}")
+
+    assert update.status_code == delete.status_code == 403
+    assert missing.status_code == 404
+    # The refused delete left the track in its playlists
+    assert [playlist["track_count"] for playlist in playlists.json()] == [1]
+
+
+async def test_own_profile_counters_follow_new_musics(client):
+    headers = await get_token(client)
+    before = await client.get("/users/me", headers=headers)  # caches the principal
+
+    await client.post(
+        "/music",
+        json={"title": "Counted", "artist": "Someone", "link": "https://x.y"},
+        headers=headers,
+    )
+    after = await client.get("/users/me", headers=headers)
+
+    assert before.json()["added_musics_count"] == seed_user["added_musics_count"]
+    assert after.json()["added_musics_count"] == seed_user["added_musics_count"] + 1
+
+
+async def test_music_counters_follow_adds_imports_and_deletes(client):
+    headers = await get_token(client)
+
+    async def user_count():
+        response = await client.get(f"/users/{seed_user['id']}")
+        return response.json()["added_musics_count"]
+
+    await client.post(
+        "/music",
+        json={"title": "Counted", "artist": "Someone", "link": "https://x.y"},
+        headers=headers,
+    )
+    assert await user_count() == seed_user["added_musics_count"] + 1
+    await client.post(
+        "/music/import",
+        content='{"title": "Imported", "artist": "Someone", "link": "l"}\n',
+        headers=headers,
+    )
+    assert await user_count() == seed_user["added_musics_count"] + 2
+
+    await client.delete(f"/music/{seed_music_in_playlist['id']}", headers=headers)
+    assert await user_count() == seed_user["added_musics_count"] + 1
+    listing = await client.get(
+        f"/playlist/from-user/{seed_user['id']}", headers=headers
+    )
+    assert [playlist["track_count"] for playlist in listing.json()] == [0, 0]
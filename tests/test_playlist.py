@@ -1,3 +1,8 @@
+import json
+from sqlalchemy import literal, select, update
+from app.db.models import POSITION_GAP, Playlist, User, playlist_music_association
+from app.services import playlist as playlist_services
+from app.scripts.rebuild_counters import rebuild_counters
 from tests.test_helpers import (
     seed_music_in_playlist,
     seed_music_left_out,
@@ -40,6 +45,18 @@ async def test_get_user_playlists_as_owner(client):
     assert json_response[1]["private"] == private_seed_playlist["private"]
 
 
+async def test_get_user_playlists_in_id_order(client):
+    headers = await get_token(client)
+    await client.post(
+        "/playlist", json={"name": "Public again", "private": False}, headers=headers
+    )
+    response = await client.get(
+        f"/playlist/from-user/{seed_user['id']}", headers=headers
+    )
+
+    assert [playlist["id"] for playlist in response.json()] == [1, 2, 3]
+
+
 async def test_get_user_playlists_as_random(client):
     response = await client.get(
         f"/playlist/from-user/{seed_user['id']}",
@@ -77,6 +94,61 @@ async def test_add_already_added_music_to_playlist(client):
     assert response.status_code == 409
 
 
+async def test_add_musics_to_playlist_in_bulk(client, query_counter):
+    headers = await get_token(client)
+    await client.get("/users/me", headers=headers)  # warm the principal cache
+    query_counter.clear()
+    response = await client.post(
+        f"/playlist/{public_seed_playlist['id']}/add-musics",
+        json={
+            "music_ids": [
+                seed_music_left_out["id"],
+                seed_music_in_playlist["id"],
+                999,
+            ]
+        },
+        headers=headers,
+    )
+
+    assert response.status_code == 200
+    assert response.json() == [
+        {"music_id": seed_music_left_out["id"], "status": "added"},
+        {"music_id": seed_music_in_playlist["id"], "status": "already_in_playlist"},
+        {"music_id": 999, "status": "not_found"},
+    ]
+    # owner check, insert, lookup for the ids that were not inserted, version bump
+    assert len(query_counter) == 4
+
+    playlist = await client.get(f"/playlist/{public_seed_playlist['id']}/musics")
+    assert len(playlist.json()["musics"]) == 2
+
+
+async def test_remove_musics_from_playlist_in_bulk(client):
+    headers = await get_token(client)
+    response = await client.put(
+        f"/playlist/{public_seed_playlist['id']}/remove-musics",
+        json={"music_ids": [seed_music_in_playlist["id"], seed_music_left_out["id"]]},
+        headers=headers,
+    )
+
+    assert response.status_code == 200
+    assert response.json() == [
+        {"music_id": seed_music_in_playlist["id"], "status": "removed"},
+        {"music_id": seed_music_left_out["id"], "status": "not_in_playlist"},
+    ]
+
+
+async def test_add_musics_to_missing_playlist(client):
+    headers = await get_token(client)
+    response = await client.post(
+        "/playlist/999/add-musics",
+        json={"music_ids": [seed_music_left_out["id"]]},
+        headers=headers,
+    )
+
+    assert response.status_code == 404
+
+
 async def test_get_musics_from_public_playlist_as_unknown(client):
     response = await client.get(f"/playlist/{public_seed_playlist['id']}/musics")
     json_response = response.json()
@@ -98,6 +170,138 @@ async def test_get_musics_from_public_playlist_as_unknown(client):
     ]
 
 
+async def test_get_musics_from_playlist_by_page(client):
+    headers = await get_token(client)
+    await client.post(
+        f"/playlist/{public_seed_playlist['id']}/add-music/{seed_music_left_out['id']}",
+        headers=headers,
+    )
+
+    first_page = await client.get(
+        f"/playlist/{public_seed_playlist['id']}/musics", params={"limit": 1}
+    )
+    second_page = await client.get(
+        f"/playlist/{public_seed_playlist['id']}/musics",
+        params={"limit": 1, "cursor": first_page.headers["X-Next-Cursor"]},
+    )
+
+    assert first_page.status_code == 200
+    assert first_page.json()["name"] == public_seed_playlist["name"]
+    assert first_page.json()["musics"] == [seed_music_in_playlist]
+    assert second_page.status_code == 200
+    assert second_page.json()["musics"] == [seed_music_left_out]
+
+
+async def test_stream_musics_from_playlist_as_ndjson(client):
+    response = await client.get(
+        f"/playlist/{public_seed_playlist['id']}/musics",
+        params={"format": "ndjson"},
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line) for line in response.text.splitlines()] == [
+        seed_music_in_playlist
+    ]
+
+
+async def test_stream_musics_from_private_playlist_as_unknown(client):
+    response = await client.get(
+        f"/playlist/{private_seed_playlist['id']}/musics",
+        params={"format": "ndjson"},
+    )
+
+    assert response.status_code == 401
+
+
+async def test_playlist_musics_not_modified(client, query_counter):
+    url = f"/playlist/{public_seed_playlist['id']}/musics"
+    first = await client.get(url)
+    etag = first.headers["ETag"]
+
+    query_counter.clear()
+    cached = await client.get(url, headers={"If-None-Match": etag})
+
+    assert cached.status_code == 304
+    assert cached.headers["ETag"] == etag
+    assert cached.content == b""
+    assert len(query_counter) == 0  # answered from the response cache
+
+    headers = await get_token(client)
+    await client.post(
+        f"/playlist/{public_seed_playlist['id']}/add-music/{seed_music_left_out['id']}",
+        headers=headers,
+    )
+    changed = await client.get(url, headers={"If-None-Match": etag})
+
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert len(changed.json()["musics"]) == 2
+
+
+async def test_private_playlist_stays_out_of_the_response_cache(client):
+    url = f"/playlist/{private_seed_playlist['id']}/musics"
+    headers = await get_token(client)
+    owner = await client.get(url, headers=headers)
+    anonymous = await client.get(url)
+
+    assert owner.status_code == 200
+    assert anonymous.status_code == 401
+
+
+async def test_playlist_made_private_leaves_the_response_cache(client):
+    url = f"/playlist/{public_seed_playlist['id']}/musics"
+    assert (await client.get(url)).status_code == 200
+
+    headers = await get_token(client)
+    await client.put(
+        f"/playlist/{public_seed_playlist['id']}",
+        json={"private": True},
+        headers=headers,
+    )
+    listing = await client.get(f"/playlist/from-user/{seed_user['id']}")
+
+    assert (await client.get(url)).status_code == 401
+    assert listing.json() == []
+
+
+async def test_playlist_etag_changes_when_a_track_changes(client):
+    url = f"/playlist/{public_seed_playlist['id']}/musics"
+    etag = (await client.get(url)).headers["ETag"]
+
+    headers = await get_token(client)
+    await client.put(
+        f"/music/{seed_music_in_playlist['id']}",
+        json={"title": "New title"},
+        headers=headers,
+    )
+    response = await client.get(url, headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.json()["musics"][0]["title"] == "New title"
+
+
+async def test_user_playlists_not_modified(client):
+    url = f"/playlist/from-user/{seed_user['id']}"
+    etag = (await client.get(url)).headers["ETag"]
+
+    cached = await client.get(url, headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+
+    headers = await get_token(client)
+    as_owner = await client.get(url, headers={**headers, "If-None-Match": etag})
+    assert as_owner.status_code == 200
+
+    await client.put(
+        f"/playlist/{public_seed_playlist['id']}",
+        json={"name": "renamed"},
+        headers=headers,
+    )
+    renamed = await client.get(url, headers={"If-None-Match": etag})
+    assert renamed.status_code == 200
+    assert renamed.json()[0]["name"] == "renamed"
+
+
 async def test_get_musics_from_private_playlist_as_unknown(client):
     response = await client.get(f"/playlist/{private_seed_playlist['id']}/musics")
 
@@ -153,6 +357,58 @@ async def test_delete_playlist(client):
     assert json_response["owner_id"] == private_seed_playlist["owner_id"]
 
 
+async def test_playlist_mutations_tell_missing_from_forbidden(client):
+    await client.post(
+        "/users",
+        json={
+            "username": "other_user",
+            "email": "other_user@email.com",
+            "password": "password123",
+        },
+    )
+    login = await client.post(
+        "/users/login",
+        json={"email": "other_user@email.com", "password": "password123"},
+    )
+    other_headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+    playlist_url = f"/playlist/{public_seed_playlist['id']}"
+
+    update = await client.put(playlist_url, json={"name": "x"}, headers=other_headers)
+    delete = await client.delete(playlist_url, headers=other_headers)
+    missing = await client.delete("/playlist/999", headers=other_headers)
+    musics = await client.get(f"{playlist_url}/musics")
+
+    assert update.status_code == delete.status_code == 403
+    assert missing.status_code == 404
+    # The refused delete left the playlist and its tracks alone
+    assert musics.status_code == 200
+    assert musics.json()["name"] == public_seed_playlist["name"]
+    assert musics.json()["musics"] == [seed_music_in_playlist]
+
+
+async def test_racing_appends_get_a_conflict(client, monkeypatch):
+    headers = await get_token(client)
+    # As if another append committed after this one read the last position:
+    # the next slot lands on the seed track's position (0)
+    monkeypatch.setattr(
+        playlist_services, "_last_position", lambda playlist_id: literal(-POSITION_GAP)
+    )
+    playlist_url = f"/playlist/{public_seed_playlist['id']}"
+
+    single = await client.post(
+        f"{playlist_url}/add-music/{seed_music_left_out['id']}", headers=headers
+    )
+    bulk = await client.post(
+        f"{playlist_url}/add-musics",
+        json={"music_ids": [seed_music_left_out["id"]]},
+        headers=headers,
+    )
+    musics = await client.get(f"{playlist_url}/musics")
+
+    assert single.status_code == bulk.status_code == 409
+    assert musics.json()["track_count"] == 1
+
+
 async def test_remove_music_from_playlist(client):
     headers = await get_token(client)
     response = await client.put(
@@ -167,3 +423,307 @@ async def test_remove_music_from_playlist(client):
     assert json_response["artist"] == seed_music_in_playlist["artist"]
     assert json_response["link"] == seed_music_in_playlist["link"]
     assert json_response["added_by"] == seed_music_in_playlist["added_by"]
+
+
+async def test_track_and_playlist_counters_follow_edits(client):
+    headers = await get_token(client)
+    playlist_id = public_seed_playlist["id"]
+
+    async def track_count():
+        listing = await client.get(f"/playlist/from-user/{seed_user['id']}")
+        return listing.json()[0]["track_count"]
+
+    assert await track_count() == 1
+    await client.post(
+        f"/playlist/{playlist_id}/add-music/{seed_music_left_out['id']}",
+        headers=headers,
+    )
+    assert await track_count() == 2
+    await client.put(
+        f"/playlist/{playlist_id}/remove-musics",
+        json={"music_ids": [seed_music_in_playlist["id"], seed_music_left_out["id"]]},
+        headers=headers,
+    )
+    assert await track_count() == 0
+    await client.post(
+        f"/playlist/{playlist_id}/add-musics",
+        json={"music_ids": [seed_music_in_playlist["id"], 999]},
+        headers=headers,
+    )
+    await client.put(
+        f"/playlist/{playlist_id}/remove-music/{seed_music_in_playlist['id']}",
+        headers=headers,
+    )
+    assert await track_count() == 0
+
+    created = await client.post(
+        "/playlist", json={"name": "Counted", "private": True}, headers=headers
+    )
+    assert created.json()["track_count"] == 0
+    user = await client.get(f"/users/{seed_user['id']}")
+    assert user.json()["playlists_count"] == 3
+
+    await client.delete(f"/playlist/{created.json()['id']}", headers=headers)
+    await client.delete(f"/playlist/{private_seed_playlist['id']}", headers=headers)
+    user = await client.get(f"/users/{seed_user['id']}")
+    assert user.json()["playlists_count"] == 1
+
+
+async def test_rebuild_counters_repairs_drift(client, db):
+    async with db.bind.begin() as connection:
+        await connection.execute(update(Playlist).values(track_count=42))
+        await connection.execute(
+            update(User).values(added_musics_count=0, playlists_count=7)
+        )
+
+    report = await rebuild_counters(db.bind, batch_size=1)
+
+    assert report == {
+        "playlists.track_count": 2,
+        "users.added_musics_count": 1,
+        "users.playlists_count": 1,
+    }
+    user = (await client.get(f"/users/{seed_user['id']}")).json()
+    assert user["added_musics_count"] == seed_user["added_musics_count"]
+    assert user["playlists_count"] == seed_user["playlists_count"]
+    listing = await client.get(f"/playlist/from-user/{seed_user['id']}")
+    assert listing.json()[0]["track_count"] == public_seed_playlist["track_count"]
+    assert await rebuild_counters(db.bind) == dict.fromkeys(report, 0)
+
+
+async def import_tracks(client, headers, count: int) -> list[int]:
+    body = "\n".join(
+        f'{{"title": "Track {number}", "artist": "Ordered", "link": "l"}}'
+        for number in range(count)
+    )
+    await client.post("/music/import", content=body, headers=headers)
+    response = await client.get("/music/all", params={"limit": 100})
+    return [music["id"] for music in response.json()][-count:]
+
+
+async def playlist_order(client, headers, playlist_id: int) -> list[int]:
+    response = await client.get(f"/playlist/{playlist_id}/musics", headers=headers)
+    return [music["id"] for music in response.json()["musics"]]
+
+
+async def test_add_move_and_insert_keep_playlist_order(client):
+    headers = await get_token(client)
+    playlist_id = public_seed_playlist["id"]
+    first, second, third = await import_tracks(client, headers, 3)
+    seed_id = seed_music_in_playlist["id"]
+
+    await client.post(
+        f"/playlist/{playlist_id}/add-musics",
+        json={"music_ids": [third, first]},
+        headers=headers,
+    )
+    assert await playlist_order(client, headers, playlist_id) == [seed_id, third, first]
+
+    response = await client.post(
+        f"/playlist/{playlist_id}/add-music/{second}",
+        params={"before": first},
+        headers=headers,
+    )
+    assert response.status_code == 201
+    assert await playlist_order(client, headers, playlist_id) == [
+        seed_id,
+        third,
+        second,
+        first,
+    ]
+
+    response = await client.put(
+        f"/playlist/{playlist_id}/move-music/{first}",
+        params={"before": seed_id},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    assert response.json() == {"music_id": first, "status": "moved"}
+    response = await client.put(
+        f"/playlist/{playlist_id}/move-music/{third}", headers=headers
+    )
+    assert await playlist_order(client, headers, playlist_id) == [
+        first,
+        seed_id,
+        second,
+        third,
+    ]
+
+    pages, params = [], {"limit": 3}
+    while True:
+        page = await client.get(f"/playlist/{playlist_id}/musics", params=params)
+        pages.append([music["id"] for music in page.json()["musics"]])
+        if "X-Next-Cursor" not in page.headers:
+            break
+        params = {"limit": 3, "cursor": page.headers["X-Next-Cursor"]}
+    assert pages == [[first, seed_id, second], [third]]
+    assert "position" not in page.json()["musics"][0]
+
+
+async def test_move_music_errors(client):
+    headers = await get_token(client)
+    playlist_id = public_seed_playlist["id"]
+
+    not_in_playlist = await client.put(
+        f"/playlist/{playlist_id}/move-music/{seed_music_left_out['id']}",
+        headers=headers,
+    )
+    missing_anchor = await client.put(
+        f"/playlist/{playlist_id}/move-music/{seed_music_in_playlist['id']}",
+        params={"before": seed_music_left_out["id"]},
+        headers=headers,
+    )
+
+    assert not_in_playlist.status_code == 403
+    assert missing_anchor.status_code == 404
+
+
+async def test_inserting_into_an_exhausted_gap_rebalances(client, db):
+    headers = await get_token(client)
+    playlist_id = public_seed_playlist["id"]
+    seed_id = seed_music_in_playlist["id"]
+    # More inserts at one spot than halving the gap allows, each lands first
+    music_ids = await import_tracks(client, headers, 20)
+
+    for music_id in music_ids:
+        response = await client.post(
+            f"/playlist/{playlist_id}/add-music/{music_id}",
+            params={"before": seed_id},
+            headers=headers,
+        )
+        assert response.status_code == 201, response.text
+        response = await client.put(
+            f"/playlist/{playlist_id}/move-music/{music_id}",
+            params={"before": music_ids[0]},
+            headers=headers,
+        )
+
+    assert await playlist_order(client, headers, playlist_id) == [
+        *music_ids[1:],
+        music_ids[0],
+        seed_id,
+    ]
+    positions = (
+        await db.execute(
+            select(playlist_music_association.c.position)
+            .where(playlist_music_association.c.playlist_id == playlist_id)
+            .order_by(playlist_music_association.c.position)
+        )
+    ).scalars()
+    assert min(positions) >= 0
+
+
+async def test_copy_playlist_keeps_tracks_and_order(client):
+    headers = await get_token(client)
+    source_id = public_seed_playlist["id"]
+    await client.post(
+        f"/playlist/{source_id}/add-music/{seed_music_left_out['id']}",
+        params={"before": seed_music_in_playlist["id"]},
+        headers=headers,
+    )
+
+    response = await client.post(f"/playlist/{source_id}/copy", headers=headers)
+    copy = response.json()
+    musics = await client.get(f"/playlist/{copy['id']}/musics")
+    user = await client.get(f"/users/{seed_user['id']}")
+
+    assert response.status_code == 201
+    assert copy["name"] == f"{public_seed_playlist['name']} (copy)"
+    assert copy["private"] is False
+    assert copy["track_count"] == 2
+    assert [music["id"] for music in musics.json()["musics"]] == [
+        seed_music_left_out["id"],
+        seed_music_in_playlist["id"],
+    ]
+    assert user.json()["playlists_count"] == 3
+
+
+async def test_copy_playlist_follows_read_rules(client):
+    await client.post(
+        "/users",
+        json={
+            "username": "other_user",
+            "email": "other_user@email.com",
+            "password": "password123",
+        },
+    )
+    login = await client.post(
+        "/users/login",
+        json={"email": "other_user@email.com", "password": "password123"},
+    )
+    other_headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    private = await client.post(
+        f"/playlist/{private_seed_playlist['id']}/copy", headers=other_headers
+    )
+    missing = await client.post("/playlist/999/copy", headers=other_headers)
+    public = await client.post(
+        f"/playlist/{public_seed_playlist['id']}/copy",
+        json={"name": "Mine now", "private": True},
+        headers=other_headers,
+    )
+
+    assert private.status_code == 401
+    assert missing.status_code == 404
+    assert public.status_code == 201
+    assert public.json()["name"] == "Mine now"
+    assert public.json()["private"] is True
+    assert public.json()["owner_id"] != seed_user["id"]
+    assert public.json()["track_count"] == 1
+
+
+async def test_merge_playlist_appends_missing_tracks(client):
+    headers = await get_token(client)
+    await client.post(
+        f"/playlist/{public_seed_playlist['id']}/add-music/{seed_music_left_out['id']}",
+        headers=headers,
+    )
+    merge_url = (
+        f"/playlist/{private_seed_playlist['id']}/merge/{public_seed_playlist['id']}"
+    )
+
+    merged = await client.post(merge_url, headers=headers)
+    again = await client.post(merge_url, headers=headers)
+    musics = await client.get(
+        f"/playlist/{private_seed_playlist['id']}/musics", headers=headers
+    )
+
+    assert merged.status_code == 200
+    assert merged.json()["track_count"] == 2
+    assert again.json()["track_count"] == 2
+    assert [music["id"] for music in musics.json()["musics"]] == [
+        seed_music_in_playlist["id"],
+        seed_music_left_out["id"],
+    ]
+
+
+async def test_combine_playlists(client):
+    headers = await get_token(client)
+    first, second = public_seed_playlist["id"], private_seed_playlist["id"]
+    await client.post(
+        f"/playlist/{first}/add-music/{seed_music_left_out['id']}", headers=headers
+    )
+
+    async def combine(operation, playlist_ids):
+        response = await client.post(
+            "/playlist/combine",
+            json={
+                "name": operation,
+                "operation": operation,
+                "playlist_ids": playlist_ids,
+            },
+            headers=headers,
+        )
+        assert response.status_code == 201
+        musics = await client.get(
+            f"/playlist/{response.json()['id']}/musics", headers=headers
+        )
+        track_ids = [music["id"] for music in musics.json()["musics"]]
+        assert response.json()["track_count"] == len(track_ids)
+        return track_ids
+
+    in_playlist, left_out = seed_music_in_playlist["id"], seed_music_left_out["id"]
+    assert await combine("union", [second, first]) == [in_playlist, left_out]
+    assert await combine("intersection", [first, second]) == [in_playlist]
+    assert await combine("difference", [first, second]) == [left_out]
+    assert await combine("difference", [second, first]) == []
@@ -0,0 +1,228 @@
+import pytest
+from tests.test_helpers import get_token
+
+# (method, url, request options, needs a token, most statements allowed)
+# Authenticated calls are measured with the principal cache warm, as in steady state.
+ROUTE_BUDGETS = {
+    "GET /": ("GET", "/", {}, False, 0),
+    "GET /livez": ("GET", "/livez", {}, False, 0),
+    "GET /readyz": ("GET", "/readyz", {}, False, 0),
+    "GET /db/pool": ("GET", "/db/pool", {}, False, 0),
+    "GET /metrics": ("GET", "/metrics", {}, False, 0),
+    "POST /users": (
+        "POST",
+        "/users",
+        {
+            "json": {
+                "username": "budget_user",
+                "email": "budget_user@email.com",
+                "password": "password123",
+            }
+        },
+        False,
+        2,
+    ),
+    "POST /users/login": (
+        "POST",
+        "/users/login",
+        {"json": {"email": "seed_user@email.com", "password": "password123"}},
+        False,
+        1,
+    ),
+    "GET /users/me": ("GET", "/users/me", {}, True, 0),
+    "GET /users/{user_id}": ("GET", "/users/1", {}, False, 2),
+    "GET /users": ("GET", "/users", {}, False, 1),
+    "PUT /users/{user_id}": (
+        "PUT",
+        "/users/1",
+        {"json": {"username": "renamed"}},
+        True,
+        3,
+    ),
+    "DELETE /users/{user_id}": ("DELETE", "/users/1", {}, True, 2),
+    "POST /music": (
+        "POST",
+        "/music",
+        {"json": {"title": "New", "artist": "Someone", "link": "https://x.y"}},
+        True,
+        3,
+    ),
+    "POST /music/import": (
+        "POST",
+        "/music/import",
+        {
+            "content": '{"title": "A", "artist": "B", "link": "l"}\n'
+            '{"title": "C", "artist": "D", "link": "l"}\n'
+        },
+        True,
+        2,
+    ),
+    "POST /music/import?async": (
+        "POST",
+        "/music/import",
+        {
+            "content": '{"title": "A", "artist": "B", "link": "l"}\n',
+            "headers": {"Prefer": "respond-async"},
+        },
+        True,
+        1,
+    ),
+    "GET /music/all": ("GET", "/music/all", {}, False, 1),
+    "GET /music/search": ("GET", "/music/search", {"params": {"q": "seed"}}, False, 1),
+    "GET /music/from-user/{user_id}": ("GET", "/music/from-user/1", {}, False, 3),
+    "GET /music/{music_id}": ("GET", "/music/1", {}, False, 2),
+    "PUT /music/{music_id}": (
+        "PUT",
+        "/music/2",
+        {"json": {"title": "Renamed"}},
+        True,
+        2,
+    ),
+    "DELETE /music/{music_id}": ("DELETE", "/music/2", {}, True, 3),
+    "POST /playlist": (
+        "POST",
+        "/playlist",
+        {"json": {"name": "Budget", "private": False}},
+        True,
+        3,
+    ),
+    "POST /playlist/{playlist_id}/add-music/{music_id}": (
+        "POST",
+        "/playlist/1/add-music/2",
+        {},
+        True,
+        5,
+    ),
+    "POST /playlist/{playlist_id}/add-musics": (
+        "POST",
+        "/playlist/1/add-musics",
+        {"json": {"music_ids": [1, 2]}},
+        True,
+        4,
+    ),
+    "POST /playlist/{playlist_id}/copy": (
+        "POST",
+        "/playlist/1/copy",
+        {},
+        True,
+        5,
+    ),
+    "POST /playlist/{playlist_id}/copy?async": (
+        "POST",
+        "/playlist/1/copy",
+        {"headers": {"Prefer": "respond-async"}},
+        True,
+        1,
+    ),
+    "POST /playlist/{playlist_id}/merge/{source_id}": (
+        "POST",
+        "/playlist/2/merge/1",
+        {},
+        True,
+        4,
+    ),
+    "POST /playlist/combine": (
+        "POST",
+        "/playlist/combine",
+        {
+            "json": {
+                "name": "Combined",
+                "operation": "union",
+                "playlist_ids": [1, 2],
+            }
+        },
+        True,
+        5,
+    ),
+    "POST /playlist/combine?async": (
+        "POST",
+        "/playlist/combine",
+        {
+            "json": {
+                "name": "Combined",
+                "operation": "union",
+                "playlist_ids": [1, 2],
+            },
+            "headers": {"Prefer": "respond-async"},
+        },
+        True,
+        1,
+    ),
+    "GET /playlist/from-user/{user_id}": ("GET", "/playlist/from-user/1", {}, False, 2),
+    "GET /playlist/{playlist_id}/musics": ("GET", "/playlist/1/musics", {}, False, 2),
+    "GET /playlist/{playlist_id}/musics?limit": (
+        "GET",
+        "/playlist/1/musics",
+        {"params": {"limit": 1}},
+        False,
+        2,
+    ),
+    "GET /playlist/{playlist_id}/musics?format=ndjson": (
+        "GET",
+        "/playlist/1/musics",
+        {"params": {"format": "ndjson"}},
+        False,
+        2,
+    ),
+    "PUT /playlist/{playlist_id}/remove-music/{music_id}": (
+        "PUT",
+        "/playlist/1/remove-music/1",
+        {},
+        True,
+        5,
+    ),
+    "PUT /playlist/{playlist_id}/move-music/{music_id}": (
+        "PUT",
+        "/playlist/1/move-music/1",
+        {},
+        True,
+        3,
+    ),
+    "PUT /playlist/{playlist_id}/remove-musics": (
+        "PUT",
+        "/playlist/1/remove-musics",
+        {"json": {"music_ids": [1, 2]}},
+        True,
+        3,
+    ),
+    "PUT /playlist/{playlist_id}": (
+        "PUT",
+        "/playlist/1",
+        {"json": {"name": "Renamed"}},
+        True,
+        1,
+    ),
+    "DELETE /playlist/{playlist_id}": ("DELETE", "/playlist/2", {}, True, 2),
+    "GET /jobs/{job_id}": ("GET", "/jobs/1", {}, True, 1),
+}
+
+
+def test_every_route_has_a_budget():
+    from app.main import app
+
+    routes = {
+        f"{method} {route.path}"
+        for route in app.routes
+        if getattr(route, "include_in_schema", False)
+        or route.path in ("/metrics", "/livez", "/readyz")
+        for method in getattr(route, "methods", ())
+        if method != "HEAD"
+    }
+    budgeted = {name.split("?")[0] for name in ROUTE_BUDGETS}
+
+    assert routes - budgeted == set()
+
+
+@pytest.mark.parametrize("name", ROUTE_BUDGETS)
+async def test_route_query_budget(name, client, query_budget):
+    method, url, options, needs_token, budget = ROUTE_BUDGETS[name]
+    options = dict(options)
+    headers = options.pop("headers", {})
+    if needs_token:
+        headers = {**headers, **(await get_token(client))}
+        await client.get("/users/me", headers=headers)  # warm the principal cache
+
+    with query_budget(budget):
+        response = await client.request(method, url, headers=headers, **options)
+
+    assert response.status_code < 400, response.text
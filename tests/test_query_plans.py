@@ -0,0 +1,271 @@
+import pytest
+from sqlalchemy import event
+from app.scripts.generate_dataset import generate_dataset
+from app.utils.functions import encode_cursor
+from tests.test_helpers import (
+    get_token,
+    private_seed_playlist,
+    public_seed_playlist,
+    seed_music_left_out,
+    seed_user,
+)
+
+# Tables that grow with the catalog, a full scan of any of them is a regression
+HOT_TABLES = {"users", "musics", "playlists", "playlist_music"}
+
+# Scans that stay: they walk the primary key in order and stop after one page
+BOUNDED_SCANS = {
+    ("GET /music/all?skip", "musics"),
+    ("GET /users?skip", "users"),
+}
+
+# Scans waiting for an index, remove the entry once the query stops scanning
+KNOWN_SCANS = set()
+
+# Routes that read none of HOT_TABLES, so there is no plan to check
+UNPLANNED_ROUTES = {
+    "GET /",
+    "GET /db/pool",
+    "GET /jobs/{job_id}",
+    "GET /livez",
+    "GET /metrics",
+    "GET /readyz",
+}
+
+
+@pytest.fixture
+async def dataset(db):
+    return await generate_dataset(
+        db.bind,
+        users=200,
+        musics=2_000,
+        playlists=300,
+        max_playlist_size=200,
+        seed=13,
+        batch_size=1_000,
+        password_hash=seed_user["password"],
+    )
+
+
+@pytest.fixture
+def recorded_statements(db):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().split()[0].upper() in (
+            "SELECT",
+            "INSERT",
+            "UPDATE",
+            "DELETE",
+            "WITH",
+        ):
+            statements.append((statement, parameters))
+
+    event.listen(db.bind.sync_engine, "before_cursor_execute", record)
+    yield statements
+    event.remove(db.bind.sync_engine, "before_cursor_execute", record)
+
+
+# * Tables SQLite walks end to end for a statement: SCAN over the table or a whole
+# * index, or a skip-scan (ANY(column)) that probes once per value of the first column
+async def full_scans(engine, statement: str, parameters) -> set[str]:
+    async with engine.connect() as connection:
+        result = await connection.exec_driver_sql(
+            f"EXPLAIN QUERY PLAN {statement}", parameters
+        )
+        details = [row[3] for row in result.all()]
+    return {
+        detail.split()[1]
+        for detail in details
+        if (detail.startswith("SCAN ") or "ANY(" in detail)
+        and "VIRTUAL TABLE" not in detail
+    } & HOT_TABLES
+
+
+# * Requests run in this order against the dataset, keyed by route as in
+# * test_query_budgets.py. The deletes come last, the user's goes with everything
+def planned_requests(user_id: int, music_id: int) -> dict:
+    public_id = public_seed_playlist["id"]
+    return {
+        "GET /music/all?skip": ("GET", "/music/all", {"skip": 20}),
+        "GET /music/all?cursor": (
+            "GET",
+            "/music/all",
+            {"limit": 20, "cursor": encode_cursor({"id": music_id})},
+        ),
+        "GET /music/{music_id}": ("GET", f"/music/{music_id}", {}),
+        "GET /music/search": ("GET", "/music/search", {"q": "Track 12"}),
+        "GET /music/from-user/{user_id}": ("GET", f"/music/from-user/{user_id}", {}),
+        "GET /users?skip": ("GET", "/users", {"skip": 20}),
+        "GET /users/{user_id}": ("GET", f"/users/{user_id}", {}),
+        "GET /playlist/from-user/{user_id}": (
+            "GET",
+            f"/playlist/from-user/{user_id}",
+            {},
+        ),
+        "GET /playlist/{playlist_id}/musics": (
+            "GET",
+            f"/playlist/{private_seed_playlist['id']}/musics",
+            {"limit": 50},
+        ),
+        "GET /users/me": ("GET", "/users/me", {}),
+        "POST /users": (
+            "POST",
+            "/users",
+            {
+                "json": {
+                    "username": "planned",
+                    "email": "planned@email.com",
+                    "password": "password123",
+                }
+            },
+        ),
+        "POST /users/login": (
+            "POST",
+            "/users/login",
+            {"json": {"email": "planned@email.com", "password": "password123"}},
+        ),
+        "PUT /users/{user_id}": (
+            "PUT",
+            f"/users/{seed_user['id']}",
+            {"json": {"username": "renamed"}},
+        ),
+        "POST /music": (
+            "POST",
+            "/music",
+            {"json": {"title": "Planned", "artist": "Someone", "link": "l"}},
+        ),
+        "POST /music/import": (
+            "POST",
+            "/music/import",
+            {"content": '{"title": "Imported", "artist": "Someone", "link": "l"}\n'},
+        ),
+        "POST /playlist": (
+            "POST",
+            "/playlist",
+            {"json": {"name": "Planned", "private": False}},
+        ),
+        "POST /playlist/{playlist_id}/add-music/{music_id}": (
+            "POST",
+            f"/playlist/{public_id}/add-music/{seed_music_left_out['id']}",
+            {},
+        ),
+        "PUT /playlist/{playlist_id}/remove-music/{music_id}": (
+            "PUT",
+            f"/playlist/{public_id}/remove-music/{seed_music_left_out['id']}",
+            {},
+        ),
+        "POST /playlist/{playlist_id}/add-musics": (
+            "POST",
+            f"/playlist/{public_id}/add-musics",
+            {"json": {"music_ids": [music_id, music_id + 1]}},
+        ),
+        "PUT /playlist/{playlist_id}/move-music/{music_id}": (
+            "PUT",
+            f"/playlist/{public_id}/move-music/{music_id + 1}",
+            {"before": music_id},
+        ),
+        "PUT /playlist/{playlist_id}/remove-musics": (
+            "PUT",
+            f"/playlist/{public_id}/remove-musics",
+            {"json": {"music_ids": [music_id, music_id + 1]}},
+        ),
+        "PUT /music/{music_id}": (
+            "PUT",
+            f"/music/{seed_music_left_out['id']}",
+            {"json": {"title": "Renamed"}},
+        ),
+        "PUT /playlist/{playlist_id}": (
+            "PUT",
+            f"/playlist/{public_id}",
+            {"json": {"name": "Renamed"}},
+        ),
+        "POST /playlist/{playlist_id}/copy": (
+            "POST",
+            f"/playlist/{public_id}/copy",
+            {},
+        ),
+        "POST /playlist/{playlist_id}/merge/{source_id}": (
+            "POST",
+            f"/playlist/{private_seed_playlist['id']}/merge/{public_id}",
+            {},
+        ),
+        "POST /playlist/combine": (
+            "POST",
+            "/playlist/combine",
+            {
+                "json": {
+                    "name": "Combined",
+                    "operation": "difference",
+                    "playlist_ids": [private_seed_playlist["id"], public_id],
+                }
+            },
+        ),
+        "DELETE /playlist/{playlist_id}": (
+            "DELETE",
+            f"/playlist/{private_seed_playlist['id']}",
+            {},
+        ),
+        "DELETE /music/{music_id}": (
+            "DELETE",
+            f"/music/{seed_music_left_out['id']}",
+            {},
+        ),
+        "DELETE /users/{user_id}": ("DELETE", f"/users/{seed_user['id']}", {}),
+    }
+
+
+def test_every_route_is_planned():
+    from app.main import app
+
+    routes = {
+        f"{method} {route.path}"
+        for route in app.routes
+        if getattr(route, "include_in_schema", False)
+        or route.path in ("/metrics", "/livez", "/readyz")
+        for method in getattr(route, "methods", ())
+        if method != "HEAD"
+    }
+    planned = {name.split("?")[0] for name in planned_requests(user_id=1, music_id=1)}
+
+    assert routes - planned - UNPLANNED_ROUTES == set()
+
+
+async def test_hot_queries_do_not_scan(client, db, dataset, recorded_statements):
+    headers = await get_token(client)
+    requests = planned_requests(
+        user_id=dataset["first_ids"]["user"],
+        music_id=dataset["first_ids"]["music"] + 7,
+    )
+
+    scans = {}
+    for route, (method, url, options) in requests.items():
+        recorded_statements.clear()
+        options = dict(options)
+        json_body = options.pop("json", None)
+        content = options.pop("content", None)
+        response = await client.request(
+            method,
+            url,
+            params=options,
+            json=json_body,
+            content=content,
+            headers=headers,
+        )
+        assert response.status_code < 400, (route, response.text)
+
+        for statement, parameters in recorded_statements:
+            for table in await full_scans(db.bind, statement, parameters):
+                scans.setdefault((route, table), statement)
+
+    unexpected = {
+        key: statement
+        for key, statement in scans.items()
+        if key not in BOUNDED_SCANS and key not in KNOWN_SCANS
+    }
+    assert not unexpected, "Queries regressed to a full table scan:\n" + "\n".join(
+        f"{route} scans {table}: {statement}"
+        for (route, table), statement in unexpected.items()
+    )
+    fixed = set(KNOWN_SCANS) - set(scans)
+    assert not fixed, f"These no longer scan, drop them from KNOWN_SCANS: {fixed}"
@@ -1,4 +1,12 @@
+import asyncio
+import threading
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import func, select
 from tests.test_helpers import get_token, seed_user
+from app.db.models import Music, Playlist, playlist_music_association
+from app.services import auth as auth_services
+from app.utils.executor import BoundedExecutor
 
 
 # registration
@@ -37,6 +45,42 @@ async def test_login(client):
     assert json_login_response["token_type"] == "bearer"
 
 
+# logins past the hashing admission limit fail fast instead of queueing
+async def test_login_rejected_when_hash_pool_is_full(client, monkeypatch):
+    monkeypatch.setattr(auth_services.password_hasher, "max_pending", 0)
+    login_response = await client.post(
+        "/users/login",
+        json={"email": "seed_user@email.com", "password": "password123"},
+    )
+
+    assert login_response.status_code == 503
+    assert login_response.headers["Retry-After"] == "1"
+    assert auth_services.password_hasher.stats()["rejected"] >= 1
+
+
+# a cancelled login keeps its hash counted until the thread is done with it
+async def test_hash_pool_counts_calls_until_their_thread_finishes():
+    executor = BoundedExecutor(max_workers=1, max_pending=1, name="test-hash")
+    release = threading.Event()
+    caller = asyncio.create_task(executor.run(release.wait))
+    await asyncio.sleep(0.05)
+    caller.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await caller
+
+    with pytest.raises(HTTPException):
+        await executor.run(abs, -1)
+    release.set()
+    while executor.pending:
+        await asyncio.sleep(0.01)
+    with pytest.raises(ZeroDivisionError):
+        await executor.run(divmod, 1, 0)
+
+    assert executor.stats()["completed"] == 1  # the failed call does not count
+    assert executor.stats()["rejected"] == 1
+    executor.shutdown()
+
+
 # user health check and data
 async def test_get_me(client):
     headers = await get_token(client)
@@ -49,6 +93,35 @@ async def test_get_me(client):
     assert isinstance(json_response["id"], int)
 
 
+# a warm principal cache serves /users/me without touching the database
+async def test_get_me_with_warm_cache_makes_no_queries(client, query_counter):
+    headers = await get_token(client)
+    await client.get("/users/me", headers=headers)
+    query_counter.clear()
+
+    response = await client.get("/users/me", headers=headers)
+
+    assert response.status_code == 200
+    assert response.json()["username"] == seed_user["username"]
+    assert query_counter == []
+    assert auth_services.principal_cache.stats()["hits"] == 1
+
+
+# updating a user drops the cached principal
+async def test_update_user_invalidates_cached_principal(client):
+    headers = await get_token(client)
+    await client.get("/users/me", headers=headers)
+    await client.put(
+        f"/users/{seed_user['id']}",
+        json={"username": "renamed_user"},
+        headers=headers,
+    )
+
+    response = await client.get("/users/me", headers=headers)
+
+    assert response.json()["username"] == "renamed_user"
+
+
 # find all
 async def test_get_users(client):
     response = await client.get("/users")
@@ -60,10 +133,33 @@ async def test_get_users(client):
             "id": 1,
             "username": seed_user["username"],
             "email": seed_user["email"],
+            "added_musics_count": seed_user["added_musics_count"],
+            "playlists_count": seed_user["playlists_count"],
         }
     ]
 
 
+# find all with keyset pagination
+async def test_get_users_with_cursor(client):
+    await client.post(
+        "/users",
+        json={
+            "username": "second_user",
+            "email": "second_user@email.com",
+            "password": "password123",
+        },
+    )
+    first_page = await client.get("/users", params={"limit": 1})
+    second_page = await client.get(
+        "/users", params={"limit": 1, "cursor": first_page.headers["X-Next-Cursor"]}
+    )
+
+    assert first_page.status_code == 200
+    assert first_page.json()[0]["id"] == seed_user["id"]
+    assert second_page.status_code == 200
+    assert second_page.json()[0]["username"] == "second_user"
+
+
 # find one
 async def test_get_user_by_id(client):
     response = await client.get("/users/1")
@@ -74,6 +170,23 @@ async def test_get_user_by_id(client):
     assert json_response["email"] == seed_user["email"]
 
 
+# find one, conditional
+async def test_get_user_by_id_not_modified(client):
+    etag = (await client.get("/users/1")).headers["ETag"]
+    cached = await client.get("/users/1", headers={"If-None-Match": etag})
+
+    assert cached.status_code == 304
+
+    headers = await get_token(client)
+    await client.put(
+        f"/users/{seed_user['id']}", json={"username": "new_name"}, headers=headers
+    )
+    changed = await client.get("/users/1", headers={"If-None-Match": etag})
+
+    assert changed.status_code == 200
+    assert changed.json()["username"] == "new_name"
+
+
 # update
 async def test_update_user(client):
     headers = await get_token(client)
@@ -100,3 +213,47 @@ async def test_delete_user(client):
     assert response.status_code == 200
     assert response_json["username"] == seed_user["username"]
     assert response_json["email"] == seed_user["email"]
+
+
+async def test_delete_user_cascades_in_the_database(client, db):
+    headers = await get_token(client)
+    response = await client.delete(f"/users/{seed_user['id']}", headers=headers)
+    assert response.status_code == 200
+
+    async with db.bind.connect() as connection:
+        for table in (Music.__table__, Playlist.__table__, playlist_music_association):
+            rows = await connection.scalar(select(func.count()).select_from(table))
+            assert rows == 0, table.name
+    search = await client.get("/music/search", params={"q": "orang pater"})
+    assert search.json() == []
+
+
+async def test_delete_user_updates_other_playlists_track_count(client):
+    await client.post(
+        "/users",
+        json={
+            "username": "other_user",
+            "email": "other_user@email.com",
+            "password": "password123",
+        },
+    )
+    login = await client.post(
+        "/users/login",
+        json={"email": "other_user@email.com", "password": "password123"},
+    )
+    other_headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+    created = await client.post(
+        "/playlist", json={"name": "Borrowed", "private": False}, headers=other_headers
+    )
+    playlist_id = created.json()["id"]
+    await client.post(
+        f"/playlist/{playlist_id}/add-musics",
+        json={"music_ids": [1, 2]},
+        headers=other_headers,
+    )
+
+    headers = await get_token(client)
+    await client.delete(f"/users/{seed_user['id']}", headers=headers)
+
+    listing = await client.get(f"/playlist/from-user/{created.json()['owner_id']}")
+    assert listing.json()[0]["track_count"] == 0